@@ -8,7 +8,11 @@ def run(nf: Any, taxes: Dict[str, Any]) -> Dict[str, Any]:
     # Passar total_produtos correto (com desconto)
     total_produtos = getattr(nf, "total_produtos", None)
     if not total_produtos:
-        total_produtos = sum(getattr(item, "valor_total", 0) for item in getattr(nf, "itens", []))
+        itens = getattr(nf, "itens", [])
+        if hasattr(itens, "total"):
+            total_produtos = itens.total("valor_total")  # ItemTable (colunar)
+        else:
+            total_produtos = sum(getattr(item, "valor_total", 0) for item in itens)
     
     return {
         "nf": getattr(nf, "dict", lambda: nf)(),
@@ -0,0 +1,169 @@
+# validador_fiscal/agents/portfolio_agent.py
+"""
+Relatório de CARTEIRA (várias notas lidas de um mesmo arquivo)
+- Um resultado compacto por nota (calculado x declarado, risco)
+- Resumo da carteira no mesmo formato do relatório de nota única
+  (resumo_executivo / totais_por_imposto), para o frontend reaproveitar
+"""
+
+from typing import Any, Dict, List, Optional
+import os
+import time
+
+from ..agents.supervisor_final_agent import _calcular_nivel_risco, _gerar_analise_conformidade
+from ..core.qualidade_itens import combinar_perfis
+
+IMPOSTOS_RELATORIO = ["ICMS", "IPI", "PIS", "COFINS", "ISS", "IRPJ", "CSLL"]
+MAX_DIVERGENCIAS = 50  # notas listadas em "divergencias"
+# linhas de "divergencias_itens" da carteira (cada nota já vem limitada pelo motor)
+MAX_DIVERGENCIAS_ITENS = int(os.getenv("LIMITE_DIVERGENCIAS_ITEM", "1000"))
+
+
+def _resultado_nota(nf, taxes: Dict[str, Any]) -> Dict[str, Any]:
+    """Mesmas contas do Supervisor Final, sem Excel nem itens (divergências por item, se houver)."""
+    itens = getattr(nf, "itens", []) or []
+    calculados = taxes.get("calculados", {}) or {}
+    declarados_obj = getattr(nf, "declarados", None)
+
+    declarados = {
+        imp.lower(): float(getattr(declarados_obj, imp.lower(), 0.0) or 0.0) if declarados_obj else 0.0
+        for imp in IMPOSTOS_RELATORIO
+    }
+    total_calculado = sum(v for v in calculados.values() if isinstance(v, (int, float)))
+    total_declarado = sum(declarados.values())
+    divergencia = total_calculado - total_declarado
+    pct = (divergencia / total_declarado * 100) if total_declarado > 0 else 0
+
+    if "total_produtos" in taxes:  # itens numa tabela única do lote (ingestão em massa)
+        total_produtos = taxes["total_produtos"]
+    elif hasattr(itens, "total"):
+        total_produtos = itens.total("valor_total")
+    else:
+        total_produtos = sum(getattr(item, "valor_total", 0) for item in itens)
+
+    return {
+        "chave": getattr(nf, "chave", None),
+        "numero": getattr(nf, "numero", None),
+        "serie": getattr(nf, "serie", None),
+        "data_emissao": getattr(nf, "data_emissao", None),
+        "emitente_cnpj": getattr(nf, "emitente_cnpj", None),
+        "emissor_uf": getattr(nf, "emissor_uf", None),
+        "destinatario_uf": getattr(nf, "destinatario_uf", None),
+        "total_itens": taxes.get("total_itens", len(itens)),
+        "total_produtos": round(float(total_produtos), 2),
+        "calculados": {k: round(float(v), 2) for k, v in calculados.items()},
+        "declarados": {k: round(v, 2) for k, v in declarados.items()},
+        "total_calculado": round(total_calculado, 2),
+        "total_declarado": round(total_declarado, 2),
+        "divergencia_absoluta": round(divergencia, 2),
+        "divergencia_percentual": round(pct, 2),
+        "nivel_risco": _calcular_nivel_risco(divergencia, pct, total_declarado),
+        # XML: calculado × declarado em cada det (motor limita a LIMITE_DIVERGENCIAS_ITEM por nota)
+        "divergencias_itens": taxes.get("linhas", []) or [],
+    }
+
+
+def run(notas: List[Any], taxes_por_nota: List[Dict[str, Any]],
+        reaproveitados: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Monta o relatório da carteira.
+
+    Args:
+        notas: NotaFiscal de cada chave (ordem do arquivo)
+        taxes_por_nota: saída do Motor Fiscal em lote (mesma ordem)
+        reaproveitados: resultados por nota já prontos (índice de validados), depois das calculadas
+
+    Returns:
+        Dict com "notas" (uma entrada por chave) + resumo da carteira
+    """
+    reaproveitados = reaproveitados or []
+    print(f"📊 Carteira: consolidando {len(notas) + len(reaproveitados):,} notas...")
+
+    resultados = [_resultado_nota(nf, tx) for nf, tx in zip(notas, taxes_por_nota)] + reaproveitados
+
+    # Totais da carteira por imposto
+    calculados: Dict[str, float] = {}
+    declarados: Dict[str, float] = {}
+    for r in resultados:
+        for k, v in r["calculados"].items():
+            calculados[k] = calculados.get(k, 0.0) + v
+        for k, v in r["declarados"].items():
+            declarados[k] = declarados.get(k, 0.0) + v
+
+    totais_por_imposto = {}
+    for imposto in IMPOSTOS_RELATORIO:
+        calc = calculados.get(imposto.lower(), 0.0)
+        decl = declarados.get(imposto.lower(), 0.0)
+        if calc > 0 or decl > 0:
+            totais_por_imposto[imposto] = {
+                "calculado": round(calc, 2),
+                "declarado": round(decl, 2),
+                "diferenca": round(calc - decl, 2),
+                "diferenca_pct": round(((calc - decl) / decl * 100) if decl > 0 else 0, 2),
+            }
+
+    total_calculado = sum(calculados.values())
+    total_declarado = sum(declarados.values())
+    divergencia = total_calculado - total_declarado
+    pct = (divergencia / total_declarado * 100) if total_declarado > 0 else 0
+
+    notas_por_risco: Dict[str, int] = {}
+    for r in resultados:
+        notas_por_risco[r["nivel_risco"]] = notas_por_risco.get(r["nivel_risco"], 0) + 1
+
+    resumo_executivo = {
+        "total_notas": len(resultados),
+        "total_itens": sum(r["total_itens"] for r in resultados),
+        "total_calculado": round(total_calculado, 2),
+        "total_declarado": round(total_declarado, 2),
+        "divergencia_absoluta": round(divergencia, 2),
+        "divergencia_percentual": round(pct, 2),
+        "nivel_risco": _calcular_nivel_risco(divergencia, pct, total_declarado),
+        "notas_por_risco": notas_por_risco,
+    }
+
+    # Notas com maior divergência (para alertas e para o Excel)
+    maiores = sorted(resultados, key=lambda r: abs(r["divergencia_absoluta"]), reverse=True)[:MAX_DIVERGENCIAS]
+    divergencias = [
+        {"imposto": f"NF {r['numero'] or r['chave']}", "diferenca": r["divergencia_absoluta"],
+         "chave": r["chave"], "nivel_risco": r["nivel_risco"]}
+        for r in maiores if abs(r["divergencia_absoluta"]) >= 0.01
+    ]
+
+    # Divergências item a item da carteira: maiores diferenças primeiro, com a nota de cada linha
+    divergencias_itens = sorted(
+        ({"chave": r["chave"], "numero": r["numero"], **linha}
+         for r in resultados for linha in r.get("divergencias_itens") or []),
+        key=lambda l: abs(l.get("diferenca", 0.0)), reverse=True,
+    )[:MAX_DIVERGENCIAS_ITENS]
+
+    # Perfil de qualidade: um por arquivo de itens (as notas do mesmo arquivo compartilham o dict)
+    perfis = {id(q): q for q in (getattr(nf, "qualidade", None) for nf in notas) if q}
+
+    print(f"   Notas: {resumo_executivo['total_notas']:,} | Itens: {resumo_executivo['total_itens']:,}")
+    print(f"   Risco por nota: {notas_por_risco}")
+
+    return {
+        "lote": True,
+        "metadata": {
+            "chave": "LOTE",
+            "numero": "LOTE",
+            "total_notas": len(resultados),
+            "data_validacao": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "resumo_executivo": resumo_executivo,
+        "totais_por_imposto": totais_por_imposto,
+        "analise_conformidade": _gerar_analise_conformidade(
+            resumo_executivo["nivel_risco"], divergencias, totais_por_imposto
+        ),
+        "divergencias": divergencias,
+        "divergencias_itens": divergencias_itens,
+        "qualidade_itens": combinar_perfis(perfis.values()) if perfis else None,
+        "notas": resultados,
+        "itens": [],
+        "linhas": [],
+        "calculados": {k: round(v, 2) for k, v in calculados.items()},
+        "declarados": {k: round(v, 2) for k, v in declarados.items()},
+        "fonte_unica": False,
+        "campos_nf": None,
+    }
@@ -1,9 +1,53 @@
-from typing import Optional
-fromtools.nf_parse_tool import parse_any, NotaFiscal
+from typing import Callable, Iterator, List, Optional, Tuple
+fromtools.nf_parse_tool import parse_any, parse_csv_lote, parse_csv_streaming, precisa_out_of_core, NotaFiscal
+fromtools.ingestao_lote import ingerir_notas
+fromtools.ingestao_incremental import parse_csv_incremental
+fromtools.ingestao_xml import ingerir_xmls
 
 def run(nf_csv_file: Optional[str] = None,
         xml_file: Optional[str] = None,
         pdf_file: Optional[str] = None,
-        image_file: Optional[str] = None) -> NotaFiscal:
+        image_file: Optional[str] = None,
+        progresso: Optional[Callable[[int, int, int], None]] = None) -> NotaFiscal:
     """Leitura unificada, usada como AGENTE de entrada."""
-    return parse_any(nf_csv_file=nf_csv_file, xml_file=xml_file, pdf_file=pdf_file, image_file=image_file)
+    return parse_any(nf_csv_file=nf_csv_file, xml_file=xml_file, pdf_file=pdf_file, image_file=image_file,
+                     progresso=progresso)
+
+
+def run_lote(nf_csv_file,
+             progresso: Optional[Callable[[int, int, int], None]] = None) -> List[NotaFiscal]:
+    """Leitura de CSVs com várias notas (uma NotaFiscal por chave), numa única passada."""
+    return parse_csv_lote(nf_csv_file, progresso=progresso)
+
+
+def run_pares(fontes,
+              workers: Optional[int] = None,
+              ao_concluir: Optional[Callable] = None) -> List[NotaFiscal]:
+    """Vários pares cabeçalho + itens (pastas/arquivos), pareados por chave e lidos em processos paralelos."""
+    return ingerir_notas(fontes, workers=workers, ao_concluir=ao_concluir)
+
+
+def run_xmls(fontes,
+             workers: Optional[int] = None,
+             ao_concluir: Optional[Callable[[int, int], None]] = None,
+             indice=None,
+             versao_matriz: str = ""):
+    """Muitas NF-e XML (pastas/zips) lidas em processos paralelos: notas + tabela única de itens (ver ingerir_xmls)."""
+    return ingerir_xmls(fontes, workers=workers, ao_concluir=ao_concluir, indice=indice, versao_matriz=versao_matriz)
+
+
+def run_streaming(nf_csv_file,
+                  progresso: Optional[Callable[[int, int, int], None]] = None) -> Tuple[NotaFiscal, Iterator]:
+    """Leitura OUT-OF-CORE: cabeçalho + gerador de chunks de itens (ver parse_csv_streaming)."""
+    return parse_csv_streaming(nf_csv_file, progresso=progresso)
+
+
+def run_incremental(nf_csv_file,
+                    progresso: Optional[Callable[[int, int, int], None]] = None):
+    """Leitura INCREMENTAL: cabeçalho + chunks só das linhas novas do CSV de itens + estado (ver parse_csv_incremental)."""
+    return parse_csv_incremental(nf_csv_file, progresso=progresso)
+
+
+def precisa_streaming(nf_csv_file) -> bool:
+    """True se o CSV de itens não cabe no orçamento de memória do pipeline."""
+    return precisa_out_of_core(nf_csv_file)
@@ -10,12 +10,43 @@ Supervisor Agent OTIMIZADO para ARQUIVOS GRANDES
 from typing import Optional, Dict, Any
 import json, time, os
 
-fromagents.reader_agent import run as reader_run
+fromagents.reader_agent import run as reader_run, run_lote as reader_run_lote, \
+    run_pares as reader_run_pares, run_streaming as reader_run_streaming, precisa_streaming, \
+    run_incremental as reader_run_incremental, run_xmls as reader_run_xmls
 fromagents.normalizer_agent import run as normalizer_run
-fromagents.tax_engine_agent import run as tax_engine_run
+fromagents.tax_engine_agent import run as tax_engine_run, run_lote as tax_engine_run_lote, \
+    run_streaming as tax_engine_run_streaming
 fromagents.consolidator_agent import run as consolidator_run
 fromagents.divergences_agent import run as divergences_run
 fromagents.supervisor_final_agent import run as supervisor_final_run
+fromagents.portfolio_agent import run as portfolio_run
+fromcore.item_table import ItemTable
+fromcore.qualidade_itens import perfil_qualidade
+fromtools.ingestao_incremental import concluir as concluir_incremental
+fromtools.indice_validados import INDICE_VALIDADOS, IndiceValidados, versao_matriz, documento_avulso
+
+# Pipeline OUT-OF-CORE para CSV de itens maior que o orçamento de memória
+# auto = decide pelo tamanho do arquivo | 1 = sempre | 0 = nunca
+PIPELINE_OUT_OF_CORE = os.getenv("PIPELINE_OUT_OF_CORE", "auto").strip().lower()
+
+
+def _usar_out_of_core(docs: Dict[str, Any]) -> bool:
+    nf_csv_file = docs.get("nf_csv_file")
+    if not nf_csv_file or PIPELINE_OUT_OF_CORE in ("0", "false", "nao", "não"):
+        return False
+    if PIPELINE_OUT_OF_CORE in ("1", "true", "sim"):
+        return True
+    return precisa_streaming(nf_csv_file)
+
+
+# Ingestão INCREMENTAL do CSV de itens (só as linhas acrescentadas desde a última execução)
+PIPELINE_INCREMENTAL = os.getenv("PIPELINE_INCREMENTAL", "0").strip().lower() in ("1", "true", "sim")
+
+
+def _usar_incremental(docs: Dict[str, Any]) -> bool:
+    if not docs.get("nf_csv_file"):
+        return False
+    return bool(docs.get("incremental", PIPELINE_INCREMENTAL))
 
 
 def _emit_agent(agente: str, status: str, progress_path: Optional[str], pct: Optional[int] = None, extra: str = ""):
@@ -53,6 +84,42 @@ def _emit_agent(agente: str, status: str, progress_path: Optional[str], pct: Opt
     print(f"[{ev['timestamp']}] {agente}: {status} {f'({pct}%)' if pct else ''} {extra}")
 
 
+def _progresso_leitura(progress_path: Optional[str]):
+    """
+    Callback de leitura em streaming → eventos do Leitor no JSONL.
+    Emite no máximo 1 evento a cada 5% (offset em bytes do arquivo).
+    """
+    estado = {"ultimo": -1}
+
+    def _cb(bytes_lidos: int, bytes_total: int, linhas: int):
+        pct = int(bytes_lidos * 100 / bytes_total) if bytes_total else 100
+        if pct <= estado["ultimo"] or (pct < 100 and pct - estado["ultimo"] < 5):
+            return
+        estado["ultimo"] = pct
+        _emit_agent("Leitor", "run", progress_path, pct=max(5, pct),
+                    extra=f"{linhas:,} linhas | {bytes_lidos / 1e6:,.1f}/{bytes_total / 1e6:,.1f} MB")
+
+    return _cb
+
+
+def _progresso_pares(progress_path: Optional[str]):
+    """Callback da ingestão em lote (um evento do Leitor por par concluído)."""
+    def _cb(resultado, feitos: int, total: int):
+        _emit_agent("Leitor", "run", progress_path, pct=max(5, int(feitos * 100 / total)) if total else 100,
+                    extra=f"{feitos:,}/{total:,} pares | {len(resultado.notas):,} notas")
+
+    return _cb
+
+
+def _progresso_xmls(progress_path: Optional[str]):
+    """Callback da ingestão de XMLs em massa (um evento do Leitor por bloco concluído)."""
+    def _cb(lidos: int, total: int):
+        _emit_agent("Leitor", "run", progress_path, pct=max(5, int(lidos * 100 / total)) if total else 100,
+                    extra=f"{lidos:,}/{total:,} XMLs")
+
+    return _cb
+
+
 def run_pipeline(
     docs: Dict[str, Any],
     usar_cbs_oficial: bool = True,
@@ -83,10 +150,48 @@ def run_pipeline(
         _emit_agent("Leitor", "start", progress_path, extra="Carregando arquivos...")
         _emit_agent("Leitor", "run", progress_path, pct=5)
         
-        nf = reader_run(**docs)
-        total_itens = len(getattr(nf, 'itens', []) or [])
-        
-        _emit_agent("Leitor", "ok", progress_path, pct=100, extra=f"✅ {total_itens:,} itens carregados")
+        # XML avulso já validado com a mesma matriz: relatório guardado, sem parse nem cálculo
+        avulso = None
+        if docs.get("xml_file") and not docs.get("nf_csv_file") and docs.get("indice", INDICE_VALIDADOS):
+            avulso = documento_avulso(docs["xml_file"], usar_cbs_oficial)
+        if avulso:
+            with IndiceValidados() as indice:
+                guardado = indice.procurar(*avulso)
+            if guardado:
+                relatorio = dict(guardado[0], indice_validados={"reaproveitado": True})
+                _emit_agent("Leitor", "ok", progress_path, pct=100, extra="♻️ XML já validado com esta matriz")
+
+                os.makedirs("data/reports", exist_ok=True)
+                rel_path = os.path.join("data/reports", f"relatorio_{int(time.time())}.json")
+                with open(rel_path, "w", encoding="utf-8") as f:
+                    json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+                _emit_agent("Supervisor", "ok", progress_path, pct=100,
+                            extra=f"🎉 Relatório reaproveitado em {time.time() - inicio_total:.1f}s")
+                print(f"♻️ XML já validado: relatório reaproveitado em {rel_path}")
+                return rel_path
+
+        incremental = None
+        out_of_core = _usar_out_of_core(docs)
+        usar_incremental = _usar_incremental(docs)
+        docs = {k: v for k, v in docs.items() if k not in ("incremental", "indice")}
+        if usar_incremental:
+            # Só as linhas novas do CSV de itens, em chunks; somadas aos totais da última execução
+            nf, partes, incremental = reader_run_incremental(docs["nf_csv_file"],
+                                                             progresso=_progresso_leitura(progress_path))
+            out_of_core = True
+            total_itens = 0
+            _emit_agent("Leitor", "ok", progress_path, pct=100,
+                        extra=f"✅ Cabeçalho carregado ({incremental.bytes_novos / 1e6:,.1f} MB novos de itens)")
+        elif out_of_core:
+            # Só o cabeçalho agora; os itens são lidos chunk a chunk pelo Motor Fiscal
+            nf, partes = reader_run_streaming(docs["nf_csv_file"], progresso=_progresso_leitura(progress_path))
+            total_itens = 0
+            _emit_agent("Leitor", "ok", progress_path, pct=100, extra="✅ Cabeçalho carregado (itens em streaming)")
+        else:
+            nf = reader_run(**docs, progresso=_progresso_leitura(progress_path))
+            total_itens = len(getattr(nf, 'itens', []) or [])
+            _emit_agent("Leitor", "ok", progress_path, pct=100, extra=f"✅ {total_itens:,} itens carregados")
         
         # ===== 2. NORMALIZADOR =====
         _emit_agent("Matriz", "start", progress_path)
@@ -103,7 +208,20 @@ def run_pipeline(
         # Aqui pode demorar com 549 mil linhas
         # O tax_engine_agent vai emitir progresso interno
         inicio_tax = time.time()
-        taxes = tax_engine_run(nf, usar_cbs_oficial=usar_cbs_oficial)
+        if out_of_core:
+            taxes = tax_engine_run_streaming(nf, partes, usar_cbs_oficial=usar_cbs_oficial,
+                                             base=incremental.base if incremental else None)
+            st = taxes["streaming"]
+            if incremental:
+                concluir_incremental(incremental, st)
+            total_itens = st["total_itens"]
+            # Relatório guarda só a amostra; totais vêm da redução dos chunks
+            nf.itens = ItemTable.concat(st.pop("amostra"))
+            nf.total_produtos = st["total_produtos"]
+            if st["contadores"].get("linhas"):
+                nf.qualidade = perfil_qualidade(st["contadores"])
+        else:
+            taxes = tax_engine_run(nf, usar_cbs_oficial=usar_cbs_oficial)
         tempo_tax = time.time() - inicio_tax
         
         _emit_agent("Legados", "ok", progress_path, pct=100, 
@@ -121,6 +239,8 @@ def run_pipeline(
         _emit_agent("Consolidador", "run", progress_path, pct=80)
         
         resultado = consolidator_run(nf, taxes)
+        if out_of_core:
+            resultado["total_itens"] = total_itens
         
         # PASSAR ANÁLISE DA IA PARA O RELATÓRIO FINAL
         if 'analise_ia' in taxes:
@@ -143,6 +263,19 @@ def run_pipeline(
         _emit_agent("Supervisor", "run", progress_path, pct=95)
         
         relatorio = supervisor_final_run(nf, taxes, resultado, divergencias)
+        if out_of_core:
+            relatorio["out_of_core"] = taxes["streaming"]
+        if incremental:
+            relatorio["incremental"] = {
+                "recalculado_do_zero": bool(incremental.motivo),
+                "motivo": incremental.motivo,
+                "bytes_novos": incremental.bytes_novos,
+                "offset": incremental.marca.offset,
+            }
+        
+        if avulso:
+            with IndiceValidados() as indice:
+                indice.registrar([(avulso[0], avulso[1], relatorio.get("chave") or "", relatorio)])
         
         _emit_agent("Supervisor", "ok", progress_path, pct=100)
         
@@ -193,4 +326,127 @@ def run_pipeline(
         with open(erro_path, "w", encoding="utf-8") as f:
             json.dump(rel_erro, f, ensure_ascii=False, indent=2)
         
-        return erro_path
\ No newline at end of file
+        return erro_path
+
+
+def run_pipeline_lote(
+    docs: Dict[str, Any],
+    progress_path: Optional[str] = None,
+) -> str:
+    """
+    Pipeline de CARTEIRA: CSVs com várias notas (uma por CHAVE DE ACESSO)
+    - Leitura única do cabeçalho e dos itens, separados por chave
+    - Um cálculo vetorizado para todas as notas
+    - Relatório com resultado por nota + resumo da carteira
+
+    Args:
+        docs: Dict com "nf_csv_file" (lista [cabeçalho, itens] ou CSV de cabeçalho),
+              "fontes" (pastas/arquivos com vários pares, lidos em paralelo)
+              ou "xmls" (pastas/zips de NF-e XML, lidos em paralelo)
+        progress_path: Arquivo JSONL para eventos
+
+    Returns:
+        Caminho do relatório JSON gerado
+    """
+    inicio_total = time.time()
+    indice = None
+
+    try:
+        # ===== 1. LEITOR =====
+        _emit_agent("Leitor", "start", progress_path, extra="Carregando lote...")
+        _emit_agent("Leitor", "run", progress_path, pct=5)
+
+        tabela = lote_xml = None
+        if docs.get("xmls"):
+            # XMLs já validados com a mesma matriz saem do índice, sem parse nem cálculo
+            if docs.get("indice", INDICE_VALIDADOS):
+                indice, versao = IndiceValidados(), versao_matriz()
+            # itens de todas as notas numa tabela única, ligada às notas pela chave
+            lote_xml = reader_run_xmls(docs["xmls"], ao_concluir=_progresso_xmls(progress_path),
+                                       indice=indice, versao_matriz=versao if indice else "")
+            notas, tabela = lote_xml.notas, lote_xml.itens
+            total_itens = len(tabela)
+        elif docs.get("fontes"):
+            notas = reader_run_pares(docs["fontes"], ao_concluir=_progresso_pares(progress_path))
+        else:
+            notas = reader_run_lote(docs.get("nf_csv_file"), progresso=_progresso_leitura(progress_path))
+        if tabela is None:
+            total_itens = sum(len(getattr(nf, "itens", []) or []) for nf in notas)
+
+        _emit_agent("Leitor", "ok", progress_path, pct=100,
+                    extra=f"✅ {len(notas):,} notas | {total_itens:,} itens")
+
+        # ===== 2. MOTOR FISCAL (LEGADOS) =====
+        _emit_agent("Legados", "start", progress_path, extra=f"Calculando {len(notas):,} notas...")
+        _emit_agent("Legados", "run", progress_path, pct=20)
+
+        inicio_tax = time.time()
+        taxes_por_nota = tax_engine_run_lote(notas, tabela=tabela)
+        tempo_tax = time.time() - inicio_tax
+
+        _emit_agent("Legados", "ok", progress_path, pct=100, extra=f"✅ {len(notas):,} notas em {tempo_tax:.1f}s")
+
+        # ===== 3. CARTEIRA (consolidação + divergências por nota) =====
+        _emit_agent("Consolidador", "start", progress_path)
+        _emit_agent("Consolidador", "run", progress_path, pct=80)
+
+        reaproveitados = lote_xml.reaproveitados if lote_xml else []
+        relatorio = portfolio_run(notas, taxes_por_nota, reaproveitados=reaproveitados)
+        if indice is not None:
+            novos = relatorio["notas"][:len(notas)]
+            gravados = indice.registrar(
+                (lote_xml.hash_por_chave[r["chave"]], versao, r["chave"], r)
+                for r in novos if r["chave"] in lote_xml.hash_por_chave
+            )
+            relatorio["indice_validados"] = {"reaproveitadas": len(reaproveitados), "registradas": gravados}
+
+        _emit_agent("Consolidador", "ok", progress_path, pct=100,
+                    extra=f"Risco por nota: {relatorio['resumo_executivo']['notas_por_risco']}")
+
+        # ===== 4. SUPERVISOR FINAL (Excel + JSON) =====
+        _emit_agent("Supervisor", "start", progress_path, extra="Gerando relatório da carteira...")
+        try:
+            fromtools.report_generator import gerar_relatorio_excel
+            relatorio["excel_path"] = gerar_relatorio_excel(relatorio)
+        except Exception as e:
+            print(f"⚠️ Erro ao gerar Excel: {e}")
+            relatorio["excel_path"] = None
+
+        os.makedirs("data/reports", exist_ok=True)
+        rel_path = os.path.join("data/reports", f"relatorio_lote_{int(time.time())}.json")
+        with open(rel_path, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+        tempo_total = time.time() - inicio_total
+        _emit_agent("Supervisor", "ok", progress_path, pct=100,
+                    extra=f"🎉 {len(notas):,} notas em {tempo_total:.1f}s ({total_itens:,} itens)")
+
+        print(f"\n{'='*60}")
+        print(f"✅ LOTE CONCLUÍDO!")
+        print(f"{'='*60}")
+        print(f"🧾 Notas: {len(notas):,}")
+        print(f"📊 Itens processados: {total_itens:,}")
+        print(f"⏱️  Tempo total: {tempo_total:.1f}s")
+        print(f"📄 Relatório: {rel_path}")
+        print(f"{'='*60}\n")
+
+        return rel_path
+
+    except Exception as e:
+        import traceback
+        erro_msg = f"Erro: {str(e)}"
+        _emit_agent("Supervisor", "error", progress_path, extra=erro_msg)
+        print(f"\n❌ ERRO NO LOTE:")
+        print(f"{erro_msg}")
+        traceback.print_exc()
+
+        rel_erro = {"erro": erro_msg, "traceback": traceback.format_exc(), "timestamp": time.time()}
+        os.makedirs("data/reports", exist_ok=True)
+        erro_path = os.path.join("data/reports", f"erro_{int(time.time())}.json")
+        with open(erro_path, "w", encoding="utf-8") as f:
+            json.dump(rel_erro, f, ensure_ascii=False, indent=2)
+        return erro_path
+    finally:
+        # filtro de Bloom gravado e conexão fechada também quando o lote falha
+        if indice is not None:
+            indice.fechar()
@@ -63,7 +63,7 @@ def run(nf, taxes: Dict[str, Any], resultado: Dict[str, Any], divergencias: List
     
     # 4. RESUMO EXECUTIVO
     resumo_executivo = {
-        "total_itens": len(getattr(nf, "itens", []) or []),
+        "total_itens": resultado.get("total_itens") or len(getattr(nf, "itens", []) or []),
         "total_calculado": round(total_calculado, 2),
         "total_declarado": round(total_declarado, 2),
         "divergencia_absoluta": round(divergencia_total, 2),
@@ -125,9 +125,12 @@ def run(nf, taxes: Dict[str, Any], resultado: Dict[str, Any], divergencias: List
         "itens": itens_detalhados,  # Apenas amostra
         "analise_conformidade": analise,
         "divergencias": divergencias or [],
+        # XML: calculado × declarado em cada det (motor limita a LIMITE_DIVERGENCIAS_ITEM)
+        "divergencias_itens": linhas,
         "campos_nf": campos_nf, 
         "fonte_unica": fonte_unica, 
         "etapas": resultado.get("etapas", []) or taxes.get("etapas", []),
+        "qualidade_itens": getattr(nf, "qualidade", None),
 
          # ADICIONAR CAMPOS DIRETOS (para compatibilidade com frontend)
         "chave": getattr(nf, "chave", None),
@@ -139,18 +142,7 @@ def run(nf, taxes: Dict[str, Any], resultado: Dict[str, Any], divergencias: List
         "destinatario_cpf": getattr(nf, "destinatario_cpf", None),
         
         # ADICIONAR ITENS E DECLARADOS
-        "itens": [
-            {
-                "codigo": getattr(item, "codigo", ""),
-                "descricao": getattr(item, "descricao", ""),
-                "ncm": getattr(item, "ncm", ""),
-                "cfop": getattr(item, "cfop", ""),
-                "quantidade": getattr(item, "quantidade", 0),
-                "valor_unitario": getattr(item, "valor_unitario", 0),
-                "valor_total": getattr(item, "valor_total", 0)
-            }
-            for item in (getattr(nf, "itens", []) or [])
-        ],
+        "itens": _itens_para_dicts(getattr(nf, "itens", []) or []),
         
         "declarados": {
             "icms": getattr(getattr(nf, "declarados", None), "icms", 0) or 0,
@@ -185,6 +177,25 @@ def run(nf, taxes: Dict[str, Any], resultado: Dict[str, Any], divergencias: List
     return relatorio
 
 
+def _itens_para_dicts(itens) -> List[Dict]:
+    """Itens do relatório; ItemTable sai direto das colunas (sem criar objetos Item)"""
+    campos = ["codigo", "descricao", "ncm", "cfop", "quantidade", "valor_unitario", "valor_total"]
+    if hasattr(itens, "to_dicts"):
+        return itens.to_dicts(campos)
+    return [
+        {
+            "codigo": getattr(item, "codigo", ""),
+            "descricao": getattr(item, "descricao", ""),
+            "ncm": getattr(item, "ncm", ""),
+            "cfop": getattr(item, "cfop", ""),
+            "quantidade": getattr(item, "quantidade", 0),
+            "valor_unitario": getattr(item, "valor_unitario", 0),
+            "valor_total": getattr(item, "valor_total", 0)
+        }
+        for item in itens
+    ]
+
+
 def _calcular_nivel_risco(divergencia_abs: float, divergencia_pct: float, total_declarado: float = 0) -> str:
     """
     Calcula nível de risco
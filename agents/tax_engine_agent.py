@@ -2,18 +2,26 @@
 """
 Motor Fiscal - CSV usa código vetorizado, XML usa IA
 """
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 import os
 
+import numpy as np
+
 try:
     fromcore.models import NotaFiscal as NotaFiscalPydantic
     USE_PYDANTIC = True
 except:
     USE_PYDANTIC = False
 
-fromtaxes.legacy_engine import calcular_legados_item_a_item
+fromtaxes.legacy_engine import (
+    calcular_legados_item_a_item, calcular_legados_lote_item_a_item,
+    calcular_parciais, somar_parciais, finalizar_parciais, indice_por_chave,
+)
 fromtaxes.matriz_loader import load_matriz
 
+# Itens guardados para o relatório no modo out-of-core (o resto é só somado)
+AMOSTRA_ITENS = int(os.getenv("PIPELINE_AMOSTRA_ITENS", "1000"))
+
 # Importar IA
 try:
     fromagents import fiscal_ai_agent
@@ -83,4 +91,90 @@ def run(nf, usar_cbs_oficial: bool = True) -> Dict[str, Any]:
             "legados": f"{len(itens)} itens processados",
             "cbs": "CBS/IBS desabilitado" if not usar_cbs_oficial else "N/A"
         }
-    }
\ No newline at end of file
+    }
+
+
+def run_lote(notas: List[Any], tabela: Optional[Any] = None) -> List[Dict[str, Any]]:
+    """
+    Várias notas de um mesmo arquivo: UM cálculo vetorizado para todas
+    (sem IA por nota). Retorna um "taxes" por nota, na ordem de `notas`, com as
+    divergências item a item da nota em "linhas" (XML com imposto declarado por det).
+    tabela: itens de todas as notas numa só ItemTable (coluna "chave"), no lugar de nf.itens;
+            cada "taxes" traz então total_itens / total_produtos da nota.
+    """
+    print(f"   📊 Lote ({len(notas):,} notas) → Sistema vetorizado...")
+    matriz = load_matriz()
+    zerados = {"icms": 0, "st": 0, "difal": 0, "ipi": 0, "pis": 0, "cofins": 0, "iss": 0, "irpj": 0, "csll": 0}
+    linhas_por_nota, totais_por_nota = calcular_legados_lote_item_a_item(notas, matriz, tabela=tabela)
+    resultados = [
+        {
+            "calculados": totais or dict(zerados),
+            "linhas": linhas,
+            "etapas": {"legados": f"{len(getattr(nf, 'itens', []) or []):,} itens (lote)", "cbs": "N/A"},
+        }
+        for nf, linhas, totais in zip(notas, linhas_por_nota, totais_por_nota)
+    ]
+    if tabela is not None:
+        nota = indice_por_chave(notas, tabela)
+        ok = nota >= 0
+        qtd = np.bincount(nota[ok], minlength=len(notas))
+        soma = np.bincount(nota[ok], weights=tabela.coluna("valor_total").to_numpy()[ok], minlength=len(notas))
+        for r, n, v in zip(resultados, qtd, soma):
+            r["total_itens"] = int(n)
+            r["total_produtos"] = float(v)
+            r["etapas"]["legados"] = f"{int(n):,} itens (lote)"
+    return resultados
+
+
+def run_streaming(nf, partes: Iterable[Tuple[Any, Dict[str, int]]],
+                  usar_cbs_oficial: bool = True,
+                  base: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    OUT-OF-CORE: calcula chunk a chunk e reduz em totais (chunk liberado em seguida).
+    Mesmo formato de run() + "streaming": itens, total dos produtos, contadores, amostra
+    e os parciais acumulados.
+    base: "streaming" de uma execução anterior (parciais/totais/contadores) em que
+          os chunks novos são somados (ingestão incremental).
+    """
+    matriz = load_matriz()
+    base = base or {}
+    acum: Dict[str, Any] = dict(base.get("parciais") or {})
+    contadores: Dict[str, int] = dict(base.get("contadores") or {})
+    total_itens = int(base.get("total_itens", 0))
+    total_produtos = float(base.get("total_produtos", 0.0))
+    amostra = []
+    n_amostra = 0
+    chunks = 0
+
+    for tabela, cont in partes:
+        chunks += 1
+        acum = somar_parciais(acum, calcular_parciais(nf, tabela, matriz))
+        total_itens += len(tabela)
+        total_produtos += tabela.total("valor_total")
+        for k, v in cont.items():
+            contadores[k] = contadores.get(k, 0) + v
+        if n_amostra < AMOSTRA_ITENS and len(tabela):
+            amostra.append(tabela.filtrar(np.arange(len(tabela)) < AMOSTRA_ITENS - n_amostra))
+            n_amostra += len(amostra[-1])
+        del tabela
+        print(f"   ⚙️  Chunk {chunks}: {total_itens:,} itens calculados")
+
+    totais = finalizar_parciais(acum) or {
+        "icms": 0, "st": 0, "difal": 0, "ipi": 0, "pis": 0, "cofins": 0, "iss": 0, "irpj": 0, "csll": 0
+    }
+    return {
+        "calculados": totais,
+        "linhas": [],
+        "etapas": {
+            "legados": f"{total_itens:,} itens processados em {chunks} chunks (out-of-core)",
+            "cbs": "CBS/IBS desabilitado" if not usar_cbs_oficial else "N/A"
+        },
+        "streaming": {
+            "chunks": chunks,
+            "total_itens": total_itens,
+            "total_produtos": total_produtos,
+            "contadores": contadores,
+            "amostra": amostra,
+            "parciais": acum,
+        },
+    }
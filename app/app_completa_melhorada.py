@@ -78,7 +78,7 @@ import plotly.express as px
 import plotly.graph_objects as go
 
 # Core
-fromagents.supervisor_agent import run_pipeline
+fromagents.supervisor_agent import run_pipeline, run_pipeline_lote
 
 # Memory + RAG + News
 frommemory.store import (
@@ -480,6 +480,23 @@ def _exibir_nf_detalhada(campos: Dict):
                 st.markdown(f"**Status:** {dados['status']}")
 
 
+def _exibir_notas_lote(relatorio: dict):
+    """Tabela de notas do relatório de carteira (modo lote)"""
+    resumo = relatorio.get("resumo_executivo", {})
+    st.markdown(f"### 🧾 Notas do Lote ({resumo.get('total_notas', 0):,})")
+    por_risco = resumo.get("notas_por_risco", {})
+    if por_risco:
+        st.caption(" | ".join(f"{k}: {v:,}" for k, v in por_risco.items()))
+    df_notas = pd.DataFrame(relatorio["notas"])
+    colunas = ["chave", "numero", "emissor_uf", "destinatario_uf", "total_itens", "total_produtos",
+               "total_calculado", "total_declarado", "divergencia_absoluta", "nivel_risco"]
+    df_notas = df_notas[[c for c in colunas if c in df_notas.columns]]
+    st.dataframe(
+        df_notas.sort_values("divergencia_absoluta", key=abs, ascending=False),
+        use_container_width=True, hide_index=True
+    )
+
+
 def _exibir_resumo_executivo(relatorio: dict):
     """Exibe resumo executivo COMPLETO com gráficos (CSV)"""
     resumo = relatorio.get("resumo_executivo", {})
@@ -720,9 +737,11 @@ with aba_val:
     st.subheader("📂 Upload de Documentos")
 
     # Funções de validação
-    import re, csv, zipfile
+    import re, csv, zipfile, gzip
     from io import BytesIO
 
+    EXT_COMPACTADOS = (".zip", ".gz", ".zst")
+
     def _read_header_first_row_LIGHT(uploaded_file):
         """Lê APENAS primeiras linhas (não trava!)"""
         uploaded_file.seek(0)
@@ -745,25 +764,33 @@ with aba_val:
         uploaded_file.seek(0)
         name = uploaded_file.name.lower()
     
-        if name.endswith(".zip"):
+        if name.endswith((".zip", ".gz")):
             try:
-                raw = uploaded_file.read()
+                # Só o início do membro, descompactado em stream (nada de ler o arquivo inteiro)
+                if name.endswith(".gz"):
+                    with gzip.GzipFile(fileobj=uploaded_file) as g:
+                        data = g.read(50000)
+                else:
+                    with zipfile.ZipFile(uploaded_file, "r") as z:
+                        csvs = [n for n in z.namelist() if n.lower().endswith(".csv")]
+                        chosen = next((n for n in csvs if "item" in n.lower()), csvs[0]) if csvs else None
+                        if not chosen:
+                            return None
+                        with z.open(chosen) as m:
+                            data = m.read(50000)
                 uploaded_file.seek(0)
-                with zipfile.ZipFile(BytesIO(raw), "r") as z:
-                    csvs = [n for n in z.namelist() if n.lower().endswith(".csv")]
-                    chosen = next((n for n in csvs if "item" in n.lower()), csvs[0]) if csvs else None
-                    if not chosen:
-                        return None
-                    data = z.read(chosen)
-                    sample = data[:50000].decode('utf-8', errors='ignore')
-                    lines = sample.splitlines()[:100]
-                    if len(lines) < 2:
-                        return None
-                    sep = ';' if lines[0].count(';') > lines[0].count(',') else ','
-                    header = lines[0].split(sep)
-                    first = lines[1].split(sep)
+                sample = data.decode('utf-8', errors='ignore')
+                lines = sample.splitlines()[:100]
+                if len(lines) < 2:
+                    return None
+                sep = ';' if lines[0].count(';') > lines[0].count(',') else ','
+                header = lines[0].split(sep)
+                first = lines[1].split(sep)
             except:
+                uploaded_file.seek(0)
                 return None
+        elif name.endswith(".zst"):
+            return None  # sem zstandard no app: a chave é validada no pipeline
         else:
             header, first = _read_header_first_row_LIGHT(uploaded_file)
     
@@ -779,14 +806,40 @@ with aba_val:
                         return digits
         return None
 
+    def _chaves_amostra_LIGHT(uploaded_file):
+        """Chaves distintas nas primeiras linhas do CSV (detecta arquivo com várias notas)"""
+        if uploaded_file.name.lower().endswith(EXT_COMPACTADOS):
+            return set()
+        uploaded_file.seek(0)
+        sample = uploaded_file.read(50000).decode('utf-8', errors='ignore')
+        uploaded_file.seek(0)
+        lines = sample.splitlines()[:100]
+        if len(lines) < 2:
+            return set()
+        sep = ';' if lines[0].count(';') > lines[0].count(',') else ','
+        header = [c.strip().lower() for c in lines[0].split(sep)]
+        idx = next((i for i, c in enumerate(header)
+                    if any(p in c for p in ("chave", "acesso", "chavenfe", "chnfe"))), None)
+        if idx is None:
+            return set()
+        chaves = set()
+        for line in lines[1:-1]:  # última linha da amostra pode estar cortada
+            cols = line.split(sep)
+            if idx < len(cols):
+                digits = "".join(re.findall(r"\d", cols[idx]))
+                if len(digits) >= 30:
+                    chaves.add(digits)
+        return chaves
+
     # Uploads
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        up_csv_list = st.file_uploader("CSV (Cabeçalho + Itens)", type=["csv"], accept_multiple_files=True, key="up_csv")
+        up_csv_list = st.file_uploader("CSV (Cabeçalho + Itens) ou .zip/.gz/.zst", type=["csv", "zip", "gz", "zst"],
+                                       accept_multiple_files=True, key="up_csv")
                     
     with col2:
-        up_xml = st.file_uploader("XML (NF-e)", type=["xml"], key="up_xml")
+        up_xml = st.file_uploader("XML (NF-e)", type=["xml", "zip", "gz", "zst"], key="up_xml")
         
     with col3:
         up_pdf = st.file_uploader("PDF", type=["pdf"], key="up_pdf")
@@ -794,16 +847,30 @@ with aba_val:
     with col4:
         up_img = st.file_uploader("Imagem", type=["png","jpg","jpeg"], key="up_img")
         
+    # Compactado pode trazer cabeçalho + itens num arquivo só
+    tem_compactado = any(f.name.lower().endswith(EXT_COMPACTADOS) for f in (up_csv_list or []))
+    csv_completo = bool(up_csv_list) and (len(up_csv_list) >= 2 or tem_compactado)
+
     # Validar chaves
     chaves = set()
-    if up_csv_list and len(up_csv_list) >= 2:
+    if csv_completo:
         for f in up_csv_list:
             k = _extract_key_LIGHT(f)
             if k:
                 chaves.add(k)
+            chaves |= _chaves_amostra_LIGHT(f)
+
+    # Várias chaves = carteira (um resultado por nota, leitura única dos arquivos)
+    modo_lote = False
+    if csv_completo:
+        modo_lote = st.checkbox(
+            f"🧾 Modo lote: várias notas nos CSVs ({len(chaves)} chaves na amostra)",
+            value=len(chaves) > 1,
+            help="Separa os itens pela CHAVE DE ACESSO e valida cada nota + resumo da carteira"
+        )
 
     # Habilitar botão
-    botao_habilitado = (len(chaves) == 1 and len(up_csv_list) >= 2) or up_xml or up_pdf or up_img
+    botao_habilitado = (csv_completo and (len(chaves) >= 1 or tem_compactado)) or up_xml or up_pdf or up_img
 
     usar_cbs = st.checkbox("✅ Usar API CBS/IBS/IS (Reforma)", value=False)
 
@@ -859,11 +926,17 @@ with aba_val:
                         "image_file": temp_img
                      }
                 
-                    rel_path = run_pipeline(
-                        docs=docs,
-                        usar_cbs_oficial=usar_cbs,
-                        progress_path="data/progress.jsonl"
-                    )
+                    if modo_lote and temp_paths:
+                        rel_path = run_pipeline_lote(
+                            docs={"nf_csv_file": temp_paths},
+                            progress_path="data/progress.jsonl"
+                        )
+                    else:
+                        rel_path = run_pipeline(
+                            docs=docs,
+                            usar_cbs_oficial=usar_cbs,
+                            progress_path="data/progress.jsonl"
+                        )
                 
                     st.session_state["rel_json"] = rel_path
                 
@@ -879,6 +952,10 @@ with aba_val:
                     else:
                         # MODO RESUMO (CSV)
                         _exibir_resumo_executivo(relatorio)
+
+                    # CARTEIRA: uma linha por nota
+                    if relatorio.get("lote") and relatorio.get("notas"):
+                        _exibir_notas_lote(relatorio)
                 
                     # Download
                     # Salvar relatório no session_state para manter após download
@@ -0,0 +1 @@
+# validador_fiscal benchmarks
@@ -0,0 +1,103 @@
+# validador_fiscal/benchmarks/bench_csv.py
+"""
+Benchmark de leitura do CSV de ITENS: backend Arrow x pandas (engine="python")
+- "leitura": só ler_csv_em_chunks (decodificação do CSV)
+- "parse": leitura + _tabela_itens_chunk (colunas do ItemTable, números BR)
+- Sem arquivo, gera um CSV sintético no formato da Receita (separador ";", decimal ",")
+
+Uso:
+    python -m validador_fiscal.benchmarks.bench_csv [itens.csv] [--linhas 500000] [--repeticoes 3]
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List
+
+from ..core.column_aliases import compilar_plano, CAMPOS_ITEM, CAMPOS_TEXTO
+from ..tools.csv_stream import ler_csv_em_chunks, backend_csv, _HAS_ARROW, CHUNK_LINHAS
+from ..tools.nf_parse_tool import _sniff_csv, _tabela_itens_chunk
+
+import pandas as pd
+
+COLUNAS = ["CHAVE DE ACESSO", "NÚMERO", "UF EMITENTE", "UF DESTINATÁRIO", "INSCRIÇÃO ESTADUAL",
+           "DESTINO DA OPERAÇÃO", "NÚMERO PRODUTO", "DESCRIÇÃO DO PRODUTO/SERVIÇO", "CÓDIGO NCM/SH",
+           "CFOP", "QUANTIDADE", "UNIDADE", "VALOR UNITÁRIO", "VALOR TOTAL"]
+
+
+def gerar_csv(path: str, linhas: int, semente: int = 42) -> None:
+    """CSV sintético de itens (NCM com zero à esquerda, valores em formato BR)."""
+    rnd = random.Random(semente)
+    ncms = ["84713012", "02013000", "61091000", "30049099", "04022110"]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(";".join(COLUNAS) + "\n")
+        for i in range(linhas):
+            q = rnd.randint(1, 10)
+            vu = rnd.uniform(0, 5000)
+            f.write(";".join([
+                "3524%040d" % (i // 100), str(1000 + i // 100), "SP", "RJ", "123456789",
+                "NÃO CONTRIBUINTE" if i % 333 == 0 else "CONTRIBUINTE", str(i + 1),
+                f"PRODUTO {i} - DESCRIÇÃO DE TESTE", rnd.choice(ncms), rnd.choice(["5102", "6102", "5405"]),
+                str(q), "UN", f"{vu:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+                f"{q * vu:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+            ]) + "\n")
+
+
+def medir(path: str, cfg: Dict[str, str], backend: str, com_parse: bool) -> Dict[str, float]:
+    plano = compilar_plano(pd.read_csv(path, encoding=cfg["encoding"], sep=cfg["sep"], nrows=0).columns)
+    t0 = time.perf_counter()
+    linhas = 0
+    for chunk in ler_csv_em_chunks(
+        path, encoding=cfg["encoding"], sep=cfg["sep"], chunk_size=CHUNK_LINHAS,
+        usecols=plano.usecols(CAMPOS_ITEM), texto=plano.usecols(CAMPOS_TEXTO), backend=backend,
+    ):
+        linhas += len(chunk)
+        if com_parse:
+            _tabela_itens_chunk(chunk, filtrar_zerados=False)
+    seg = time.perf_counter() - t0
+    return {"seg": seg, "linhas": linhas}
+
+
+def main(argv: List[str] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("arquivo", nargs="?", help="CSV de itens (padrão: sintético)")
+    ap.add_argument("--linhas", type=int, default=500_000, help="linhas do CSV sintético")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    tmp = None
+    path = args.arquivo
+    if path:
+        cfg = _sniff_csv(path)
+    else:
+        cfg = {"encoding": "utf-8", "sep": ";"}
+        tmp = tempfile.NamedTemporaryFile(suffix="_itens.csv", delete=False)
+        tmp.close()
+        path = tmp.name
+        print(f"🧪 Gerando CSV sintético: {args.linhas:,} linhas...")
+        gerar_csv(path, args.linhas)
+
+    try:
+        mb = os.path.getsize(path) / 1e6
+        backends = ["pandas"] + (["arrow"] if _HAS_ARROW else [])
+        if not _HAS_ARROW:
+            print("⚠️ pyarrow não instalado: medindo só o backend pandas")
+        print(f"📄 {os.path.basename(path)} ({mb:,.1f} MB) | melhor de {args.repeticoes}")
+        print(f"{'etapa':<10}{'backend':<9}{'seg':>8}{'linhas/s':>14}{'MB/s':>9}")
+        base: Dict[str, float] = {}
+        for etapa, com_parse in (("leitura", False), ("parse", True)):
+            for b in backends:
+                r = min((medir(path, cfg, backend_csv(b), com_parse) for _ in range(args.repeticoes)),
+                        key=lambda x: x["seg"])
+                ganho = f"  {base[etapa] / r['seg']:.1f}x" if etapa in base else ""
+                base.setdefault(etapa, r["seg"])
+                print(f"{etapa:<10}{b:<9}{r['seg']:>8.2f}{r['linhas'] / r['seg']:>14,.0f}{mb / r['seg']:>9.1f}{ganho}")
+    finally:
+        if tmp:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
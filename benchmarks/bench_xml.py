@@ -0,0 +1,112 @@
+# validador_fiscal/benchmarks/bench_xml.py
+"""
+Benchmark da ingestão em massa de NF-e XML: notas/s e notas/s POR NÚCLEO
+- "ingestão": XMLs → notas + tabela única de itens (pool de processos)
+- "cálculo": motor vetorizado uma vez sobre a tabela inteira
+- Sem pasta, gera XMLs sintéticos (uma NFe por arquivo, como chegam do SFTP)
+- Cada execução é acrescentada ao histórico (JSONL) para acompanhar a evolução
+
+Uso:
+    python -m validador_fiscal.benchmarks.bench_xml [pasta_ou_zip] [--notas 5000] [--itens 10] [--workers 1,4]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+from ..agents.tax_engine_agent import run_lote
+from ..tools.ingestao_xml import ingerir_xmls
+
+HISTORICO = os.getenv("BENCH_XML_HISTORICO", "data/benchmarks/bench_xml.jsonl")
+
+_NCMS = ["84713012", "02013000", "61091000", "30049099", "04022110"]
+_UFS = ["SP", "RJ", "MG", "PR", "BA"]
+
+
+def gerar_xmls(pasta: str, notas: int, itens: int, semente: int = 42) -> None:
+    """Uma NFe (nfeProc) por arquivo, com `itens` det cada."""
+    rnd = random.Random(semente)
+    for k in range(notas):
+        chave = "3524%040d" % k
+        dets = []
+        for i in range(itens):
+            q = rnd.randint(1, 10)
+            vu = round(rnd.uniform(1, 5000), 2)
+            vp = round(q * vu, 2)
+            dets.append(
+                f'<det nItem="{i + 1}"><prod><cProd>P{i}</cProd><xProd>PRODUTO {i} - TESTE</xProd>'
+                f"<NCM>{rnd.choice(_NCMS)}</NCM><CFOP>{rnd.choice(['5102', '6102', '5405'])}</CFOP>"
+                f"<qCom>{q}</qCom><vUnCom>{vu}</vUnCom><vProd>{vp}</vProd></prod>"
+                f"<imposto><ICMS><ICMS00><CST>00</CST><vBC>{vp}</vBC><pICMS>18</pICMS>"
+                f"<vICMS>{round(vp * 0.18, 2)}</vICMS></ICMS00></ICMS></imposto></det>"
+            )
+        xml = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+            f'<NFe><infNFe Id="NFe{chave}"><ide><nNF>{k + 1}</nNF><serie>1</serie><dhEmi>2024-01-01</dhEmi></ide>'
+            f"<emit><CNPJ>12345678000199</CNPJ><xNome>EMITENTE</xNome><enderEmit><UF>{rnd.choice(_UFS)}</UF></enderEmit></emit>"
+            f"<dest><CNPJ>98765432000111</CNPJ><xNome>CLIENTE</xNome><enderDest><UF>{rnd.choice(_UFS)}</UF></enderDest></dest>"
+            + "".join(dets)
+            + "<total><ICMSTot><vICMS>0</vICMS><vNF>0</vNF></ICMSTot></total></infNFe></NFe>"
+            f"<protNFe><infProt><chNFe>{chave}</chNFe></infProt></protNFe></nfeProc>"
+        )
+        with open(os.path.join(pasta, f"{chave}-nfe.xml"), "w", encoding="utf-8") as f:
+            f.write(xml)
+
+
+def medir(fonte: str, workers: int) -> Dict[str, float]:
+    t0 = time.perf_counter()
+    lote = ingerir_xmls(fonte, workers=workers)
+    t1 = time.perf_counter()
+    run_lote(lote.notas, tabela=lote.itens)
+    t2 = time.perf_counter()
+    return {"notas": len(lote.notas), "itens": len(lote.itens), "ingestao": t1 - t0, "calculo": t2 - t1}
+
+
+def main(argv: List[str] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("fonte", nargs="?", help="pasta ou zip de XMLs (padrão: sintético)")
+    ap.add_argument("--notas", type=int, default=5000, help="XMLs sintéticos")
+    ap.add_argument("--itens", type=int, default=10, help="itens por nota sintética")
+    ap.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="lista de nº de processos")
+    ap.add_argument("--historico", default=HISTORICO, help="JSONL de resultados ('' = não grava)")
+    args = ap.parse_args(argv)
+
+    tmp = None
+    fonte = args.fonte
+    if not fonte:
+        tmp = tempfile.mkdtemp(prefix="bench_xml_")
+        print(f"🧪 Gerando {args.notas:,} XMLs sintéticos ({args.itens} itens cada)...")
+        gerar_xmls(tmp, args.notas, args.itens)
+        fonte = tmp
+
+    try:
+        workers = sorted({max(1, int(w)) for w in args.workers.split(",") if w.strip()})
+        print(f"{'workers':<9}{'notas':>8}{'ingestão s':>12}{'cálculo s':>11}{'notas/s':>10}{'notas/s/núcleo':>16}")
+        for w in workers:
+            r = medir(fonte, w)
+            total = r["ingestao"] + r["calculo"]
+            por_s = r["notas"] / total
+            nucleos = min(w, os.cpu_count() or 1)
+            print(f"{w:<9}{r['notas']:>8,}{r['ingestao']:>12.2f}{r['calculo']:>11.2f}"
+                  f"{por_s:>10,.0f}{por_s / nucleos:>16,.0f}")
+            if args.historico:
+                os.makedirs(os.path.dirname(args.historico) or ".", exist_ok=True)
+                with open(args.historico, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({
+                        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "fonte": "sintetico" if tmp else fonte,
+                        "workers": w, "nucleos": nucleos, **{k: round(v, 4) for k, v in r.items()},
+                        "notas_por_s": round(por_s, 1), "notas_por_s_nucleo": round(por_s / nucleos, 1),
+                    }) + "\n")
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
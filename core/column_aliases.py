@@ -0,0 +1,128 @@
+# validador_fiscal/core/column_aliases.py
+"""
+Registro ÚNICO de aliases de colunas (CSV Receita / ERP / importação DB)
+- Cada campo canônico tem a lista de nomes aceitos, em ordem de prioridade
+- Comparação sem diferenciar maiúsculas/minúsculas e espaços nas pontas
+- O cabeçalho é compilado UMA vez em um plano campo → índice da coluna,
+  memoizado pela assinatura do cabeçalho
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+ALIASES: Dict[str, Tuple[str, ...]] = {
+    # ---------- cabeçalho da nota ----------
+    "chave": ("CHAVE DE ACESSO", "CHAVE", "chNFe", "chave_nfe", "chavenfe"),
+    "numero": ("NÚMERO", "NUMERO", "NR", "nNF", "numnf"),
+    "serie": ("SÉRIE", "SERIE", "nSerie"),
+    "data_emissao": ("DATA EMISSÃO", "DATA EMISSAO", "dhEmi", "dEmi", "emissao"),
+    "emitente_cnpj": ("CPF/CNPJ EMITENTE", "CNPJ EMITENTE", "CNPJ_emitente", "emit_cnpj", "cnpj_emit", "cnpj"),
+    "destinatario_cnpj": ("CNPJ DESTINATÁRIO", "CNPJ DESTINATARIO", "dest_cnpj", "cnpj_dest", "cnpjdest"),
+    "emissor_uf": ("UF EMITENTE", "UF EMIT", "UF_EMIT"),
+    "destinatario_uf": ("UF DESTINATÁRIO", "UF DESTINATARIO", "UF_DEST"),
+    "total_nf": ("VALOR NOTA FISCAL", "vNF", "valor_total", "total_nf", "vTotNF", "total"),
+
+    # ---------- impostos declarados (totais da nota) ----------
+    "icms": ("ICMS",),
+    "st": ("ST",),
+    "difal": ("DIFAL",),
+    "ipi": ("IPI",),
+    "pis": ("PIS",),
+    "cofins": ("COFINS",),
+    "iss": ("ISS",),
+    "irpj": ("IRPJ",),
+    "csll": ("CSLL",),
+    "cbs": ("CBS",),
+    "ibs": ("IBS",),
+    "is_": ("IS",),
+
+    # ---------- itens ----------
+    # "codigo" segue o parser (NÚMERO PRODUTO = código do item na Receita);
+    # o importador DB grava NÚMERO PRODUTO em n_item e o código em codigo_produto.
+    "codigo": ("NÚMERO PRODUTO", "CODIGO", "CÓDIGO", "COD"),
+    "codigo_produto": ("CÓDIGO PRODUTO", "CODIGO PRODUTO", "cProd", "cod", "codigo", "prod_codigo"),
+    "n_item": ("NÚMERO PRODUTO", "NUMERO PRODUTO", "nItem", "item", "item_seq"),
+    "descricao": ("DESCRIÇÃO DO PRODUTO/SERVIÇO", "DESCRICAO DO PRODUTO/SERVICO", "DESCRICAO",
+                  "xProd", "desc", "produto_descricao"),
+    "ncm": ("CÓDIGO NCM/SH", "CODIGO NCM/SH", "NCM", "NCM/SH (TIPO DE PRODUTO)", "NCM/SH"),
+    "cfop": ("CFOP",),
+    "subitem_lc116": ("SUBITEM_LC116", "SUBITEM", "LC116_SUBITEM", "SERVICO_SUBITEM"),
+    "municipio_servico": ("municipio_servico", "mun_servico", "municipio"),
+    "uf_servico": ("uf_servico", "uf_serv", "uf"),
+    "quantidade": ("QUANTIDADE", "QTD", "QCOM"),
+    "valor_unitario": ("VALOR UNITÁRIO", "VALOR UNITARIO", "VUNCOM", "vUnit", "valor_unit", "vl_unit", "valor_unitario"),
+    "valor_total": ("VALOR TOTAL", "VPROD", "vTotal", "valor_total", "vl_total"),
+
+    # ---------- validação fiscal dos itens ----------
+    "regime": ("REGIME", "DESCRIÇÃO REGIME", "CONS", "DESTINO"),
+    "inscricao_estadual": ("INSCRIÇÃO ESTADUAL", "IST", "IE"),
+}
+
+# Campos que os parsers de itens realmente usam (para usecols)
+CAMPOS_ITEM = (
+    "chave", "codigo", "descricao", "ncm", "cfop", "subitem_lc116",
+    "quantidade", "valor_unitario", "valor_total", "regime", "inscricao_estadual",
+)
+
+# Campos de item lidos sempre como texto (zeros à esquerda, IE em notação científica)
+CAMPOS_TEXTO = ("chave", "codigo", "ncm", "cfop", "subitem_lc116", "inscricao_estadual")
+
+
+def _norm(nome: Any) -> str:
+    return str(nome).strip().upper()
+
+
+_ALIASES_NORM: Dict[str, Tuple[str, ...]] = {
+    campo: tuple(_norm(a) for a in nomes) for campo, nomes in ALIASES.items()
+}
+
+
+@dataclass(frozen=True)
+class PlanoColunas:
+    """Resultado da compilação de um cabeçalho: campo canônico → coluna."""
+    cabecalho: Tuple[str, ...]
+    indices: Mapping[str, int]
+
+    def tem(self, campo: str) -> bool:
+        return campo in self.indices
+
+    def indice(self, campo: str) -> Optional[int]:
+        return self.indices.get(campo)
+
+    def coluna(self, campo: str) -> Optional[str]:
+        i = self.indices.get(campo)
+        return self.cabecalho[i] if i is not None else None
+
+    def usecols(self, campos: Iterable[str] = CAMPOS_ITEM) -> List[str]:
+        """Colunas do arquivo necessárias para os campos (ordem do arquivo, sem repetição)."""
+        idx = sorted({self.indices[c] for c in campos if c in self.indices})
+        return [self.cabecalho[i] for i in idx]
+
+    def valor(self, linha: Any, campo: str, default: Any = None) -> Any:
+        """Valor do campo em uma linha (dict pelo nome ou sequência pela posição)."""
+        i = self.indices.get(campo)
+        if i is None:
+            return default
+        if isinstance(linha, Mapping):
+            return linha.get(self.cabecalho[i], default)
+        return linha[i] if i < len(linha) else default
+
+
+@lru_cache(maxsize=256)
+def _compilar(cabecalho: Tuple[str, ...]) -> PlanoColunas:
+    posicoes: Dict[str, int] = {}
+    for i, nome in enumerate(cabecalho):
+        posicoes.setdefault(_norm(nome), i)
+    indices: Dict[str, int] = {}
+    for campo, nomes in _ALIASES_NORM.items():
+        for n in nomes:
+            if n in posicoes:
+                indices[campo] = posicoes[n]
+                break
+    return PlanoColunas(cabecalho=cabecalho, indices=indices)
+
+
+def compilar_plano(cabecalho: Sequence[Any]) -> PlanoColunas:
+    """Compila (ou reaproveita do cache) o plano de colunas de um cabeçalho."""
+    return _compilar(tuple(str(c) for c in cabecalho))
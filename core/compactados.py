@@ -0,0 +1,193 @@
+# validador_fiscal/core/compactados.py
+"""
+Leitura de ARQUIVOS COMPACTADOS (zip / gz / zst) como streams
+- Nada é extraído para o disco: cada membro é lido descompactando sob demanda
+- Um membro de zip é referenciado como "arquivo.zip::pasta/membro.csv";
+  .gz/.zst contêm um único arquivo e são referenciados pelo próprio caminho
+- Caminhos comuns passam direto (open em modo binário)
+"""
+from __future__ import annotations
+import contextlib
+import gzip
+import io
+import os
+import struct
+import zipfile
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import zstandard as _zstd
+    _HAS_ZSTD = True
+except Exception:
+    _zstd = None
+    _HAS_ZSTD = False
+
+try:
+    import pyarrow as _pa
+    _HAS_ARROW = True
+except Exception:
+    _pa = None
+    _HAS_ARROW = False
+
+SEP_MEMBRO = "::"
+EXT_GZ = (".gz", ".gzip")
+EXT_ZST = (".zst", ".zstd")
+
+# .zst sem tamanho no cabeçalho do frame: estimativa de descompactação de CSV
+RAZAO_ZST_ESTIMADA = 8
+
+
+def separar(ref: str) -> Tuple[str, Optional[str]]:
+    """(arquivo físico, membro do zip ou None)."""
+    if SEP_MEMBRO in ref:
+        fisico, membro = ref.split(SEP_MEMBRO, 1)
+        return fisico, membro
+    return ref, None
+
+
+def tipo(ref: str) -> Optional[str]:
+    """"zip" | "gz" | "zst" | None (arquivo comum), pela extensão do arquivo físico."""
+    fisico = separar(ref)[0].lower()
+    if fisico.endswith(".zip"):
+        return "zip"
+    if fisico.endswith(EXT_GZ):
+        return "gz"
+    if fisico.endswith(EXT_ZST):
+        return "zst"
+    return None
+
+
+def nome(ref: str) -> str:
+    """Nome lógico do arquivo (membro do zip ou caminho sem a extensão de compressão)."""
+    fisico, membro = separar(ref)
+    if membro is not None:
+        return os.path.basename(membro)
+    base = os.path.basename(fisico)
+    for ext in EXT_GZ + EXT_ZST:
+        if base.lower().endswith(ext):
+            return base[: -len(ext)]
+    return base
+
+
+def existe(ref: Optional[str]) -> bool:
+    if not ref:
+        return False
+    fisico, membro = separar(ref)
+    if not os.path.exists(fisico):
+        return False
+    if membro is None:
+        return True
+    with zipfile.ZipFile(fisico) as z:
+        return membro in z.NameToInfo
+
+
+def listar(path: str, extensoes: Sequence[str] = (".csv",)) -> List[str]:
+    """Referências dos arquivos com as extensões dadas dentro de `path` (ou o próprio path)."""
+    ext = tuple(e.lower() for e in extensoes)
+    if tipo(path) == "zip" and separar(path)[1] is None:
+        with zipfile.ZipFile(path) as z:
+            return [
+                f"{path}{SEP_MEMBRO}{info.filename}" for info in z.infolist()
+                if not info.is_dir()
+                and not info.filename.startswith("__MACOSX/")
+                and info.filename.lower().endswith(ext)
+            ]
+    return [path] if nome(path).lower().endswith(ext) else []
+
+
+def expandir(paths: Iterable[Optional[str]], extensoes: Sequence[str] = (".csv",)) -> List[str]:
+    """Lista de arquivos/compactados → referências, com zips abertos em seus membros."""
+    refs: List[str] = []
+    for p in paths:
+        if p and existe(p):
+            refs.extend(listar(p, extensoes) if tipo(p) else [p])
+    return refs
+
+
+class _StreamContado(io.RawIOBase):
+    """Stream só de leitura que conta os bytes entregues (tell() em streams não posicionáveis)."""
+
+    def __init__(self, f):
+        self._f = f
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        dados = self._f.read(len(b))
+        n = len(dados)
+        b[:n] = dados
+        self._pos += n
+        return n
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+def _abrir_zst(fisico: str) -> BinaryIO:
+    if _HAS_ZSTD:
+        return _zstd.ZstdDecompressor().stream_reader(open(fisico, "rb"), closefd=True)
+    if _HAS_ARROW:
+        return io.BufferedReader(_StreamContado(_pa.input_stream(fisico, compression="zstd")), 1 << 20)
+    raise ImportError("Leitura de .zst requer 'zstandard' ou 'pyarrow' instalado")
+
+
+@contextlib.contextmanager
+def abrir(ref: str) -> Iterator[BinaryIO]:
+    """Stream binário (descompactado) do arquivo ou membro."""
+    fisico, membro = separar(ref)
+    t = tipo(ref)
+    if t == "zip":
+        with zipfile.ZipFile(fisico) as z:
+            if membro is None:
+                raise IsADirectoryError(f"{ref} é um zip: escolha um membro (use listar)")
+            with z.open(membro) as f:
+                yield f
+        return
+    if t == "gz":
+        f = gzip.open(fisico, "rb")
+    elif t == "zst":
+        f = _abrir_zst(fisico)
+    else:
+        f = open(fisico, "rb")
+    with f:
+        yield f
+
+
+def tamanho(ref: str) -> int:
+    """Tamanho DESCOMPACTADO (exato no zip; rodapé ISIZE no gz; frame ou estimativa no zst)."""
+    fisico, membro = separar(ref)
+    t = tipo(ref)
+    compactado = os.path.getsize(fisico)
+    if t == "zip" and membro is not None:
+        with zipfile.ZipFile(fisico) as z:
+            return z.getinfo(membro).file_size
+    if t == "gz":
+        with open(fisico, "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            isize = struct.unpack("<I", f.read(4))[0]
+        # ISIZE é módulo 2^32: acima de 4 GB volta a ser pequeno
+        while isize < compactado:
+            isize += 1 << 32
+        return isize
+    if t == "zst":
+        if _HAS_ZSTD:
+            with open(fisico, "rb") as f:
+                params = _zstd.get_frame_parameters(f.read(18))
+            if params.content_size > 0:
+                return params.content_size
+        return compactado * RAZAO_ZST_ESTIMADA
+    return compactado
+
+
+def impressao(ref: str) -> Tuple[str, str, int, int]:
+    """Impressão digital para caches: (arquivo físico, membro, tamanho, mtime_ns)."""
+    fisico, membro = separar(ref)
+    st = os.stat(fisico)
+    return os.path.abspath(fisico), membro or "", st.st_size, st.st_mtime_ns
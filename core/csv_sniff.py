@@ -0,0 +1,102 @@
+# validador_fiscal/core/csv_sniff.py
+"""
+Detecção RÁPIDA de encoding + separador de CSV
+- Checagens baratas primeiro: BOM → UTF-8 estrito → cp1252/latin-1 (sem chardet)
+- Amostras do início, meio e fim do arquivo (não só da cabeça)
+- Separador pela consistência do nº de campos entre o cabeçalho e as linhas
+- Decisão memoizada pela impressão digital do arquivo (caminho, tamanho, mtime)
+- Membros de zip/gz/zst: só a cabeça (sem seek no stream compactado)
+"""
+from __future__ import annotations
+import codecs
+import csv
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from .compactados import SEP_MEMBRO, abrir, impressao, tipo
+
+AMOSTRA_CABECA = 64 * 1024
+AMOSTRA_MEIO = 16 * 1024
+SEPARADORES = (";", ",", "\t", "|")
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# bytes 0x80-0x9F sem caractere no cp1252: se aparecem, o arquivo é latin-1 puro
+_INDEFINIDOS_CP1252 = frozenset(b"\x81\x8d\x8f\x90\x9d")
+
+
+def _amostras(path: str, tamanho: int) -> List[bytes]:
+    """Cabeça + trechos do meio e do fim, cortados em quebras de linha."""
+    if tipo(path):
+        with abrir(path) as f:
+            cabeca = f.read(AMOSTRA_CABECA)
+        return [cabeca[: cabeca.rfind(b"\n") + 1] or cabeca] if len(cabeca) == AMOSTRA_CABECA else [cabeca]
+    with open(path, "rb") as f:
+        cabeca = f.read(AMOSTRA_CABECA)
+        if tamanho <= AMOSTRA_CABECA:
+            return [cabeca]
+        blocos = [cabeca[: cabeca.rfind(b"\n") + 1] or cabeca]
+        for pos in (tamanho // 2, max(tamanho - AMOSTRA_MEIO, AMOSTRA_CABECA)):
+            f.seek(pos)
+            b = f.read(AMOSTRA_MEIO)
+            ini = b.find(b"\n") + 1
+            fim = b.rfind(b"\n") + 1
+            if 0 < ini < fim:
+                blocos.append(b[ini:fim])
+    return blocos
+
+
+def _encoding(amostras: List[bytes]) -> str:
+    cabeca = amostras[0]
+    for bom, enc in _BOMS:
+        if cabeca.startswith(bom):
+            return enc
+    try:
+        for b in amostras:
+            b.decode("utf-8", errors="strict")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    # 8 bits: cp1252 só se houver bytes 0x80-0x9F e todos definidos nele
+    c1 = {x for b in amostras for x in b if 0x80 <= x <= 0x9F}
+    if c1 and not (c1 & _INDEFINIDOS_CP1252):
+        return "cp1252"
+    return "latin-1"
+
+
+def _separador(texto: str) -> str:
+    linhas = [l for l in texto.splitlines()[:50] if l.strip()]
+    if not linhas:
+        return ","
+    melhor: Tuple[float, int, str] = (-1.0, 0, ",")
+    for sep in SEPARADORES:
+        if sep not in linhas[0]:
+            continue
+        campos = [len(r) for r in csv.reader(linhas, delimiter=sep)]
+        n = campos[0]
+        if n < 2:
+            continue
+        # linhas finais podem estar cortadas pela amostra: não pesam
+        corpo = campos[1:-1] or campos[1:] or [n]
+        consistencia = sum(c == n for c in corpo) / len(corpo)
+        melhor = max(melhor, (consistencia, n, sep))
+    return melhor[2]
+
+
+@lru_cache(maxsize=512)
+def _detectar(path: str, tamanho: int, mtime_ns: int) -> Tuple[str, str]:
+    amostras = _amostras(path, tamanho)
+    enc = _encoding(amostras)
+    texto = amostras[0].decode(enc, errors="replace")
+    return enc, _separador(texto)
+
+
+def detectar_csv(path: str) -> Dict[str, str]:
+    """{"encoding", "sep"} do arquivo ou membro compactado (decisão reaproveitada enquanto não mudar)."""
+    fisico, membro, tamanho, mtime_ns = impressao(path)
+    ref = f"{fisico}{SEP_MEMBRO}{membro}" if membro else fisico
+    enc, sep = _detectar(ref, tamanho, mtime_ns)
+    return {"encoding": enc, "sep": sep}
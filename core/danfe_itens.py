@@ -0,0 +1,348 @@
+# validador_fiscal/core/danfe_itens.py
+"""
+ITENS DO DANFE em PDF (quadro "DADOS DOS PRODUTOS / SERVIÇOS")
+- Páginas candidatas escolhidas pelo texto já extraído (pdf_paginas): as demais nem são abertas
+- Em cada candidata, a página é RECORTADA no quadro de produtos (do título/cabeçalho até
+  "DADOS ADICIONAIS" ou o fim da folha) e só o recorte passa pela extração das palavras
+- Colunas pelas células do cabeçalho (bordas verticais desenhadas; sem bordas, pelo
+  espaçamento dos títulos): código, descrição, NCM, CST, CFOP, quantidade, valor unitário,
+  valor total, BC/valor/alíquota do ICMS, valor do IPI
+- Quadro que continua na folha seguinte: cabeçalho repetido ou, sem ele, as colunas da
+  folha anterior; descrição quebrada em várias linhas volta para o item de cima
+- Saída: ItemTable no mesmo formato colunar do CSV (+ decl_* por item)
+"""
+from __future__ import annotations
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Pattern, Sequence, Tuple
+
+import pandas as pd
+
+from .item_table import ItemTable
+from .utils import numeros_br
+
+try:
+    import pdfplumber
+    _HAS_PDFPLUMBER = True
+except Exception:
+    pdfplumber = None
+    _HAS_PDFPLUMBER = False
+
+# título do quadro, linha de cabeçalho e fim do quadro (linhas sem espaços nem acentos)
+_RX_TITULO = re.compile(r"DADOSD[OA]S?PRODUTOS?")
+_RX_NCM = re.compile(r"NCM")
+_RX_CFOP = re.compile(r"CFOP")
+_RX_FIM = re.compile(r"DADOSADICIONAIS|CALCULODOISSQN|INFORMACOESCOMPLEMENTARES|RESERVADOAOFISCO")
+
+# texto da página (já extraído) que justifica abri-la
+_TEM_CABECALHO = re.compile(r"\bNCM", re.I)
+_TEM_NCM = re.compile(r"\b\d{4}\.?\d{2}\.?\d{2}\b")
+# célula de dado (não de título): valor BR ou NCM
+_DADO = re.compile(r"^-?\d[\d.]*,\d{2,10}$|^\d{4}\.?\d{2}\.?\d{2}$")
+
+# título da célula (sem acento, maiúsculo) → coluna; a 1ª regra que casar vale
+_ROTULOS: Tuple[Tuple[str, Callable[[str], bool]], ...] = (
+    ("descricao", lambda t: "DESCRI" in t),
+    ("ncm", lambda t: "NCM" in t),
+    ("cfop", lambda t: "CFOP" in t),
+    ("cst", lambda t: "CST" in t or "CSOSN" in t),
+    ("", lambda t: "ALIQ" in t and "IPI" in t),
+    ("decl_aliq_icms", lambda t: "ALIQ" in t),
+    ("decl_bc_icms", lambda t: "ICMS" in t and ("BC" in t or "CALC" in t or "BASE" in t)),
+    ("", lambda t: "ST" in t.split() or "SUBST" in t),
+    ("decl_icms", lambda t: "ICMS" in t),
+    ("decl_ipi", lambda t: "IPI" in t),
+    ("codigo", lambda t: "COD" in t),
+    ("quantidade", lambda t: "QUANT" in t or "QTD" in t),
+    ("valor_unitario", lambda t: "UNIT" in t),
+    ("", lambda t: "DESC" in t),  # desconto
+    ("valor_total", lambda t: "TOTAL" in t or "LIQ" in t),
+)
+_NUMERICAS = ("quantidade", "valor_unitario", "valor_total",
+              "decl_bc_icms", "decl_aliq_icms", "decl_icms", "decl_ipi")
+_CODIGOS = ("ncm", "cfop", "cst")
+# coluna preenchida = linha de item novo (senão a linha continua a descrição do item de cima)
+_ABREM_ITEM = ("ncm", "cfop", "quantidade", "valor_unitario", "valor_total")
+
+
+@dataclass
+class Colunas:
+    """Faixas horizontais [x0, x1) de cada coluna do quadro (as sem uso têm nome "")."""
+    nomes: List[str]
+    limites: List[float]  # len(nomes) + 1 bordas
+
+    def coluna(self, x: float) -> Optional[str]:
+        if x < self.limites[0] or x >= self.limites[-1]:
+            return None
+        for nome, x1 in zip(self.nomes, self.limites[1:]):
+            if x < x1:
+                return nome
+        return None
+
+
+def _sem_acento(texto: str) -> str:
+    return unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii").upper()
+
+
+def _rotulo(texto: str) -> str:
+    t = _sem_acento(texto).replace(".", " ")
+    for nome, regra in _ROTULOS:
+        if regra(t):
+            return nome
+    return ""
+
+
+def _linhas(palavras: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Palavras agrupadas em linhas (topo próximo), de cima para baixo, cada uma da esquerda p/ direita."""
+    linhas: List[List[Dict[str, Any]]] = []
+    for p in sorted(palavras, key=lambda p: (p["top"], p["x0"])):
+        if linhas and p["top"] - linhas[-1][0]["top"] <= 0.5 * (p["bottom"] - p["top"]):
+            linhas[-1].append(p)
+        else:
+            linhas.append([p])
+    return [sorted(l, key=lambda p: p["x0"]) for l in linhas]
+
+
+def _linha_de_dados(linha: List[Dict[str, Any]]) -> bool:
+    return any(_DADO.match(p["text"]) for p in linha)
+
+
+def _celulas(cabecalho: List[Dict[str, Any]], bordas: List[float]) -> List[Tuple[float, float, str]]:
+    """(x0, x1, título) de cada célula do cabeçalho."""
+    if len(bordas) >= 3:
+        celulas = []
+        for x0, x1 in zip(bordas, bordas[1:]):
+            dentro = [p for p in cabecalho if x0 <= (p["x0"] + p["x1"]) / 2 < x1]
+            if dentro:
+                dentro.sort(key=lambda p: (round(p["top"]), p["x0"]))
+                celulas.append((x0, x1, " ".join(p["text"] for p in dentro)))
+        return celulas
+    # sem bordas: títulos que se sobrepõem ou estão a menos de meio corpo de letra são a mesma célula
+    grupos: List[List[Dict[str, Any]]] = []
+    for p in sorted(cabecalho, key=lambda p: p["x0"]):
+        folga = 0.5 * (p["bottom"] - p["top"])
+        if grupos and p["x0"] <= max(q["x1"] for q in grupos[-1]) + folga:
+            grupos[-1].append(p)
+        else:
+            grupos.append([p])
+    celulas = []
+    for g in grupos:
+        g.sort(key=lambda p: (round(p["top"]), p["x0"]))
+        celulas.append((min(p["x0"] for p in g), max(p["x1"] for p in g), " ".join(p["text"] for p in g)))
+    return celulas
+
+
+def _faixas_dados(linhas: List[List[Dict[str, Any]]]) -> List[Tuple[float, float]]:
+    """Faixas x ocupadas pelas palavras das linhas de dados (vãos em branco separam as colunas)."""
+    faixas: List[List[float]] = []
+    for p in sorted((p for l in linhas for p in l), key=lambda p: p["x0"]):
+        folga = 0.5 * (p["bottom"] - p["top"])
+        if faixas and p["x0"] <= faixas[-1][1] + folga:
+            faixas[-1][1] = max(faixas[-1][1], p["x1"])
+        else:
+            faixas.append([p["x0"], p["x1"]])
+    return [(a, b) for a, b in faixas]
+
+
+def _celula_mais_proxima(faixa: Tuple[float, float], celulas: List[Tuple[float, float, str]]) -> int:
+    def _sobreposicao(c):
+        return min(faixa[1], c[1]) - max(faixa[0], c[0])
+    i = max(range(len(celulas)), key=lambda i: _sobreposicao(celulas[i]))
+    if _sobreposicao(celulas[i]) > 0:
+        return i
+    meio = (faixa[0] + faixa[1]) / 2
+    return min(range(len(celulas)), key=lambda i: abs((celulas[i][0] + celulas[i][1]) / 2 - meio))
+
+
+def _colunas(celulas: List[Tuple[float, float, str]], x0: float, x1: float, com_bordas: bool,
+             dados: List[List[Dict[str, Any]]]) -> Optional[Colunas]:
+    nomes = [_rotulo(t) for _, _, t in celulas]
+    if "ncm" not in nomes or "valor_total" not in nomes:
+        return None
+    if com_bordas:
+        return Colunas(nomes=nomes, limites=[celulas[0][0]] + [c[1] for c in celulas])
+    # sem bordas: valores alinhados à direita passam da borda esquerda do título, então as
+    # fronteiras saem dos vãos em branco entre os dados; cada faixa leva o nome do título
+    # com que mais se sobrepõe (sem dados, meio do vão entre os títulos)
+    faixas = _faixas_dados(dados) or [(c[0], c[1]) for c in celulas]
+    nomes_faixas: List[str] = []
+    bordas: List[float] = []
+    for k, faixa in enumerate(faixas):
+        nome = nomes[_celula_mais_proxima(faixa, celulas)]
+        if nomes_faixas and nomes_faixas[-1] == nome:
+            continue  # mesma coluna (ex.: descrição com vão largo entre palavras)
+        if nomes_faixas:
+            bordas.append((faixas[k - 1][1] + faixa[0]) / 2)
+        nomes_faixas.append(nome)
+    return Colunas(nomes=nomes_faixas, limites=[x0] + bordas + [x1])
+
+
+def _bordas_verticais(recorte, topo: float, fundo: float) -> List[float]:
+    """x das linhas verticais que atravessam a faixa do cabeçalho (bordas das células)."""
+    xs = sorted(e["x0"] for e in recorte.edges
+                if e["orientation"] == "v" and e["top"] <= topo + 1 and e["bottom"] >= fundo - 1)
+    unicos: List[float] = []
+    for x in xs:
+        if not unicos or x - unicos[-1] > 1:
+            unicos.append(x)
+    return unicos
+
+
+def _marcos(pagina) -> List[Tuple[float, float, str]]:
+    """
+    (topo, base, texto) de cada linha da página montada direto dos caracteres, sem espaços
+    nem acentos: basta para achar título, cabeçalho e fim do quadro sem o mapa de texto
+    da página inteira (page.search).
+    """
+    por_topo: Dict[int, List[Dict[str, Any]]] = {}
+    for c in pagina.chars:
+        por_topo.setdefault(round(c["top"]), []).append(c)
+    marcos = []
+    for topo in sorted(por_topo):
+        cs = sorted(por_topo[topo], key=lambda c: c["x0"])
+        texto = _sem_acento("".join(c["text"] for c in cs if not c["text"].isspace()))
+        marcos.append((min(c["top"] for c in cs), max(c["bottom"] for c in cs), texto))
+    return marcos
+
+
+def _achar(marcos: List[Tuple[float, float, str]], rx: Pattern,
+           abaixo_de: float = -1.0) -> Optional[Tuple[float, float, str]]:
+    return next((m for m in marcos if m[0] > abaixo_de and rx.search(m[2])), None)
+
+
+def _quadro_pagina(pagina, anteriores: Optional[Colunas]) -> Tuple[List[Dict[str, str]], Optional[Colunas]]:
+    """
+    (linhas de dados já por coluna, colunas usadas) do quadro de produtos da página.
+    Cada linha: {coluna: texto}; sem cabeçalho na página, valem as colunas anteriores.
+    """
+    marcos = _marcos(pagina)
+    titulo = _achar(marcos, _RX_TITULO)
+    # "NCM" de cabeçalho: com "CFOP" na mesma linha ou numa vizinha (títulos em duas linhas)
+    ncm = None
+    for m in marcos:
+        if m[0] > (titulo[0] if titulo else -1.0) and _RX_NCM.search(m[2]):
+            altura = m[1] - m[0]
+            if any(abs(c[0] - m[0]) <= 2 * altura and _RX_CFOP.search(c[2]) for c in marcos):
+                ncm = m
+                break
+    if ncm is None and anteriores is None:
+        return [], None
+    if ncm is not None:
+        topo = titulo[1] if titulo else max(0.0, ncm[0] - 3 * (ncm[1] - ncm[0]))
+    else:
+        topo = 0.0
+    fim = _achar(marcos, _RX_FIM, abaixo_de=ncm[0] if ncm else topo)
+    fundo = fim[0] if fim else pagina.height
+    if fundo <= topo:
+        return [], None
+
+    # só objetos inteiros dentro do quadro (crop cortaria o título pela metade)
+    recorte = pagina.within_bbox((0, topo, pagina.width, fundo))
+    linhas = _linhas(recorte.extract_words(keep_blank_chars=False, use_text_flow=False))
+
+    colunas = None
+    if ncm is not None:
+        inicio = next((i for i, l in enumerate(linhas) if _linha_de_dados(l)), len(linhas))
+        cabecalho = [p for l in linhas[:inicio] for p in l]
+        if cabecalho:
+            bordas = _bordas_verticais(recorte, min(p["top"] for p in cabecalho), max(p["bottom"] for p in cabecalho))
+            celulas = _celulas(cabecalho, bordas)
+            if celulas:
+                colunas = _colunas(celulas, 0.0, pagina.width, len(bordas) >= 3, linhas[inicio:])
+        linhas = linhas[inicio:]
+    propria = colunas is not None
+    colunas = colunas or anteriores
+    if colunas is None:
+        return [], None
+
+    saida: List[Dict[str, str]] = []
+    for l in linhas:
+        por_coluna: Dict[str, List[str]] = {}
+        for p in l:
+            nome = colunas.coluna((p["x0"] + p["x1"]) / 2)
+            if nome:
+                por_coluna.setdefault(nome, []).append(p["text"])
+        linha = {k: " ".join(v) for k, v in por_coluna.items()}
+        if not propria and not saida and not any(k in linha for k in _ABREM_ITEM):
+            continue  # folha sem cabeçalho: o que vem antes do 1º item não é do quadro
+        if linha:
+            saida.append(linha)
+    return saida, colunas
+
+
+def _agrupar_itens(linhas: Sequence[Dict[str, str]], itens: List[Dict[str, str]]) -> None:
+    """Linha com NCM/CFOP/valores abre item; as outras completam a descrição do item de cima."""
+    for linha in linhas:
+        if any(k in linha for k in _ABREM_ITEM) or not itens:
+            itens.append(dict(linha))
+            continue
+        atual = itens[-1]
+        for k, v in linha.items():
+            if k in ("descricao", "codigo"):
+                sep = " " if k == "descricao" else ""
+                atual[k] = f"{atual[k]}{sep}{v}" if atual.get(k) else v
+
+
+def _frame(itens: List[Dict[str, str]]) -> pd.DataFrame:
+    df = pd.DataFrame(itens)
+    for c in ("codigo", "descricao") + _CODIGOS:
+        if c not in df.columns:
+            df[c] = ""
+        df[c] = df[c].fillna("").astype(str)
+    for c in _CODIGOS:
+        df[c] = df[c].str.replace(r"\D", "", regex=True)
+    for c in _NUMERICAS:
+        if c in df.columns:
+            df[c] = numeros_br(df[c])
+    if "valor_total" not in df.columns:
+        df["valor_total"] = float("nan")
+    if "quantidade" in df.columns and "valor_unitario" in df.columns:
+        df["valor_total"] = df["valor_total"].fillna(df["quantidade"] * df["valor_unitario"])
+    df = df[df["valor_total"].notna()].reset_index(drop=True)
+    if not df["cst"].str.len().any():
+        df = df.drop(columns="cst")
+    return df
+
+
+def itens_danfe(
+    path: str,
+    paginas_texto: Optional[Sequence[str]] = None,
+    item_factory: Optional[Callable[..., Any]] = None,
+) -> ItemTable:
+    """
+    Itens do quadro de produtos do DANFE (ItemTable vazia se o PDF não tiver o quadro).
+
+    Args:
+        path: PDF
+        paginas_texto: texto de cada página (pdf_paginas.iter_paginas) para escolher as candidatas
+        item_factory: classe do Item criado sob demanda pela ItemTable
+    """
+    if not _HAS_PDFPLUMBER:
+        return ItemTable(item_factory=item_factory)
+    inicio = time.time()
+    itens: List[Dict[str, str]] = []
+    lidas = 0
+    try:
+        with pdfplumber.open(path) as pdf:
+            colunas: Optional[Colunas] = None
+            for n, pagina in enumerate(pdf.pages):
+                texto = paginas_texto[n] if paginas_texto is not None and n < len(paginas_texto) else None
+                if texto is not None and not (_TEM_CABECALHO.search(texto) or (colunas and _TEM_NCM.search(texto))):
+                    colunas = None  # o quadro não continua numa folha sem itens
+                    continue
+                linhas, colunas = _quadro_pagina(pagina, colunas)
+                pagina.close()
+                if linhas:
+                    lidas += 1
+                    _agrupar_itens(linhas, itens)
+    except Exception as e:
+        print(f"   ⚠️ Itens do DANFE: falha ao ler o quadro de produtos ({type(e).__name__}: {e})")
+        return ItemTable(item_factory=item_factory)
+    if not itens:
+        return ItemTable(item_factory=item_factory)
+    tabela = ItemTable(_frame(itens), item_factory=item_factory)
+    print(f"   📦 Itens do DANFE: {len(tabela)} itens em {lidas} página(s) | "
+          f"total R$ {tabela.total():,.2f} ({time.time() - inicio:.2f}s)")
+    return tabela
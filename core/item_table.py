@@ -0,0 +1,288 @@
+# validador_fiscal/core/item_table.py
+"""
+Tabela COLUNAR de itens (ingestão de arquivos grandes)
+- Itens ficam em arrays tipados (pandas/numpy) do leitor CSV até o motor fiscal
+- Objetos Item só são criados sob demanda (iteração / índice)
+- Compatível com o uso antigo de nf.itens como lista: len(), for, [i], [a:b]
+- NCM/CFOP/subitem/chave CODIFICADOS (categoria: códigos inteiros + dicionário
+  compartilhado); descrição numa coluna à parte (Arrow, sem objetos str por item),
+  convertida para str só quando pedida
+"""
+from __future__ import annotations
+from dataclasses import fields, is_dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    _HAS_ARROW = True
+except Exception:
+    pa = pc = None
+    _HAS_ARROW = False
+
+from .models import Item as ItemModel
+
+COLUNAS_TEXTO = ("codigo", "descricao", "ncm", "cfop", "subitem_lc116")
+COLUNAS_NUMERICAS = ("quantidade", "valor_unitario", "valor_total")
+COLUNAS_FLAGS = ("nao_contrib",)
+COLUNAS = COLUNAS_TEXTO + COLUNAS_NUMERICAS + COLUNAS_FLAGS
+# Só mantidas se vierem no DataFrame (ex.: chave da nota em arquivos com várias notas,
+# CST/CSOSN do item no XML)
+COLUNAS_OPCIONAIS = ("chave", "cst")
+# Imposto declarado POR ITEM (NF-e XML): float, NaN = não declarado; só se vierem no DataFrame
+COLUNAS_DECLARADAS = ("decl_bc_icms", "decl_aliq_icms", "decl_icms", "decl_ipi", "decl_pis", "decl_cofins", "decl_iss")
+# Poucos valores distintos (centenas de NCMs, dezenas de CFOPs) → categoria
+COLUNAS_CODIFICADAS = ("ncm", "cfop", "subitem_lc116", "chave", "cst")
+COLUNA_DESCRICAO = "descricao"
+
+
+def codificada(s: pd.Series) -> bool:
+    return isinstance(s.dtype, pd.CategoricalDtype)
+
+
+def _categoria(valores) -> pd.Categorical:
+    if isinstance(valores, pd.Series) and codificada(valores):
+        return valores.array
+    return pd.Categorical(np.asarray(valores, dtype=object))
+
+
+class _Descricoes:
+    """Coluna de descrições fora do DataFrame: Arrow (texto contíguo) ou array object sem pyarrow."""
+
+    def __init__(self, valores=None):
+        if valores is None:
+            valores = []
+        if _HAS_ARROW:
+            if isinstance(valores, (pa.Array, pa.ChunkedArray)):
+                self._v = valores
+            else:
+                self._v = pa.array(np.asarray(valores, dtype=object), type=pa.string(), from_pandas=True)
+        else:
+            self._v = np.asarray(valores, dtype=object)
+
+    def __len__(self) -> int:
+        return len(self._v)
+
+    def take(self, idx) -> "_Descricoes":
+        idx = np.asarray(idx)
+        if _HAS_ARROW:
+            return _Descricoes(self._v.take(pa.array(idx, type=pa.int64())))
+        return _Descricoes(self._v[idx])
+
+    def filtrar(self, mascara) -> "_Descricoes":
+        m = np.asarray(mascara, dtype=bool)
+        return _Descricoes(self._v.filter(pa.array(m)) if _HAS_ARROW else self._v[m])
+
+    @staticmethod
+    def concat(partes: Sequence["_Descricoes"]) -> "_Descricoes":
+        if _HAS_ARROW:
+            chunks = [c for p in partes for c in (p._v.chunks if isinstance(p._v, pa.ChunkedArray) else [p._v])]
+            return _Descricoes(pa.chunked_array(chunks, type=pa.string()))
+        return _Descricoes(np.concatenate([p._v for p in partes]) if partes else None)
+
+    def serie(self, index: Optional[pd.Index] = None) -> pd.Series:
+        """Materializa as descrições como str (None → NaN, igual ao DataFrame)."""
+        v = self._v.to_numpy(zero_copy_only=False) if _HAS_ARROW else self._v
+        return pd.Series(v, index=index, dtype=object)
+
+    def contem(self, padroes: Sequence[str]) -> np.ndarray:
+        """Por linha: texto em maiúsculas contém algum padrão (sem criar str por item)."""
+        if not len(self._v):
+            return np.zeros(0, dtype=bool)
+        if _HAS_ARROW:
+            up = pc.utf8_upper(pc.fill_null(self._v.cast(pa.string()), "nan"))
+            out = np.zeros(len(self._v), dtype=bool)
+            for p in padroes:
+                out |= pc.match_substring(up, p).to_numpy(zero_copy_only=False)
+            return out
+        up = pd.Series(self._v).astype(str).str.upper()
+        out = np.zeros(len(up), dtype=bool)
+        for p in padroes:
+            out |= up.str.contains(p, regex=False).to_numpy()
+        return out
+
+
+def _campos_do_factory(factory: Callable[..., Any]) -> Optional[List[str]]:
+    """Campos aceitos pelo construtor do Item (dataclass ou pydantic)."""
+    if is_dataclass(factory):
+        return [f.name for f in fields(factory)]
+    model_fields = getattr(factory, "model_fields", None)
+    if isinstance(model_fields, dict):
+        return list(model_fields.keys())
+    return None
+
+
+def _normalizar(df: pd.DataFrame) -> pd.DataFrame:
+    """Garante todas as colunas canônicas com dtype estável (descrição fica de fora)."""
+    out = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    for c in COLUNAS_TEXTO:
+        if c == COLUNA_DESCRICAO:
+            continue
+        valores = df[c] if c in df.columns else pd.Series("", index=out.index)
+        if c in COLUNAS_CODIFICADAS:
+            out[c] = _categoria(valores)
+        else:
+            out[c] = valores.to_numpy(dtype=object)
+    for c in COLUNAS_NUMERICAS:
+        if c in df.columns:
+            out[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.0).to_numpy(dtype="float64")
+        else:
+            out[c] = 0.0
+    for c in COLUNAS_FLAGS:
+        if c in df.columns:
+            out[c] = df[c].fillna(False).to_numpy(dtype=bool)
+        else:
+            out[c] = False
+    for c in COLUNAS_OPCIONAIS:
+        if c in df.columns:
+            out[c] = _categoria(df[c]) if c in COLUNAS_CODIFICADAS else df[c].to_numpy(dtype=object)
+    for c in COLUNAS_DECLARADAS:
+        if c in df.columns:
+            out[c] = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype="float64")
+    return out
+
+
+class ItemTable:
+    """
+    Itens da nota em formato colunar.
+
+    Args:
+        df: DataFrame com as colunas canônicas (faltantes viram ""/0.0/False)
+        item_factory: classe usada para criar Item sob demanda
+    """
+
+    def __init__(self, df: Optional[pd.DataFrame] = None, item_factory: Optional[Callable[..., Any]] = None):
+        df = df if df is not None else pd.DataFrame()
+        self._df = _normalizar(df)
+        self._desc = _Descricoes(df[COLUNA_DESCRICAO].to_numpy(dtype=object) if COLUNA_DESCRICAO in df.columns
+                                 else np.full(len(df), "", dtype=object))
+        self._item_factory = item_factory or ItemModel
+        campos = _campos_do_factory(self._item_factory)
+        self._campos_item = [c for c in COLUNAS if campos is None or c in campos]
+
+    # ---------- construção ----------
+    @classmethod
+    def concat(cls, partes: Iterable["ItemTable"], item_factory: Optional[Callable[..., Any]] = None) -> "ItemTable":
+        partes = [p for p in partes if p is not None and len(p)]
+        if not partes:
+            return cls(item_factory=item_factory)
+        factory = item_factory or partes[0]._item_factory
+        colunas = {}
+        for c in partes[0]._df.columns:
+            if all(c in p._df.columns for p in partes):
+                if codificada(partes[0]._df[c]):
+                    # dicionários diferentes por chunk → união (pd.concat viraria object)
+                    colunas[c] = union_categoricals([p._df[c].array for p in partes])
+                else:
+                    colunas[c] = np.concatenate([p._df[c].to_numpy() for p in partes])
+        base = partes[0]._de_frame(pd.DataFrame(colunas), _Descricoes.concat([p._desc for p in partes]))
+        base._item_factory = factory
+        return base
+
+    # ---------- interface de lista ----------
+    def __len__(self) -> int:
+        return len(self._df)
+
+    def __bool__(self) -> bool:
+        return len(self._df) > 0
+
+    def __iter__(self) -> Iterator[Any]:
+        factory = self._item_factory
+        campos = self._campos_item
+        for vals in self.frame(campos).itertuples(index=False, name=None):
+            yield factory(**dict(zip(campos, vals)))
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return list(self._de_frame(self._df.iloc[idx], self._desc.take(np.arange(len(self))[idx])))
+        rec = self._de_frame(self._df.iloc[[idx]], self._desc.take([idx % len(self)])).frame(self._campos_item).iloc[0]
+        return self._item_factory(**{c: rec[c] for c in self._campos_item})
+
+    def __repr__(self) -> str:
+        return f"ItemTable({len(self):,} itens)"
+
+    # ---------- acesso colunar ----------
+    def coluna(self, nome: str) -> pd.Series:
+        if nome == COLUNA_DESCRICAO:
+            return self._desc.serie(self._df.index)
+        return self._df[nome]
+
+    def frame(self, colunas: Optional[Sequence[str]] = None, descricao: bool = True) -> pd.DataFrame:
+        """
+        DataFrame (somente leitura) com as colunas pedidas.
+        A descrição é convertida para str aqui; descricao=False devolve só as
+        colunas compactas, sem cópia.
+        """
+        if colunas is None:
+            if not descricao:
+                return self._df
+            colunas = list(COLUNAS_TEXTO) + [c for c in self._df.columns if c not in COLUNAS_TEXTO]
+        colunas = list(colunas)
+        if COLUNA_DESCRICAO not in colunas:
+            return self._df[colunas]
+        df = self._df[[c for c in colunas if c != COLUNA_DESCRICAO]].copy()
+        df[COLUNA_DESCRICAO] = self._desc.serie(self._df.index)
+        return df[colunas]
+
+    def tem_coluna(self, nome: str) -> bool:
+        return nome == COLUNA_DESCRICAO or nome in self._df.columns
+
+    def total(self, coluna: str = "valor_total") -> float:
+        return float(self._df[coluna].sum()) if len(self._df) else 0.0
+
+    def linhas_com_texto(self, padroes: Sequence[str], colunas: Sequence[str] = COLUNAS_TEXTO) -> np.ndarray:
+        """Por linha: algum campo texto (em maiúsculas) contém um dos padrões.
+        Colunas codificadas são testadas 1x por valor distinto, não por item."""
+        out = np.zeros(len(self._df), dtype=bool)
+        for c in colunas:
+            if c == COLUNA_DESCRICAO:
+                out |= self._desc.contem(padroes)
+                continue
+            s = self._df[c]
+            if codificada(s):
+                up = pd.Series(s.cat.categories.astype(str)).str.upper()
+                hit = np.zeros(len(up), dtype=bool)
+                for p in padroes:
+                    hit |= up.str.contains(p, regex=False).to_numpy()
+                codes = s.cat.codes.to_numpy()
+                # código -1 (vazio) aparece como "nan" no texto
+                out |= np.where(codes >= 0, hit[codes], "NAN" in padroes)
+            else:
+                up = s.astype(str).str.upper()
+                for p in padroes:
+                    out |= up.str.contains(p, regex=False).to_numpy()
+        return out
+
+    def contem_texto(self, padroes: Sequence[str], colunas: Sequence[str] = COLUNAS_TEXTO) -> bool:
+        """True se algum campo texto (em maiúsculas) contém um dos padrões."""
+        return bool(self.linhas_com_texto(padroes, colunas).any())
+
+    def to_dicts(self, colunas: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Registros para relatório/JSON sem criar objetos Item."""
+        cols = list(colunas) if colunas is not None else self._campos_item
+        return self.frame(cols).to_dict("records")
+
+    def filtrar(self, mascara) -> "ItemTable":
+        m = np.asarray(mascara, dtype=bool)
+        return self._de_frame(self._df[m].reset_index(drop=True), self._desc.filtrar(m))
+
+    def agrupar(self, coluna: str = "chave") -> Dict[Any, "ItemTable"]:
+        """Uma ItemTable por valor da coluna (ordem de 1ª aparição), num único groupby."""
+        if coluna not in self._df.columns or not len(self._df):
+            return {}
+        grupos = self._df.groupby(coluna, sort=False, observed=True).indices
+        return {k: self._de_frame(self._df.iloc[idx].reset_index(drop=True), self._desc.take(idx))
+                for k, idx in grupos.items()}
+
+    def _de_frame(self, df: pd.DataFrame, desc: "_Descricoes") -> "ItemTable":
+        # df já normalizado (fatia desta tabela): não repete _normalizar
+        novo = ItemTable.__new__(ItemTable)
+        novo._df = df
+        novo._desc = desc
+        novo._item_factory = self._item_factory
+        novo._campos_item = self._campos_item
+        return novo
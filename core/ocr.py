@@ -0,0 +1,475 @@
+# validador_fiscal/core/ocr.py
+"""
+SERVIÇO DE OCR (fotos de DANFE, cupons, TIFFs escaneados)
+- Pré-processamento antes do Tesseract: orientação EXIF, tons de cinza,
+  correção de inclinação (perfil de projeção) e escala para OCR_DPI_ALVO
+- Páginas/imagens em um pool de processos persistente: o OCR não roda no
+  processo do Streamlit e os processos ficam quentes entre uploads
+- Cache do texto em SQLite por hash do conteúdo do arquivo e por hash dos pixels
+  já pré-processados (mesma foto reenviada ou regravada sem perdas = zero OCR).
+  Hash perceptual NÃO é usado: notas do mesmo emitente têm o mesmo layout e
+  só diferem nos números
+"""
+from __future__ import annotations
+import atexit
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from .campos_texto import Campo, ScannerCampos
+
+try:
+    import pytesseract
+    _HAS_TESS = True
+except Exception:
+    pytesseract = None
+    _HAS_TESS = False
+
+# 0 = um processo por núcleo; 1 = OCR no processo atual
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))
+OCR_LANG = os.getenv("OCR_LANG", "por")
+OCR_CONFIG = os.getenv("OCR_CONFIG", "")
+OCR_DPI_ALVO = int(os.getenv("OCR_DPI_ALVO", "300"))
+# sem DPI no arquivo (fotos): supõe página com esta largura em polegadas (A4)
+OCR_LARGURA_POL = float(os.getenv("OCR_LARGURA_POL", "8.27"))
+OCR_DESKEW = os.getenv("OCR_DESKEW", "1") != "0"
+OCR_DESKEW_MAX_GRAUS = float(os.getenv("OCR_DESKEW_MAX_GRAUS", "5"))
+OCR_CACHE_DB = os.getenv("OCR_CACHE_DB", "data/cache/ocr.sqlite")
+USAR_CACHE_OCR = os.getenv("OCR_CACHE", "1") != "0"
+
+# OCR adaptativo: passe rápido primeiro; campo ausente/duvidoso sobe de passe
+OCR_CONF_MIN = float(os.getenv("OCR_CONF_MIN", "70"))
+OCR_RAPIDO_DPI = int(os.getenv("OCR_RAPIDO_DPI", "200"))
+OCR_RAPIDO_PSM = os.getenv("OCR_RAPIDO_PSM", "6")
+
+# MUDE ao alterar o pré-processamento (entra na chave do cache)
+_VERSAO_PREPROC = "prep-1"
+_BLOCO = 4 * 1024 * 1024
+_LADO_DESKEW = 1000  # px da amostra usada para medir a inclinação
+_versao_tesseract: Optional[str] = None
+
+
+def _versao() -> str:
+    """Tudo que muda o texto reconhecido: pré-processamento, idioma, config e Tesseract."""
+    global _versao_tesseract
+    if _versao_tesseract is None:
+        try:
+            _versao_tesseract = str(pytesseract.get_tesseract_version())
+        except Exception:
+            _versao_tesseract = "?"
+    return (f"{_VERSAO_PREPROC}|{OCR_LANG}|{OCR_CONFIG}|{OCR_DPI_ALVO}|{OCR_LARGURA_POL}|"
+            f"{OCR_DESKEW}:{OCR_DESKEW_MAX_GRAUS}|tesseract-{_versao_tesseract}")
+
+
+# =========================
+# Pré-processamento
+# =========================
+def _limiar_otsu(a: np.ndarray) -> int:
+    hist = np.bincount(a.ravel(), minlength=256).astype(np.float64)
+    peso = np.cumsum(hist)
+    media = np.cumsum(hist * np.arange(256))
+    total, soma = peso[-1], media[-1]
+    fundo = total - peso
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entre = (soma * peso - media * total) ** 2 / (peso * fundo)
+    return int(np.nanargmax(entre[:-1]))
+
+
+def angulo_inclinacao(cinza: Image.Image, max_graus: float = OCR_DESKEW_MAX_GRAUS) -> float:
+    """
+    Ângulo (graus, anti-horário) que endireita o texto: o giro em que as linhas
+    de texto ficam mais nítidas no perfil horizontal de tinta. Grosso (1°) e fino (0,1°).
+    """
+    amostra = cinza.copy()
+    amostra.thumbnail((_LADO_DESKEW, _LADO_DESKEW))
+    a = np.asarray(amostra, dtype=np.uint8)
+    tinta = Image.fromarray(np.where(a < _limiar_otsu(a), 255, 0).astype(np.uint8))
+
+    def nitidez(graus: float) -> float:
+        perfil = np.asarray(tinta.rotate(graus, resample=Image.NEAREST, fillcolor=0)).sum(axis=1, dtype=np.int64)
+        return float(np.square(np.diff(perfil)).sum())
+
+    grosso = max(np.arange(-max_graus, max_graus + 0.5, 1.0), key=nitidez)
+    fino = max(np.arange(grosso - 1.0, grosso + 1.05, 0.1), key=nitidez)
+    return round(float(fino), 1)
+
+
+def preprocessar(img: Image.Image) -> Image.Image:
+    """Imagem pronta para o Tesseract: cinza, endireitada e em OCR_DPI_ALVO."""
+    dpi = img.info.get("dpi")
+    img = ImageOps.exif_transpose(img).convert("L")
+    if dpi and float(dpi[0] or 0) > 1:
+        escala = OCR_DPI_ALVO / float(dpi[0])
+    else:
+        escala = OCR_DPI_ALVO * OCR_LARGURA_POL / img.width
+    escala = min(4.0, max(0.25, escala))
+    if abs(escala - 1.0) > 0.1:
+        img = img.resize((max(1, round(img.width * escala)), max(1, round(img.height * escala))),
+                         Image.LANCZOS)
+    if OCR_DESKEW:
+        graus = angulo_inclinacao(img)
+        if abs(graus) >= 0.2:
+            img = img.rotate(graus, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return img
+
+
+# =========================
+# Cache (SQLite)
+# =========================
+class CacheOCR:
+    """Texto reconhecido por chave (hash do arquivo + página, ou hash dos pixels)."""
+
+    def __init__(self, path: str = OCR_CACHE_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._con = sqlite3.connect(path, timeout=30)
+        self._con.execute("CREATE TABLE IF NOT EXISTS ocr (chave TEXT PRIMARY KEY, texto TEXT, usado REAL)")
+        self._con.commit()
+
+    def obter(self, chave: str) -> Optional[str]:
+        row = self._con.execute("SELECT texto FROM ocr WHERE chave = ?", (chave,)).fetchone()
+        if row is None:
+            return None
+        with self._con:
+            self._con.execute("UPDATE ocr SET usado = ? WHERE chave = ?", (time.time(), chave))
+        return row[0]
+
+    def gravar(self, chaves: Sequence[str], texto: str) -> None:
+        agora = time.time()
+        with self._con:
+            self._con.executemany("INSERT OR REPLACE INTO ocr (chave, texto, usado) VALUES (?, ?, ?)",
+                                  [(c, texto, agora) for c in chaves])
+
+    def fechar(self) -> None:
+        self._con.close()
+
+
+def _hash(*partes: bytes) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    for p in partes:
+        h.update(p)
+    return h.hexdigest()
+
+
+def hash_arquivo(path: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(_BLOCO), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+# =========================
+# OCR (processo do pool)
+# =========================
+def _abrir_pronta(path: str, quadro: int) -> Image.Image:
+    with Image.open(path) as img:
+        if quadro:
+            img.seek(quadro)
+        return preprocessar(img)
+
+
+def _ocr_imagem(pronta: Image.Image, versao: str, usar_cache: bool) -> Tuple[str, str]:
+    """(hash dos pixels pré-processados, texto); pixels já vistos saem do cache."""
+    chave = "px:" + _hash(versao.encode("utf-8"), f"{pronta.size}".encode(), pronta.tobytes())
+    cache = CacheOCR() if usar_cache else None
+    try:
+        texto = cache.obter(chave) if cache else None
+        if texto is None:
+            config = f"--dpi {OCR_DPI_ALVO} {OCR_CONFIG}".strip()
+            texto = pytesseract.image_to_string(pronta, lang=OCR_LANG, config=config)
+        return chave, texto
+    finally:
+        if cache is not None:
+            cache.fechar()
+
+
+def _ocr_pagina(path: str, quadro: int, versao: str, usar_cache: bool) -> Tuple[str, str]:
+    """(hash dos pixels pré-processados, texto) de uma página/quadro da imagem."""
+    return _ocr_imagem(_abrir_pronta(path, quadro), versao, usar_cache)
+
+
+def _ocr_pagina_pdf(path: str, pagina: int) -> str:
+    """Página de PDF escaneada: rasterizada em OCR_DPI_ALVO e reconhecida."""
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        img = pdf.pages[pagina].to_image(resolution=OCR_DPI_ALVO).original
+    img.info["dpi"] = (OCR_DPI_ALVO, OCR_DPI_ALVO)
+    return _ocr_imagem(preprocessar(img), _versao(), False)[1]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_trava_pool = threading.Lock()
+
+
+def _executor() -> Tuple[Optional[ProcessPoolExecutor], int]:
+    """Pool persistente (criado no 1º uso, encerrado na saída do processo)."""
+    global _pool, _pool_workers
+    n = max(1, OCR_WORKERS or os.cpu_count() or 1)
+    if n == 1:
+        return None, 1
+    with _trava_pool:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=n)
+            _pool_workers = n
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool, _pool_workers
+
+
+def _descartar_pool() -> None:
+    """Processo do pool morreu (memória, sinal): o próximo OCR cria outro pool."""
+    global _pool
+    with _trava_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _quadros(path: str) -> int:
+    with Image.open(path) as img:
+        return getattr(img, "n_frames", 1)
+
+
+def ocr_paginas(paths: Sequence[str]) -> List[List[str]]:
+    """
+    Texto de cada página (quadros de TIFF multipágina) de cada imagem, na ordem de `paths`.
+    Só vai ao Tesseract o que não está no cache; o resto é distribuído no pool.
+    """
+    if not _HAS_TESS:
+        raise RuntimeError("OCR de imagem requer Tesseract (pytesseract) instalado.")
+    versao = _versao()
+    cache = CacheOCR() if USAR_CACHE_OCR else None
+    try:
+        textos: List[List[Optional[str]]] = []
+        faltando: List[Tuple[int, int, str, str]] = []  # (imagem, quadro, path, chave do arquivo)
+        for i, path in enumerate(paths):
+            h = hash_arquivo(path)
+            paginas: List[Optional[str]] = []
+            for q in range(_quadros(path)):
+                chave = "arq:" + _hash(versao.encode("utf-8"), h.encode(), b":%d" % q)
+                texto = cache.obter(chave) if cache else None
+                if texto is None:
+                    faltando.append((i, q, path, chave))
+                paginas.append(texto)
+            textos.append(paginas)
+        total = sum(len(p) for p in textos)
+        if total > len(faltando):
+            print(f"   📦 Cache de OCR: {total - len(faltando)}/{total} páginas já reconhecidas")
+
+        pool, n = _executor() if faltando else (None, 1)
+        if pool is not None:
+            if len(faltando) > 1:
+                print(f"   ⚙️  OCR: {len(faltando)} páginas em {n} processos")
+            try:
+                futuros = [pool.submit(_ocr_pagina, path, q, versao, cache is not None) for _, q, path, _ in faltando]
+                resultados = [f.result() for f in futuros]
+            except BrokenProcessPool:
+                _descartar_pool()
+                raise
+        else:
+            resultados = (_ocr_pagina(path, q, versao, cache is not None) for _, q, path, _ in faltando)
+        for (i, q, _, chave_arq), (chave_px, texto) in zip(faltando, resultados):
+            textos[i][q] = texto
+            if cache is not None:
+                cache.gravar((chave_arq, chave_px), texto)
+        return textos
+    finally:
+        if cache is not None:
+            cache.fechar()
+
+
+def submeter_pagina_pdf(path: str, pagina: int) -> Future:
+    """OCR de uma página de PDF no pool (Future com o texto); sem pool, já resolvido."""
+    if not _HAS_TESS:
+        raise RuntimeError("OCR de imagem requer Tesseract (pytesseract) instalado.")
+    pool, _ = _executor()
+    if pool is not None:
+        try:
+            return pool.submit(_ocr_pagina_pdf, path, pagina)
+        except BrokenProcessPool:
+            _descartar_pool()
+            raise
+    fut: Future = Future()
+    try:
+        fut.set_result(_ocr_pagina_pdf(path, pagina))
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
+
+
+def texto_ocr(path: str) -> str:
+    """Texto reconhecido da imagem (páginas separadas por quebra de linha)."""
+    return "\n".join(ocr_paginas([path])[0])
+
+
+# =========================
+# OCR adaptativo por campo
+# =========================
+@dataclass
+class LeituraOCR:
+    texto: str  # texto do passe mais completo executado
+    campos: Dict[str, str] = field(default_factory=dict)
+    valores: Dict[str, List[str]] = field(default_factory=dict)  # todas as ocorrências guardadas do campo
+    confianca: Dict[str, float] = field(default_factory=dict)  # 0-100 (100 = validado)
+    passes: List[str] = field(default_factory=list)
+
+
+# (nome, DPI, config, binarizar): do mais barato ao mais caro
+def _passes() -> List[Tuple[str, int, str, bool]]:
+    return [
+        ("rapido", OCR_RAPIDO_DPI, f"--psm {OCR_RAPIDO_PSM}", False),
+        ("completo", OCR_DPI_ALVO, "--psm 3", False),
+        ("reforcado", round(OCR_DPI_ALVO * 1.5), "--psm 4", True),
+    ]
+
+
+Palavra = Tuple[int, int, float, Tuple[int, int, int, int]]  # início, fim no texto, confiança, caixa
+
+
+def _ler_palavras(img: Image.Image, dpi: int, config: str) -> Tuple[str, List[Palavra]]:
+    """Texto (palavras por linha) + posição e confiança de cada palavra."""
+    d = pytesseract.image_to_data(img, lang=OCR_LANG, config=f"--dpi {dpi} {config} {OCR_CONFIG}".strip(),
+                                  output_type=pytesseract.Output.DICT)
+    partes: List[str] = []
+    palavras: List[Palavra] = []
+    pos, linha_ant = 0, None
+    for i, txt in enumerate(d["text"]):
+        txt = (txt or "").strip()
+        if not txt:
+            continue
+        linha = (d["block_num"][i], d["par_num"][i], d["line_num"][i])
+        if linha_ant is not None:
+            partes.append(" " if linha == linha_ant else "\n")
+            pos += 1
+        linha_ant = linha
+        caixa = (d["left"][i], d["top"][i], d["width"][i], d["height"][i])
+        palavras.append((pos, pos + len(txt), float(d["conf"][i]), caixa))
+        partes.append(txt)
+        pos += len(txt)
+    return "".join(partes), palavras
+
+
+def _confianca(palavras: List[Palavra], inicio: int, fim: int) -> float:
+    confs = [c for a, b, c, _ in palavras if a < fim and b > inicio]
+    return min(confs) if confs else 0.0
+
+
+def _recorte_rotulo(campo: Campo, texto: str, palavras: List[Palavra],
+                    base: Image.Image, fator: float) -> Optional[Image.Image]:
+    """Faixa logo abaixo do rótulo, recortada da imagem base (fator = base / imagem lida)."""
+    m = re.search(campo.rotulo, texto, re.IGNORECASE)
+    caixas = [cx for a, b, _, cx in palavras if m and a < m.end() and b > m.start()]
+    if not caixas:
+        return None
+    esq = min(x for x, _, _, _ in caixas)
+    topo = min(y for _, y, _, _ in caixas)
+    alt = max(y + h for _, y, _, h in caixas) - topo
+    return base.crop((max(0, round((esq - 2 * alt) * fator)), round((topo + 0.8 * alt) * fator),
+                      base.width, min(base.height, round((topo + 4 * alt) * fator))))
+
+
+def _ler_digitos(recorte: Image.Image, n: int) -> Optional[Tuple[str, float]]:
+    texto, palavras = _ler_palavras(recorte, OCR_DPI_ALVO, "--psm 6 -c tessedit_char_whitelist=0123456789")
+    m = re.search(r"\d{%d}" % n, re.sub(r"\s+", "", texto))
+    if not m:
+        return None
+    return m.group(0), (sum(c for _, _, c, _ in palavras) / len(palavras) if palavras else 0.0)
+
+
+def _adaptativo_pagina(path: str, quadro: int, scanner: ScannerCampos) -> LeituraOCR:
+    """Executado no processo do pool: passes em ordem de custo até todos os campos serem confiáveis."""
+    base = _abrir_pronta(path, quadro)
+    leitura = LeituraOCR(texto="")
+
+    def aceitar(nome: str, valores: List[str], confianca: float) -> None:
+        if valores and confianca > leitura.confianca.get(nome, -1.0):
+            leitura.campos[nome], leitura.valores[nome], leitura.confianca[nome] = valores[0], valores, confianca
+
+    def pendentes() -> List[str]:
+        return [n for n in scanner.campos if leitura.confianca.get(n, -1.0) < OCR_CONF_MIN]
+
+    for nome_passe, dpi, config, binarizar in _passes():
+        escala = dpi / OCR_DPI_ALVO
+        img = base if abs(escala - 1.0) < 0.01 else base.resize(
+            (max(1, round(base.width * escala)), max(1, round(base.height * escala))), Image.LANCZOS)
+        if binarizar:
+            a = np.asarray(img, dtype=np.uint8)
+            img = Image.fromarray(np.where(a < _limiar_otsu(a), 0, 255).astype(np.uint8))
+        texto, palavras = _ler_palavras(img, dpi, config)
+        leitura.texto = texto
+        leitura.passes.append(nome_passe)
+        achados = scanner.varrer(texto, so=pendentes(),
+                                 confianca_span=lambda a, b: _confianca(palavras, a, b))
+        for nome, achado in achados.items():
+            aceitar(nome, achado.valores, achado.confianca)
+        # campo de dígitos ainda duvidoso: só a faixa do rótulo, em resolução cheia e só dígitos
+        for nome in pendentes():
+            c = scanner.campos[nome]
+            if c.digitos and c.rotulo:
+                recorte = _recorte_rotulo(c, texto, palavras, base, 1.0 / escala)
+                achado = _ler_digitos(recorte, c.digitos) if recorte is not None else None
+                if achado and c.validar is not None:
+                    achado = (achado[0], 100.0 if c.validar(achado[0]) else 0.0)
+                if achado:
+                    aceitar(nome, [achado[0]], achado[1])
+                    leitura.passes.append(f"{nome_passe}:{nome}")
+        if not pendentes():
+            break
+    return leitura
+
+
+def ocr_adaptativo(path: str, scanner: ScannerCampos) -> LeituraOCR:
+    """
+    OCR da imagem por escalonamento: passe rápido (PSM restrito, resolução menor) e,
+    só para os campos que não casaram ou ficaram com confiança < OCR_CONF_MIN, passes
+    mais lentos (página inteira em OCR_DPI_ALVO; depois binarizada e ampliada).
+    Páginas de TIFF multipágina no pool; cada campo vem da 1ª página em que foi lido.
+    """
+    if not _HAS_TESS:
+        raise RuntimeError("OCR de imagem requer Tesseract (pytesseract) instalado.")
+    versao = f"{_versao()}|{OCR_CONF_MIN}|{_passes()}|{scanner.assinatura()}"
+    h = hash_arquivo(path)
+    cache = CacheOCR() if USAR_CACHE_OCR else None
+    try:
+        chave = "ad:" + _hash(versao.encode("utf-8"), h.encode())
+        guardada = cache.obter(chave) if cache else None
+        if guardada is not None:
+            print("   📦 Cache de OCR: leitura já feita")
+            return LeituraOCR(**json.loads(guardada))
+
+        quadros = _quadros(path)
+        pool, _ = _executor()
+        if pool is not None:
+            try:
+                paginas = [f.result() for f in [pool.submit(_adaptativo_pagina, path, q, scanner)
+                                                for q in range(quadros)]]
+            except BrokenProcessPool:
+                _descartar_pool()
+                raise
+        else:
+            paginas = [_adaptativo_pagina(path, q, scanner) for q in range(quadros)]
+
+        leitura = LeituraOCR(texto="\n".join(p.texto for p in paginas))
+        for p in paginas:
+            for nome, valor in p.campos.items():
+                if p.confianca[nome] > leitura.confianca.get(nome, -1.0):
+                    leitura.campos[nome], leitura.confianca[nome] = valor, p.confianca[nome]
+                    leitura.valores[nome] = p.valores.get(nome, [valor])
+            leitura.passes.extend(p.passes)
+        if cache is not None:
+            cache.gravar((chave,), json.dumps(asdict(leitura), ensure_ascii=False))
+        return leitura
+    finally:
+        if cache is not None:
+            cache.fechar()
@@ -1,9 +1,5 @@
 import os
-import io
 import pandas as pd
-import pdfplumber
-from lxml import etree
-from PIL import Image
 
 # OCR opcional
 try:
@@ -14,18 +10,23 @@ except Exception:
     _HAS_TESS = False
 
 fromcore.models import NotaFiscal, Item, Declarados
+from .column_aliases import compilar_plano
+from .csv_sniff import detectar_csv
+from .compactados import abrir
+from .ocr import texto_ocr
+from .pdf_paginas import iter_paginas
+from .xml_stream import COLUNAS_DET, NS, eventos_nfe, extrair_det
 
 # ---------------- CSV universal (encoding + separador) ----------------
 def _read_csv_smart(path):
-    encs = ["utf-8", "utf-8-sig", "latin1", "cp1252", "iso-8859-1"]
-    for enc in encs:
-        try:
-            return pd.read_csv(path, encoding=enc, sep=None, engine="python", dtype=str)
-        except Exception:
-            pass
-    with open(path, "rb") as f:
-        data = f.read().decode("latin1", "replace")
-    return pd.read_csv(io.StringIO(data), sep=None, engine="python", dtype=str)
+    cfg = detectar_csv(path)
+    try:
+        with abrir(path) as f:
+            return pd.read_csv(f, encoding=cfg["encoding"], sep=cfg["sep"], engine="python", dtype=str)
+    except UnicodeDecodeError:
+        # byte inválido fora das amostras: latin-1 decodifica qualquer byte (1 releitura só)
+        with abrir(path) as f:
+            return pd.read_csv(f, encoding="latin-1", sep=cfg["sep"], engine="python", dtype=str)
 
 def _tf_from_df(df, col):
     try:
@@ -33,8 +34,7 @@ def _tf_from_df(df, col):
     except Exception:
         return None
 
-def _tf_xml_val(root, xpath, ns):
-    v = root.findtext(xpath, namespaces=ns)
+def _tf_str(v):
     try:
         return float(v) if v else None
     except Exception:
@@ -43,17 +43,19 @@ def _tf_xml_val(root, xpath, ns):
 # ---------------- CSV → NotaFiscal ----------------
 def parse_csv(nf_csv_path: str) -> NotaFiscal:
     df = _read_csv_smart(nf_csv_path)
+    plano = compilar_plano(df.columns)
+    v = plano.valor
     itens = []
-    for i, r in df.iterrows():
+    for i, *r in df.itertuples(index=True, name=None):
         itens.append(Item(
-            codigo=str(r.get('codigo') or r.get('cod') or r.get('item') or i),
-            descricao=str(r.get('descricao') or ''),
-            ncm=str(r.get('ncm') or ''),
-            cfop=str(r.get('cfop') or ''),
-            subitem_lc116=str(r.get('subitem_lc116') or ''),
-            quantidade=float(r.get('qtd') or r.get('quantidade') or 1),
-            valor_unitario=float(r.get('vl_unit') or r.get('valor_unitario') or 0),
-            valor_total=float(r.get('vl_total') or r.get('valor_total') or 0),
+            codigo=str(v(r, 'codigo') or v(r, 'n_item') or i),
+            descricao=str(v(r, 'descricao') or ''),
+            ncm=str(v(r, 'ncm') or ''),
+            cfop=str(v(r, 'cfop') or ''),
+            subitem_lc116=str(v(r, 'subitem_lc116') or ''),
+            quantidade=float(v(r, 'quantidade') or 1),
+            valor_unitario=float(v(r, 'valor_unitario') or 0),
+            valor_total=float(v(r, 'valor_total') or 0),
         ))
     muni = str(df.get('cod_ibge_municipio_iss')[0]) if 'cod_ibge_municipio_iss' in df.columns else None
     d = Declarados(
@@ -68,46 +70,56 @@ def parse_csv(nf_csv_path: str) -> NotaFiscal:
     return NotaFiscal(itens=itens, declarados=d, municipio_iss_ibge=muni)
 
 # ---------------- XML → NotaFiscal ----------------
+# imposto declarado → coluna do extrator de det (valor do primeiro det que declara)
+_DECLARADOS_XML = {
+    'icms': 'decl_icms',
+    'ipi': 'decl_ipi',
+    'pis': 'decl_pis',
+    'cofins': 'decl_cofins',
+    'iss': 'decl_iss',
+}
+_POS_DET = {c: i for i, c in enumerate(COLUNAS_DET)}
+
 def parse_xml(nfe_xml_path: str) -> NotaFiscal:
-    parser = etree.XMLParser(recover=True, encoding='utf-8')
-    root = etree.parse(nfe_xml_path, parser)
-    ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
-    numero = root.findtext('.//nfe:ide/nfe:nNF', namespaces=ns) or ""
+    # iterparse: cada det é lido e descartado (primeira NFe do arquivo)
+    numero = ""
     itens = []
-    for det in root.findall('.//nfe:det', namespaces=ns):
-        prod = det.find('nfe:prod', namespaces=ns)
-        if prod is None:
-            continue
-        itens.append(Item(
-            codigo=prod.findtext('nfe:cProd', namespaces=ns) or '',
-            descricao=prod.findtext('nfe:xProd', namespaces=ns) or '',
-            ncm=prod.findtext('nfe:NCM', namespaces=ns) or '',
-            cfop=prod.findtext('nfe:CFOP', namespaces=ns) or '',
-            quantidade=float(prod.findtext('nfe:qCom', namespaces=ns) or 1),
-            valor_unitario=float(prod.findtext('nfe:vUnCom', namespaces=ns) or 0),
-            valor_total=float(prod.findtext('nfe:vProd', namespaces=ns) or 0),
-        ))
-    d = Declarados(
-        icms=_tf_xml_val(root, './/nfe:ICMS//nfe:vICMS', ns),
-        ipi=_tf_xml_val(root, './/nfe:IPI//nfe:vIPI', ns),
-        pis=_tf_xml_val(root, './/nfe:PIS//nfe:vPIS', ns),
-        cofins=_tf_xml_val(root, './/nfe:COFINS//nfe:vCOFINS', ns),
-        iss=_tf_xml_val(root, './/nfe:ISSQN//nfe:vISSQN', ns),
-    )
+    declarados = {}
+    for evento, el in eventos_nfe(nfe_xml_path):
+        if evento == 'ide' and not numero:
+            numero = el.findtext('nfe:nNF', namespaces=NS) or ""
+        elif evento == 'det':
+            v = extrair_det(el)
+            if v is None:
+                continue
+            for campo, coluna in _DECLARADOS_XML.items():
+                if campo not in declarados:
+                    valor = _tf_str(v[_POS_DET[coluna]])
+                    if valor is not None:
+                        declarados[campo] = valor
+            itens.append(Item(
+                codigo=v[_POS_DET['codigo']],
+                descricao=v[_POS_DET['descricao']],
+                ncm=v[_POS_DET['ncm']],
+                cfop=v[_POS_DET['cfop']],
+                quantidade=float(v[_POS_DET['quantidade']] or 1),
+                valor_unitario=float(v[_POS_DET['valor_unitario']] or 0),
+                valor_total=float(v[_POS_DET['valor_total']] or 0),
+            ))
+        elif evento == 'nfe':
+            break
+    d = Declarados(**{campo: declarados.get(campo) for campo in _DECLARADOS_XML})
     return NotaFiscal(numero=numero, itens=itens, declarados=d)
 
 # ---------------- PDF/Imagem → OCR ----------------
 def parse_pdf_or_image(path: str) -> NotaFiscal:
-    if not _HAS_TESS:
-        raise RuntimeError("OCR de imagem requer Tesseract instalado e configurado.")
     ext = os.path.splitext(path)[1].lower()
     if ext == '.pdf':
-        text = ''
-        with pdfplumber.open(path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() or ''
+        # OCR só nas páginas escaneadas (ver pdf_paginas); PDF com texto não exige Tesseract
+        text = ''.join(t for _, t in iter_paginas(path))
     else:
-        img = Image.open(path)
-        text = pytesseract.image_to_string(img, lang='por')
+        if not _HAS_TESS:
+            raise RuntimeError("OCR de imagem requer Tesseract instalado e configurado.")
+        text = texto_ocr(path)
     # Heurística mínima – item único, valor será checado por auditor posteriormente
     return NotaFiscal(itens=[Item(codigo='OCR', descricao='Documento OCR', valor_total=0.0)])
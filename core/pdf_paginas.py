@@ -0,0 +1,217 @@
+# validador_fiscal/core/pdf_paginas.py
+"""
+Texto de PDF PÁGINA A PÁGINA (DANFEs e notas de serviço com centenas de páginas)
+- Páginas extraídas num pool de processos (faixas de páginas por tarefa)
+- Entregues EM ORDEM assim que ficam prontas: a 1ª página sai sozinha na frente,
+  para o cabeçalho ser lido enquanto as páginas de itens ainda estão no pool
+- Cache do texto por (hash do arquivo, nº da página) em SQLite: reenvio do mesmo
+  PDF não abre o pdfplumber
+- PDFs pequenos ficam no processo atual (criar o pool custaria mais que extrair)
+- Roteamento POR PÁGINA: página com camada de texto utilizável sai do pdfplumber;
+  página só de imagem (escaneada) ou com fonte sem mapa (cid:) é rasterizada e vai
+  para o pool de OCR (core/ocr). PDF misto só paga OCR nas páginas escaneadas;
+  a decisão e o texto ficam no cache
+"""
+from __future__ import annotations
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import ocr
+
+try:
+    import pdfplumber
+    _HAS_PDFPLUMBER = True
+except Exception:
+    pdfplumber = None
+    _HAS_PDFPLUMBER = False
+
+# 0 = um processo por núcleo
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0"))
+PDF_PAGINAS_POR_TAREFA = int(os.getenv("PDF_PAGINAS_POR_TAREFA", "8"))
+# abaixo disso extrai no processo atual
+PDF_PARALELO_MIN_PAGINAS = int(os.getenv("PDF_PARALELO_MIN_PAGINAS", "12"))
+PDF_CACHE_DB = os.getenv("PDF_CACHE_DB", "data/cache/pdf_paginas.sqlite")
+USAR_CACHE_PDF = os.getenv("PDF_CACHE", "1") != "0"
+# camada de texto com menos caracteres legíveis que isso = página escaneada
+PDF_TEXTO_MIN_CARACTERES = int(os.getenv("PDF_TEXTO_MIN_CARACTERES", "25"))
+
+# muda o texto extraído → muda a chave do cache (páginas por OCR: versão do OCR também)
+_VERSAO_EXTRACAO = f"pdfplumber-{getattr(pdfplumber, '__version__', '?')}"
+_BLOCO = 4 * 1024 * 1024
+
+
+def hash_pdf(path: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(_BLOCO), b""):
+            h.update(bloco)
+    h.update(b"\x00" + f"{_VERSAO_EXTRACAO}|{ocr._versao()}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class CachePaginas:
+    """Texto e origem ("texto" | "ocr") por (hash do PDF, página) + nº de páginas de cada PDF."""
+
+    def __init__(self, path: str = PDF_CACHE_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._con = sqlite3.connect(path)
+        self._con.execute("CREATE TABLE IF NOT EXISTS pdfs (hash TEXT PRIMARY KEY, paginas INTEGER, usado REAL)")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS paginas ("
+            " hash TEXT, pagina INTEGER, texto TEXT, origem TEXT DEFAULT 'texto', PRIMARY KEY (hash, pagina))"
+        )
+        if "origem" not in {r[1] for r in self._con.execute("PRAGMA table_info(paginas)")}:
+            self._con.execute("ALTER TABLE paginas ADD COLUMN origem TEXT DEFAULT 'texto'")
+        self._con.commit()
+
+    def total_paginas(self, h: str) -> Optional[int]:
+        row = self._con.execute("SELECT paginas FROM pdfs WHERE hash = ?", (h,)).fetchone()
+        return row[0] if row else None
+
+    def paginas(self, h: str) -> Dict[int, str]:
+        with self._con:
+            self._con.execute("UPDATE pdfs SET usado = ? WHERE hash = ?", (time.time(), h))
+        return dict(self._con.execute("SELECT pagina, texto FROM paginas WHERE hash = ?", (h,)))
+
+    def gravar(self, h: str, total: int, paginas: List[Tuple[int, str, str]]) -> None:
+        with self._con:
+            self._con.execute("INSERT OR REPLACE INTO pdfs (hash, paginas, usado) VALUES (?, ?, ?)",
+                              (h, total, time.time()))
+            self._con.executemany(
+                "INSERT OR REPLACE INTO paginas (hash, pagina, texto, origem) VALUES (?, ?, ?, ?)",
+                [(h, n, t, o) for n, t, o in paginas],
+            )
+
+    def fechar(self) -> None:
+        self._con.close()
+
+
+def texto_utilizavel(texto: str) -> bool:
+    """Camada de texto que vale a pena usar: caracteres suficientes e poucos glifos sem mapa."""
+    visiveis = len(texto) - sum(c.isspace() for c in texto)
+    ilegiveis = 6 * texto.count("(cid:") + texto.count("\ufffd")
+    return visiveis - ilegiveis >= PDF_TEXTO_MIN_CARACTERES and ilegiveis <= 0.3 * visiveis
+
+
+def _origem(pagina, texto: str) -> str:
+    """"texto" ou "ocr": sem texto utilizável, OCR só se houver o que rasterizar."""
+    if texto_utilizavel(texto):
+        return "texto"
+    return "ocr" if (pagina.images or "(cid:" in texto) else "texto"
+
+
+def _extrair(pdf, numeros: List[int]) -> Iterator[Tuple[int, str, str]]:
+    for n in numeros:
+        pagina = pdf.pages[n]
+        texto = pagina.extract_text() or ""
+        yield n, texto, _origem(pagina, texto)
+        pagina.close()  # libera o cache de objetos da página
+
+
+def _extrair_faixa(path: str, numeros: List[int]) -> List[Tuple[int, str, str]]:
+    """Executado no processo do pool: (página, texto, origem) das páginas pedidas (0-based)."""
+    with pdfplumber.open(path) as pdf:
+        return list(_extrair(pdf, numeros))
+
+
+def _tarefas(faltando: List[int], por_tarefa: int) -> List[List[int]]:
+    """1ª página faltante sozinha (cabeçalho sai logo); o resto em faixas."""
+    if not faltando:
+        return []
+    resto = faltando[1:]
+    return [faltando[:1]] + [resto[i:i + por_tarefa] for i in range(0, len(resto), por_tarefa)]
+
+
+def iter_paginas(path: str, workers: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """(página 0-based, texto) EM ORDEM, cada uma assim que estiver pronta."""
+    if not _HAS_PDFPLUMBER:
+        raise RuntimeError("pdfplumber não instalado")
+    cache = CachePaginas() if USAR_CACHE_PDF else None
+    pdf = None
+    try:
+        h = hash_pdf(path) if cache else ""
+        total = cache.total_paginas(h) if cache else None
+        prontas: Dict[int, str] = cache.paginas(h) if total is not None else {}
+        if total is None:
+            pdf = pdfplumber.open(path)
+            total = len(pdf.pages)
+        faltando = [n for n in range(total) if n not in prontas]
+        if prontas:
+            print(f"   📦 Cache de páginas: {total - len(faltando)}/{total} páginas já extraídas")
+
+        novas: List[Tuple[int, str, str]] = []
+        ocr_pendentes: Dict[int, Future] = {}
+        sem_ocr = 0
+        proxima = 0
+
+        def _receber(pagina: Tuple[int, str, str]) -> None:
+            nonlocal sem_ocr
+            num, texto, origem = pagina
+            if origem == "ocr" and ocr._HAS_TESS:
+                ocr_pendentes[num] = ocr.submeter_pagina_pdf(path, num)
+                return
+            prontas[num] = texto
+            if origem == "ocr":
+                sem_ocr += 1  # sem Tesseract: fica a camada de texto, fora do cache
+            else:
+                novas.append(pagina)
+
+        def _em_ordem(esperar_ocr: bool = False) -> Iterator[Tuple[int, str]]:
+            nonlocal proxima
+            while proxima < total:
+                if proxima in prontas:
+                    yield proxima, prontas.pop(proxima)
+                else:
+                    fut = ocr_pendentes.get(proxima)
+                    if fut is None or not (esperar_ocr or fut.done()):
+                        return
+                    texto = fut.result()
+                    del ocr_pendentes[proxima]
+                    novas.append((proxima, texto, "ocr"))
+                    yield proxima, texto
+                proxima += 1
+
+        n = workers if workers is not None else PDF_WORKERS
+        n = max(1, n or os.cpu_count() or 1)
+        yield from _em_ordem()
+        if n == 1 or len(faltando) < PDF_PARALELO_MIN_PAGINAS:
+            # no processo atual: o PDF é aberto uma vez só
+            pdf = pdf or (pdfplumber.open(path) if faltando else None)
+            for pagina in _extrair(pdf, faltando) if faltando else ():
+                _receber(pagina)
+                yield from _em_ordem()
+        else:
+            if pdf is not None:
+                pdf.close()
+                pdf = None
+            print(f"   ⚙️  PDF: {len(faltando)} páginas em {n} processos")
+            with ProcessPoolExecutor(max_workers=n) as pool:
+                futuros = {pool.submit(_extrair_faixa, path, numeros)
+                           for numeros in _tarefas(faltando, PDF_PAGINAS_POR_TAREFA)}
+                while futuros:
+                    feitos, futuros = wait(futuros, return_when=FIRST_COMPLETED)
+                    for fut in feitos:
+                        for pagina in fut.result():
+                            _receber(pagina)
+                    yield from _em_ordem()
+        yield from _em_ordem(esperar_ocr=True)
+        por_ocr = sum(1 for _, _, o in novas if o == "ocr")
+        if por_ocr or sem_ocr:
+            print(f"   🖼️  PDF: {por_ocr} página(s) por OCR, {len(faltando) - por_ocr - sem_ocr} pela camada de texto"
+                  + (f" | {sem_ocr} escaneada(s) sem Tesseract instalado" if sem_ocr else ""))
+        if cache is not None and (novas or not faltando):
+            cache.gravar(h, total, novas)
+    finally:
+        if pdf is not None:
+            pdf.close()
+        if cache is not None:
+            cache.fechar()
+
+
+def texto_pdf(path: str, workers: Optional[int] = None) -> str:
+    """Texto do PDF inteiro (páginas separadas por quebra de linha)."""
+    return "".join(f"{texto}\n" for _, texto in iter_paginas(path, workers=workers))
@@ -0,0 +1,160 @@
+# validador_fiscal/core/qualidade_itens.py
+"""
+PERFIL DE QUALIDADE dos itens (vetorizado, coluna a coluna)
+- Contagens de UM chunk num dict plano de inteiros: somam-se entre chunks e
+  arquivos como os demais contadores do parser
+- Checagens: nulos por campo, NCM/CFOP fora do formato, valores negativos,
+  quantidade × unitário ≠ total, além de valor zero / não contribuinte / IE
+  em notação científica
+- NCM/CFOP validados uma vez por valor distinto (poucos valores, muitos itens)
+- perfil_qualidade() monta o bloco "qualidade_itens" do relatório
+"""
+from __future__ import annotations
+import os
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from .column_aliases import PlanoColunas
+
+CAMPOS_NULOS = ("chave", "codigo", "descricao", "ncm", "cfop", "quantidade", "valor_unitario", "valor_total")
+CAMPOS_VALOR = ("quantidade", "valor_unitario", "valor_total")
+
+RE_NCM = r"\d{8}|00"  # 8 dígitos; "00" = serviço / sem classificação
+RE_CFOP = r"[123567]\d{3}"  # 1-3 entradas, 5-7 saídas
+_FORMATOS = {"ncm": RE_NCM, "cfop": RE_CFOP}
+
+# |round(quantidade × unitário, 2) − total| acima disto conta como divergente (R$)
+TOLERANCIA_TOTAL = float(os.getenv("QUALIDADE_TOLERANCIA_TOTAL", "0.01"))
+
+
+def nao_contribuinte(d: pd.DataFrame, plano: PlanoColunas) -> pd.Series:
+    """Regime "NÃO CONTRIBUINTE" (com ou sem espaço)."""
+    col = plano.coluna("regime")
+    if not col:
+        return pd.Series(False, index=d.index)
+    regime = d[col].astype(str).str.upper()
+    return regime.str.contains("NÃO CON", regex=False) | regime.str.contains("NÃOCON", regex=False)
+
+
+def ie_notacao_cientifica(d: pd.DataFrame, plano: PlanoColunas) -> pd.Series:
+    """Inscrição estadual que o Excel converteu em 1,23E+11."""
+    col = plano.coluna("inscricao_estadual")
+    if not col:
+        return pd.Series(False, index=d.index)
+    ie = d[col].astype(str)
+    return ie.str.contains("E+", regex=False) | ie.str.contains("E-", regex=False)
+
+
+def _por_valor(s: pd.Series, padrao: Optional[str] = None):
+    """(vazio, fora do formato) por linha, com o texto tratado só nos valores distintos."""
+    codigos, unicos = pd.factorize(s, use_na_sentinel=True)
+    txt = pd.Series(unicos, dtype=object).astype(str).str.strip()
+    vazio_u = ((txt == "") | (txt.str.lower() == "nan")).to_numpy()
+    pos = np.maximum(codigos, 0)
+    vazio = np.where(codigos >= 0, vazio_u[pos], True)
+    if padrao is None:
+        return vazio, None
+    invalido_u = (~vazio_u & ~txt.str.replace(".", "", regex=False).str.fullmatch(padrao)).to_numpy()
+    return vazio, np.where(codigos >= 0, invalido_u[pos], False)
+
+
+def contar_qualidade(
+    d: pd.DataFrame,
+    plano: PlanoColunas,
+    numeros: pd.DataFrame,
+    invalidos: Mapping[str, int],
+) -> Dict[str, int]:
+    """
+    Contagens de qualidade de um chunk bruto do CSV de itens (todas as linhas,
+    antes de qualquer filtro).
+
+    Args:
+        d: chunk com as colunas do arquivo
+        plano: plano de colunas do arquivo
+        numeros / invalidos: saída de converter_numeros para as colunas de valor
+    """
+    cont: Dict[str, int] = {"linhas": len(d)}
+
+    for campo in CAMPOS_NULOS:
+        col = plano.coluna(campo)
+        if not col or col not in d.columns:
+            cont[f"nulos_{campo}"] = len(d)  # campo ausente no arquivo
+        elif col in numeros.columns:
+            # NaN após a conversão = vazio ou não numérico (este já contado em invalidos)
+            cont[f"nulos_{campo}"] = int(numeros[col].isna().sum()) - int(invalidos.get(col, 0))
+        else:
+            vazio, invalido = _por_valor(d[col], _FORMATOS.get(campo))
+            cont[f"nulos_{campo}"] = int(vazio.sum())
+            if invalido is not None:
+                cont[f"{campo}_invalido"] = int(invalido.sum())
+
+    for campo in CAMPOS_VALOR:
+        col = plano.coluna(campo)
+        cont[f"negativos_{campo}"] = int((numeros[col] < 0).sum()) if col in numeros.columns else 0
+
+    cols = [plano.coluna(c) for c in CAMPOS_VALOR]
+    if all(c in numeros.columns for c in cols):
+        q, vu, vt = (numeros[c] for c in cols)
+        diferenca = ((q * vu).round(2) - vt).abs()
+        cont["total_divergente"] = int((diferenca > TOLERANCIA_TOTAL + 1e-9).sum())
+    else:
+        cont["total_divergente"] = 0
+    return cont
+
+
+# rótulo no relatório → contador
+_CHECAGENS = {
+    "valor_zero": "valor_zero",
+    "nao_contribuinte": "nao_contrib",
+    "ie_notacao_cientifica": "ist_sci",
+    "ncm_invalido": "ncm_invalido",
+    "cfop_invalido": "cfop_invalido",
+    "total_divergente": "total_divergente",
+}
+
+
+def perfil_qualidade(contadores: Mapping[str, int]) -> Dict[str, Any]:
+    """Bloco estruturado do relatório: contagens e taxas (fração das linhas lidas)."""
+    linhas = int(contadores.get("linhas", 0))
+
+    def _taxa(n: int) -> float:
+        return round(n / linhas, 6) if linhas else 0.0
+
+    def _bloco(prefixo: str) -> Dict[str, Dict[str, float]]:
+        return {
+            k[len(prefixo):]: {"qtd": int(v), "taxa": _taxa(int(v))}
+            for k, v in contadores.items() if k.startswith(prefixo)
+        }
+
+    checagens = {
+        nome: {"qtd": int(contadores.get(k, 0)), "taxa": _taxa(int(contadores.get(k, 0)))}
+        for nome, k in _CHECAGENS.items()
+    }
+    return {
+        "linhas": linhas,
+        "itens_validos": int(contadores.get("validos", 0)),
+        "nulos": _bloco("nulos_"),
+        "nao_numericos": _bloco("invalidos_"),
+        "negativos": _bloco("negativos_"),
+        "checagens": checagens,
+    }
+
+
+def combinar_perfis(perfis: Iterable[Mapping[str, Any]]) -> Dict[str, Any]:
+    """Soma perfis de vários arquivos (ex.: ingestão em lote) e recalcula as taxas."""
+    cont: Dict[str, int] = {}
+
+    def _add(k: str, v: int) -> None:
+        cont[k] = cont.get(k, 0) + int(v)
+
+    for p in perfis:
+        _add("linhas", p.get("linhas", 0))
+        _add("validos", p.get("itens_validos", 0))
+        for bloco, prefixo in (("nulos", "nulos_"), ("nao_numericos", "invalidos_"), ("negativos", "negativos_")):
+            for campo, v in (p.get(bloco) or {}).items():
+                _add(prefixo + campo, v["qtd"])
+        for nome, k in _CHECAGENS.items():
+            _add(k, ((p.get("checagens") or {}).get(nome) or {}).get("qtd", 0))
+    return perfil_qualidade(cont)
@@ -1,16 +1,111 @@
 # validador_fiscal/core/utils.py
 # Utilitários consolidados. Mantém nomes antigos e novos como aliases para compatibilidade.
 from __future__ import annotations
+import math
+import re
+from dataclasses import dataclass
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Optional
 
-def to_float(x) -> float:
+import pandas as pd
+
+# ---------------- números no formato brasileiro ----------------
+# Regras ÚNICAS (escalar e vetorizado):
+# - "R$", espaços e "%" são descartados ("18%" → 18.0; a conversão p/ fração fica com quem usa)
+# - com "," e ".": o último separador é o decimal ("1.234,56" / "1,234.56" → 1234.56)
+# - só ",": uma vírgula é decimal ("1234,56"); várias são milhar ("1,234,567")
+# - só ".": um ponto é decimal ("1234.56"); vários são milhar ("1.234.567")
+# - notação científica aceita ("1,5E+3", "2.4e-2")
+# - vazio / "nan" / inválido → None (escalar) ou NaN (vetorizado)
+_LIXO_NUMERO = re.compile(r"R\$|%|\s")
+
+
+def _normalizar_numero(s: str) -> str:
+    s = _LIXO_NUMERO.sub("", s)
+    virg, ponto = s.rfind(","), s.rfind(".")
+    if virg >= 0 and s.count(",") == 1 and virg > ponto:
+        return s.replace(".", "").replace(",", ".")
+    s = s.replace(",", "")
+    if s.count(".") > 1:
+        s = s.replace(".", "")
+    return s
+
+
+def para_float(x, default: Optional[float] = None) -> Optional[float]:
+    """Converte um valor (número ou texto BR/US) para float; `default` se vazio/inválido."""
+    if x is None or isinstance(x, bool):
+        return default
+    if isinstance(x, (int, float)):
+        v = float(x)
+        return default if math.isnan(v) else v
+    s = str(x).strip()
+    if not s:
+        return default
     try:
-        s = str(x).strip().replace(",", ".").replace("%", "")
-        return float(s)
-    except Exception:
-        return 0.0
+        v = float(s)
+    except ValueError:
+        try:
+            v = float(_normalizar_numero(s))
+        except ValueError:
+            return default
+    return default if math.isnan(v) else v
+
+
+def numeros_br(serie: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de para_float para uma coluna inteira (float64, NaN onde vazio/inválido).
+    Só as células que o pd.to_numeric não entende passam pela normalização BR.
+    """
+    if pd.api.types.is_bool_dtype(serie):
+        return serie.astype("float64")
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype("float64")
+    txt = serie.astype("string").str.strip()
+    out = pd.to_numeric(txt, errors="coerce").astype("float64")
+    resto = (out.isna() & (txt.fillna("") != "")).astype(bool)
+    if resto.any():
+        r = txt[resto].str.replace(_LIXO_NUMERO, "", regex=True)
+        virg = r.str.rfind(",")
+        decimal_virgula = (virg >= 0) & (r.str.count(",") == 1) & (virg > r.str.rfind("."))
+        br = r.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+        us = r.str.replace(",", "", regex=False)
+        us = us.where(us.str.count(r"\.") <= 1, us.str.replace(".", "", regex=False))
+        out[resto] = pd.to_numeric(br.where(decimal_virgula, us), errors="coerce").astype("float64")
+    return out
+
+
+@dataclass
+class ColunasNumericas:
+    """Resultado de converter_numeros: valores, máscaras de NaN e inválidos por coluna."""
+    valores: pd.DataFrame
+    nulos: pd.DataFrame
+    invalidos: Dict[str, int]
+
+
+def converter_numeros(df: pd.DataFrame, colunas: Iterable[str]) -> ColunasNumericas:
+    """
+    Converte várias colunas de uma vez.
+    `invalidos` conta só células preenchidas que não viraram número (vazio não conta).
+    """
+    valores, invalidos = {}, {}
+    for c in colunas:
+        if c not in df.columns:
+            continue
+        v = numeros_br(df[c])
+        if pd.api.types.is_numeric_dtype(df[c]):
+            preenchido = df[c].notna()
+        else:
+            t = df[c].astype("string").str.strip().fillna("")
+            preenchido = ((t != "") & (t.str.lower() != "nan")).astype(bool)
+        valores[c] = v
+        invalidos[c] = int((v.isna() & preenchido).sum())
+    tab = pd.DataFrame(valores, index=df.index)
+    return ColunasNumericas(valores=tab, nulos=tab.isna(), invalidos=invalidos)
+
+
+def to_float(x) -> float:
+    return para_float(x, 0.0)
 
 # alias para compat com versões antigas que usavam _to_float
 _to_float = to_float
@@ -27,6 +122,14 @@ def round2(x: Any) -> float:
 # alias para compat com _round2
 _round2 = round2
 
+def chave_acesso_valida(chave: Optional[str]) -> bool:
+    """Chave de acesso NF-e/NFC-e/CT-e: 44 dígitos com DV (módulo 11, pesos 2..9) correto."""
+    if not chave or len(chave) != 44 or not chave.isdigit():
+        return False
+    soma = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(chave[:43])))
+    dv = 11 - soma % 11
+    return int(chave[43]) == (0 if dv >= 10 else dv)
+
 def ts() -> str:
     return datetime.utcnow().isoformat(timespec="seconds") + "Z"
 
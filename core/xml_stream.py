@@ -0,0 +1,219 @@
+# validador_fiscal/core/xml_stream.py
+"""
+Leitura de NF-e XML em STREAMING (iterparse)
+- Entrega cada grupo da nota (ide, emit, dest, det, total) assim que ele termina
+  e o limpa em seguida: a árvore nunca cresce além de um grupo
+- Um arquivo pode ter várias NFe (enviNFe, lotes de nfeProc): evento "nfe" ao fim de cada uma
+- Chave de acesso do protNFe (quando vem depois da NFe) ou do Id do infNFe
+- Aceita membros de zip/gz/zst (core.compactados), lidos em stream
+- Memória constante, seja qual for o tamanho do XML
+- det → colunas por um XPath PRÉ-COMPILADO: produto + imposto declarado do item
+  (CST/CSOSN, vBC, pICMS, vICMS, vIPI, vPIS, vCOFINS, vISSQN)
+"""
+from __future__ import annotations
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from lxml import etree
+
+from .compactados import abrir
+from .utils import para_float
+
+NS_NFE = "http://www.portalfiscal.inf.br/nfe"
+NS = {"nfe": NS_NFE}
+
+# evento → tag no namespace da NF-e
+_GRUPOS = {
+    "ide": "ide",
+    "emit": "emit",
+    "dest": "dest",
+    "det": "det",
+    "total": "total",
+    "nfe": "NFe",
+    "prot": "protNFe",
+}
+_TAGS = {f"{{{NS_NFE}}}{tag}": evento for evento, tag in _GRUPOS.items()}
+_INF_NFE = f"{{{NS_NFE}}}infNFe"
+
+
+def eventos_nfe(fonte) -> Iterator[Tuple[str, etree._Element]]:
+    """
+    (evento, elemento) na ordem do documento: "ide" | "emit" | "dest" | "det" | "total"
+    | "nfe" (fim de uma NFe) | "prot" (protNFe de autorização).
+    O elemento só vale até o próximo evento: depois disso é limpo.
+    """
+    with abrir(fonte) as f:
+        contexto = etree.iterparse(
+            f, events=("end",), tag=list(_TAGS), recover=True, huge_tree=True, remove_comments=True,
+        )
+        for _, elem in contexto:
+            yield _TAGS[elem.tag], elem
+            _limpar(elem)
+        del contexto
+
+
+def _limpar(elem: etree._Element) -> None:
+    """Libera o elemento consumido e as cascas vazias dos irmãos anteriores."""
+    elem.clear(keep_tail=False)
+    pai = elem.getparent()
+    if pai is None:
+        return
+    while elem.getprevious() is not None:
+        del pai[0]
+
+
+def texto(elem: Optional[etree._Element], caminho: str) -> Optional[str]:
+    """Texto do primeiro nó em `caminho` (prefixo nfe:) abaixo de `elem`, ou None."""
+    if elem is None:
+        return None
+    return elem.findtext(caminho, namespaces=NS)
+
+
+def chave_da_nfe(nfe: etree._Element) -> Optional[str]:
+    """Chave pelo Id do infNFe ("NFe" + 44 dígitos)."""
+    inf = nfe.find(_INF_NFE)
+    ident = inf.get("Id") if inf is not None else None
+    if not ident:
+        return None
+    return ident[3:] if ident.startswith("NFe") else ident
+
+
+# ---------- det → colunas (um XPath compilado uma vez, avaliado por det) ----------
+# Um único XPath devolve as folhas de interesse do det; a coluna sai da tag.
+# (um XPath por campo custa mais que o find atual: a avaliação domina)
+_XP_FOLHAS = etree.XPath(
+    "nfe:prod/* | nfe:imposto/nfe:ICMS/*/* | nfe:imposto/nfe:IPI/*/nfe:vIPI"
+    " | nfe:imposto/nfe:PIS/*/nfe:vPIS | nfe:imposto/nfe:COFINS/*/nfe:vCOFINS"
+    " | nfe:imposto/nfe:ISSQN/nfe:vISSQN",
+    namespaces=NS,
+)
+# coluna → tags (grupos ICMSxx/ICMSSNxxx, IPITrib, PISAliq... casados pelo * do XPath)
+_TAGS_DET = {
+    "codigo": ("cProd",),
+    "descricao": ("xProd",),
+    "ncm": ("NCM",),
+    "cfop": ("CFOP",),
+    "quantidade": ("qCom",),
+    "valor_unitario": ("vUnCom",),
+    "valor_total": ("vProd",),
+    "cst": ("CST", "CSOSN"),
+    "decl_bc_icms": ("vBC",),
+    "decl_aliq_icms": ("pICMS",),
+    "decl_icms": ("vICMS",),
+    "decl_ipi": ("vIPI",),
+    "decl_pis": ("vPIS",),
+    "decl_cofins": ("vCOFINS",),
+    "decl_iss": ("vISSQN",),
+}
+COLUNAS_DET = tuple(_TAGS_DET)
+_POSICAO = {f"{{{NS_NFE}}}{tag}": i for i, tags in enumerate(_TAGS_DET.values()) for tag in tags}
+_N_PRODUTO = 7  # as 7 primeiras colunas vêm do grupo prod
+COLUNAS_PRODUTO_NUM = ("quantidade", "valor_unitario", "valor_total")
+# imposto declarado por item: NaN quando o grupo não vem no XML (≠ zero declarado)
+COLUNAS_DECLARADAS = tuple(c for c in COLUNAS_DET if c.startswith("decl_"))
+
+
+# linhas em texto antes de virarem colunas tipadas (limita os str vivos em notas enormes)
+_LINHAS_POR_PARTE = 65536
+
+
+def extrair_det(det: etree._Element) -> Optional[List[str]]:
+    """Textos do det na ordem de COLUNAS_DET ("" quando falta); None se não tem prod."""
+    valores = [""] * len(COLUNAS_DET)
+    posicao = _POSICAO.get
+    tem_prod = False
+    for folha in _XP_FOLHAS(det):
+        i = posicao(folha.tag)
+        if i is not None and not valores[i]:
+            valores[i] = folha.text or ""
+            tem_prod = tem_prod or i < _N_PRODUTO
+    return valores if tem_prod else None
+
+
+def _numero(texto: str, vazio: float) -> float:
+    if not texto:
+        return vazio
+    try:
+        v = float(texto)
+    except ValueError:
+        return para_float(texto, vazio)
+    return vazio if v != v else v
+
+
+def _frame_det(linhas: List[List[str]]) -> pd.DataFrame:
+    """Linhas em texto → colunas: produto (vazio = 0), declarados (vazio = NaN), textos."""
+    colunas = list(zip(*linhas)) if linhas else [()] * len(COLUNAS_DET)
+    dados = {}
+    for c, valores in zip(COLUNAS_DET, colunas):
+        if c in COLUNAS_PRODUTO_NUM or c in COLUNAS_DECLARADAS:
+            vazio = 0.0 if c in COLUNAS_PRODUTO_NUM else np.nan
+            dados[c] = np.fromiter((_numero(t, vazio) for t in valores), dtype="float64", count=len(valores))
+        else:
+            dados[c] = np.asarray(valores, dtype=object)
+    return pd.DataFrame(dados)
+
+
+class ColunasDet:
+    """
+    Acumula os det lidos e entrega colunas tipadas (produto + imposto declarado).
+    fechar_nota() marca o fim dos itens de uma nota (várias notas no mesmo acumulador).
+    """
+
+    def __init__(self):
+        self.por_nota: List[int] = []  # itens de cada nota fechada
+        self._linhas: List[List[str]] = []  # ainda em texto
+        self._partes: List[pd.DataFrame] = []  # já convertidas
+        self._convertidas = 0
+        self._inicio = 0  # 1ª linha da nota aberta
+
+    def __len__(self) -> int:
+        return self._convertidas + len(self._linhas)
+
+    def adicionar(self, det: etree._Element) -> bool:
+        valores = extrair_det(det)
+        if valores is None:
+            return False
+        self._linhas.append(valores)
+        if len(self._linhas) >= _LINHAS_POR_PARTE:
+            self._converter()
+        return True
+
+    def _converter(self) -> None:
+        if self._linhas:
+            self._partes.append(_frame_det(self._linhas))
+            self._convertidas += len(self._linhas)
+            self._linhas = []
+
+    def fechar_nota(self) -> int:
+        n = len(self) - self._inicio
+        self.por_nota.append(n)
+        self._inicio = len(self)
+        return n
+
+    def descartar_aberta(self) -> None:
+        """Remove os itens da nota não fechada (NFe truncada / erro no meio do arquivo)."""
+        if self._inicio >= self._convertidas:
+            del self._linhas[self._inicio - self._convertidas:]
+            return
+        self._partes = [self.frame().iloc[:self._inicio]]
+        self._convertidas = self._inicio
+
+    def soma_aberta(self, coluna: str = "valor_total") -> float:
+        """Soma de uma coluna numérica nos itens da nota ainda não fechada."""
+        i = COLUNAS_DET.index(coluna)
+        soma = sum(_numero(v[i], 0.0) for v in self._linhas[max(0, self._inicio - self._convertidas):])
+        if self._inicio < self._convertidas:
+            soma += float(pd.concat(self._partes, ignore_index=True)[coluna].iloc[self._inicio:].sum())
+        return soma
+
+    def nota_por_linha(self) -> np.ndarray:
+        """Índice (ordem de fechar_nota) da nota de cada linha."""
+        return np.repeat(np.arange(len(self.por_nota)), np.asarray(self.por_nota, dtype=np.int64))
+
+    def frame(self) -> pd.DataFrame:
+        """Todas as linhas: colunas do produto (números BR → float) + declarados (NaN = sem grupo)."""
+        self._converter()
+        if len(self._partes) > 1:
+            self._partes = [pd.concat(self._partes, ignore_index=True)]
+        return self._partes[0] if self._partes else _frame_det([])
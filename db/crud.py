@@ -1,10 +1,13 @@
 from __future__ import annotations
-import csv, json, math, os
+import csv, json, os
 from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 from sqlalchemy.orm import Session
 
+from ..core.column_aliases import compilar_plano, PlanoColunas
+from ..core.csv_sniff import detectar_csv
+from ..core.utils import para_float
 from .models import (
     NotaFiscal as NF,
     NotaFiscalItem as NFItem,
@@ -39,24 +42,21 @@ def _get_opt(data: Dict[str, Any] | None, *cands: str) -> Optional[str]:
             return str(val).strip() if val is not None else None
     return None
 
-def _to_float(x) -> Optional[float]:
-    try:
-        if x in (None, "", "nan"):
-            return None
-        if isinstance(x, str):
-            s = x.replace(".", "").replace(",", ".")
-        else:
-            s = x
-        v = float(s)
-        if math.isnan(v):
-            return None
-        return v
-    except Exception:
+def _campo(plano: PlanoColunas, row: Dict[str, Any] | None, campo: str) -> Optional[str]:
+    """Como _get_opt, mas com o plano de colunas já compilado (sem refazer o dict por linha)."""
+    if not row:
         return None
+    val = plano.valor(row, campo)
+    return str(val).strip() if val is not None else None
+
+def _to_float(x) -> Optional[float]:
+    # mesmas regras de número BR do parser/relatório (core.utils.para_float)
+    return para_float(x)
 
 def _load_csv_rows(path: str) -> List[Dict[str, Any]]:
-    with open(path, "r", encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f)
+    cfg = detectar_csv(path)
+    with open(path, "r", encoding=cfg["encoding"], newline="") as f:
+        reader = csv.DictReader(f, delimiter=cfg["sep"])
         return [dict(r) for r in reader]
 
 def _is_items_csv(rows: List[Dict[str, Any]]) -> bool:
@@ -102,15 +102,16 @@ def save_nf_cabecalho_csv(db: Session, path: str) -> int:
             if (k not in merged) or merged[k] in (None, "", "nan"):
                 merged[k] = v
 
-    chave = _get_opt(merged, "CHAVE DE ACESSO", "chNFe", "chave_nfe", "chavenfe", "chave")
-    numero = _get_opt(merged, "NÚMERO", "NUMERO", "nNF", "numero", "numnf")
-    serie  = _get_opt(merged, "SÉRIE", "SERIE", "serie", "nSerie", "nserie")
-    emit_cnpj = _get_opt(merged, "CPF/CNPJ EMITENTE", "CNPJ_emitente", "emit_cnpj", "cnpj_emit", "cnpj")
-    dest_cnpj = _get_opt(merged, "CNPJ DESTINATÁRIO", "CNPJ DESTINATARIO", "dest_cnpj", "cnpj_dest", "cnpjdest")
-    dt_emis   = _get_opt(merged, "DATA EMISSÃO", "DATA EMISSAO", "dhEmi", "dEmi", "data_emissao", "emissao")
-    vtotal    = _get_opt(merged, "VALOR NOTA FISCAL", "vNF", "valor_total", "total_nf", "vTotNF", "total")
-    uf_origem = _get_opt(merged, "UF EMITENTE", "UF EMIT", "UF_EMIT", "UF EMITENTE ")
-    uf_dest   = _get_opt(merged, "UF DESTINATÁRIO", "UF DESTINATARIO", "UF_DEST", "UF DESTINATARIO ")
+    plano = compilar_plano(list(merged.keys()))
+    chave = _campo(plano, merged, "chave")
+    numero = _campo(plano, merged, "numero")
+    serie  = _campo(plano, merged, "serie")
+    emit_cnpj = _campo(plano, merged, "emitente_cnpj")
+    dest_cnpj = _campo(plano, merged, "destinatario_cnpj")
+    dt_emis   = _campo(plano, merged, "data_emissao")
+    vtotal    = _to_float(_campo(plano, merged, "total_nf"))
+    uf_origem = _campo(plano, merged, "emissor_uf")
+    uf_dest   = _campo(plano, merged, "destinatario_uf")
 
     defaults = dict(
         chave=chave, numero=numero, serie=serie,
@@ -128,9 +129,11 @@ def save_nf_itens_csv(db: Session, path: str, chave_hint: Optional[str] = None)
         return 0
 
     sample = rows[0]
-    chave = chave_hint or _get_opt(sample, "CHAVE DE ACESSO", "chNFe", "chave_nfe", "chavenfe", "chave")
-    numero = _get_opt(sample, "NÚMERO", "NUMERO", "nNF", "numero", "numnf")
-    serie  = _get_opt(sample, "SÉRIE", "SERIE", "serie", "nSerie", "nserie")
+    # plano compilado 1x pelo cabeçalho do arquivo (DictReader: todas as linhas têm as mesmas chaves)
+    plano = compilar_plano(list(sample.keys()))
+    chave = chave_hint or _campo(plano, sample, "chave")
+    numero = _campo(plano, sample, "numero")
+    serie  = _campo(plano, sample, "serie")
 
     defaults = dict(chave=chave, numero=numero, serie=serie)
     nf = _find_or_create_nf_by_chave(db, chave, defaults)
@@ -138,49 +141,20 @@ def save_nf_itens_csv(db: Session, path: str, chave_hint: Optional[str] = None)
     for r in rows:
         item = NFItem(
             nota_id=nf.id,
-
-            # número do item
-            n_item=_get_opt(
-                r,
-                "NÚMERO PRODUTO", "NUMERO PRODUTO",
-                "nItem", "item", "item_seq"
-            ),
-
-            # código
-            codigo=_get_opt(
-                r,
-                "CÓDIGO PRODUTO", "CODIGO PRODUTO",
-                "cProd", "cod", "codigo", "prod_codigo"
-            ),
-
-            # descrição
-            descricao=_get_opt(
-                r,
-                "DESCRIÇÃO DO PRODUTO/SERVIÇO", "DESCRICAO DO PRODUTO/SERVICO",
-                "xProd", "desc", "descricao", "produto_descricao"
-            ),
-
-            # ncm
-            ncm=_get_opt(
-                r,
-                "CÓDIGO NCM/SH", "CODIGO NCM/SH", "NCM/SH",
-                "NCM", "ncm"
-            ),
-
-            # cfop
-            cfop=_get_opt(r, "CFOP", "cfop"),
+            n_item=_campo(plano, r, "n_item"),
+            codigo=_campo(plano, r, "codigo_produto"),
+            descricao=_campo(plano, r, "descricao"),
+            ncm=_campo(plano, r, "ncm"),
+            cfop=_campo(plano, r, "cfop"),
 
             # campos ISS (se vierem — opcionais, não quebram se faltarem)
-            subitem_lc116=_get_opt(r, "subitem_lc116", "subitem", "lc116_subitem", "servico_subitem"),
-            municipio_servico=_get_opt(r, "municipio_servico", "mun_servico", "municipio"),
-            uf_servico=_get_opt(r, "uf_servico", "uf_serv", "uf"),
-
-            # quantidade
-            quantidade=_to_float(_get_opt(r, "QUANTIDADE", "Quantidade", "quantidade", "qCom", "qtd")),
+            subitem_lc116=_campo(plano, r, "subitem_lc116"),
+            municipio_servico=_campo(plano, r, "municipio_servico"),
+            uf_servico=_campo(plano, r, "uf_servico"),
 
-            # valores
-            valor_unitario=_to_float(_get_opt(r, "VALOR UNITÁRIO", "VALOR UNITARIO", "vUnCom", "vUnit", "valor_unit", "vl_unit")),
-            valor_total=_to_float(_get_opt(r, "VALOR TOTAL", "vProd", "vTotal", "valor_total", "vl_total")),
+            quantidade=_to_float(_campo(plano, r, "quantidade")),
+            valor_unitario=_to_float(_campo(plano, r, "valor_unitario")),
+            valor_total=_to_float(_campo(plano, r, "valor_total")),
         )
         db.add(item)
 
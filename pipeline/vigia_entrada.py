@@ -0,0 +1,402 @@
+# validador_fiscal/pipeline/vigia_entrada.py
+"""
+SERVIÇO DE INGESTÃO por pasta de entrada (drops de SFTP)
+- Varre ENTRADA_DIR periodicamente; um arquivo está completo quando tem
+  marcador ("arquivo.csv.ok" / ".done") ou quando tamanho e mtime ficam
+  parados por VIGIA_ESTAVEL_S segundos
+- CSVs completos são pareados (cabeçalho + itens) por chave de acesso, como na
+  ingestão em lote; XML/PDF/imagem são processados sozinhos
+- Cada unidade roda run_pipeline / run_pipeline_lote num pool de processos limitado
+- Entradas vão para PROCESSADOS_DIR ou ERROS_DIR (subpasta do dia)
+- Estado em SQLite (hash do conteúdo): reinício não reprocessa o que já terminou,
+  e o mesmo arquivo entregue de novo não é calculado duas vezes
+
+Uso:
+    python -m validador_fiscal.pipeline.vigia_entrada [--entrada data/entrada] [--workers 2] [--uma-vez]
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..core import compactados
+from ..tools.ingestao_lote import ParCSV, descobrir_pares
+from ..tools.nf_parse_tool import _separar_cab_itens
+
+ENTRADA_DIR = os.getenv("ENTRADA_DIR", "data/entrada")
+PROCESSADOS_DIR = os.getenv("PROCESSADOS_DIR", "data/processados")
+ERROS_DIR = os.getenv("ERROS_DIR", "data/erros")
+VIGIA_ESTADO = os.getenv("VIGIA_ESTADO", "data/vigia_entrada.db")
+
+VIGIA_WORKERS = int(os.getenv("VIGIA_WORKERS", "2"))
+VIGIA_INTERVALO_S = float(os.getenv("VIGIA_INTERVALO_S", "5"))
+# Sem marcador: tamanho/mtime parados por este tempo = upload terminado
+VIGIA_ESTAVEL_S = float(os.getenv("VIGIA_ESTAVEL_S", "10"))
+# 1 = só processa arquivos com marcador (ignora a regra de estabilidade)
+VIGIA_EXIGIR_MARCADOR = os.getenv("VIGIA_EXIGIR_MARCADOR", "0") == "1"
+# Cabeçalho esperando o CSV de itens (e vice-versa) antes de seguir sozinho / ir para erros
+VIGIA_ESPERA_PAR_S = float(os.getenv("VIGIA_ESPERA_PAR_S", "300"))
+
+MARCADORES = (".ok", ".done")
+_EXT_CSV = (".csv", ".zip") + compactados.EXT_GZ + compactados.EXT_ZST
+_EXT_DOC = {".xml": "xml_file", ".pdf": "pdf_file", ".png": "image_file", ".jpg": "image_file",
+            ".jpeg": "image_file", ".tif": "image_file", ".tiff": "image_file"}
+# Uploads em andamento de clientes SFTP comuns
+_TEMPORARIOS = (".part", ".filepart", ".tmp", ".partial", ".crdownload")
+
+
+@dataclass
+class Unidade:
+    """Arquivos físicos processados juntos + docs do pipeline."""
+    arquivos: List[str]
+    docs: Dict[str, object]
+    lote: bool = False
+    hashes: List[str] = field(default_factory=list)
+
+    @property
+    def nome(self) -> str:
+        return " + ".join(os.path.basename(a) for a in self.arquivos)
+
+
+# =========================
+# Estado (SQLite)
+# =========================
+class EstadoVigia:
+    """Status por hash do conteúdo: processando | ok | erro."""
+
+    def __init__(self, path: str = VIGIA_ESTADO):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS arquivos ("
+            " hash TEXT PRIMARY KEY, nome TEXT, status TEXT, relatorio TEXT, erro TEXT, atualizado REAL)"
+        )
+        self._con.commit()
+
+    def status(self, h: str) -> Optional[str]:
+        row = self._con.execute("SELECT status FROM arquivos WHERE hash = ?", (h,)).fetchone()
+        return row[0] if row else None
+
+    def marcar(self, hashes: List[str], nomes: List[str], status: str,
+               relatorio: Optional[str] = None, erro: Optional[str] = None) -> None:
+        agora = time.time()
+        with self._con:
+            self._con.executemany(
+                "INSERT OR REPLACE INTO arquivos (hash, nome, status, relatorio, erro, atualizado) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(h, n, status, relatorio, erro, agora) for h, n in zip(hashes, nomes)],
+            )
+
+    def fechar(self) -> None:
+        self._con.close()
+
+
+def _hash_arquivo(path: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(4 * 1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+# =========================
+# Arquivos completos
+# =========================
+def _marcador(path: str) -> Optional[str]:
+    for ext in MARCADORES:
+        if os.path.exists(path + ext):
+            return path + ext
+    return None
+
+
+def _candidato(nome: str) -> bool:
+    n = nome.lower()
+    if n.startswith(".") or n.endswith(_TEMPORARIOS) or n.endswith(MARCADORES):
+        return False
+    return n.endswith(_EXT_CSV) or os.path.splitext(n)[1] in _EXT_DOC
+
+
+class _Estabilidade:
+    """Tamanho/mtime de cada arquivo entre varreduras: completo quando parado por VIGIA_ESTAVEL_S."""
+
+    def __init__(self, estavel_s: float = VIGIA_ESTAVEL_S):
+        self.estavel_s = estavel_s
+        self._vistos: Dict[str, Tuple[int, int, float]] = {}
+        self.desde: Dict[str, float] = {}  # quando ficou completo (para a espera do par)
+
+    def completos(self, raiz: str, ignorar: Set[str]) -> List[str]:
+        agora = time.time()
+        prontos: List[str] = []
+        atuais: Set[str] = set()
+        for pasta, subpastas, nomes in os.walk(raiz):
+            subpastas[:] = sorted(s for s in subpastas if not s.startswith("."))
+            for nome in sorted(nomes):
+                path = os.path.join(pasta, nome)
+                if not _candidato(nome) or path in ignorar:
+                    continue
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                atuais.add(path)
+                assinatura = (st.st_size, st.st_mtime_ns)
+                anterior = self._vistos.get(path)
+                if anterior is None or anterior[:2] != assinatura:
+                    self._vistos[path] = (*assinatura, agora)
+                    self.desde.pop(path, None)
+                if _marcador(path):
+                    ok = True
+                elif VIGIA_EXIGIR_MARCADOR:
+                    ok = False
+                else:
+                    ok = agora - self._vistos[path][2] >= self.estavel_s
+                if ok:
+                    self.desde.setdefault(path, agora)
+                    prontos.append(path)
+        for path in set(self._vistos) - atuais:
+            self._vistos.pop(path, None)
+            self.desde.pop(path, None)
+        return prontos
+
+
+def montar_unidades(
+    completos: List[str],
+    desde: Dict[str, float],
+    espera_par_s: float = VIGIA_ESPERA_PAR_S,
+) -> Tuple[List[Unidade], List[Tuple[str, str]], List[str]]:
+    """
+    (unidades prontas, [(arquivo, motivo)] a mandar para erros, CSVs esperando o par).
+    Cabeçalho sem itens segue sozinho depois de espera_par_s; itens sem cabeçalho vão para erros.
+    """
+    agora = time.time()
+    unidades: List[Unidade] = []
+    erros: List[Tuple[str, str]] = []
+    esperando: List[str] = []
+
+    for path in completos:
+        chave_doc = _EXT_DOC.get(os.path.splitext(path)[1].lower())
+        if chave_doc:
+            unidades.append(Unidade([path], {chave_doc: path}))
+
+    csvs = [p for p in completos if p.lower().endswith(_EXT_CSV)]
+    if not csvs:
+        return unidades, erros, esperando
+
+    def _esperou(refs: List[str]) -> bool:
+        return all(agora - desde.get(compactados.separar(r)[0], agora) >= espera_par_s for r in refs)
+
+    usados: Set[str] = set()
+    for par in descobrir_pares(csvs):
+        fisicos = sorted({compactados.separar(r)[0] for r in (par.cabecalho, par.itens) if r})
+        if par.itens is None and not _esperou([par.cabecalho]):
+            usados.update(fisicos)
+            esperando.extend(fisicos)  # aguardando o CSV de itens
+            continue
+        usados.update(fisicos)
+        unidades.append(_unidade_csv(par, fisicos))
+
+    for path in csvs:
+        if path in usados:
+            continue
+        if _esperou([path]):
+            erros.append((path, "CSV sem par (itens sem cabeçalho ou arquivo ilegível)"))
+        else:
+            esperando.append(path)
+    return unidades, erros, esperando
+
+
+def _unidade_csv(par: ParCSV, fisicos: List[str]) -> Unidade:
+    if par.itens is None:
+        return Unidade(fisicos, {"nf_csv_file": [par.cabecalho]}, lote=par.chaves > 1)
+    if par.chaves > 1:
+        return Unidade(fisicos, {"fontes": [par]}, lote=True)
+    # pipeline de nota única separa cabeçalho/itens pelo nome; senão vai pelo par já formado
+    if _separar_cab_itens([par.cabecalho, par.itens]) == (par.cabecalho, par.itens):
+        return Unidade(fisicos, {"nf_csv_file": [par.cabecalho, par.itens]})
+    return Unidade(fisicos, {"fontes": [par]}, lote=True)
+
+
+# =========================
+# Execução (processo do pool)
+# =========================
+def _processar(unidade: Unidade) -> Tuple[str, Optional[str]]:
+    """(relatório, erro). run_pipeline devolve o JSON de erro em vez de levantar."""
+    from ..agents.supervisor_agent import run_pipeline, run_pipeline_lote
+
+    if unidade.lote:
+        rel = run_pipeline_lote(docs=unidade.docs)
+    else:
+        rel = run_pipeline(docs=unidade.docs)
+    if os.path.basename(rel).startswith("erro_"):
+        try:
+            with open(rel, "r", encoding="utf-8") as f:
+                return rel, json.load(f).get("erro") or "erro no pipeline"
+        except Exception:
+            return rel, "erro no pipeline"
+    return rel, None
+
+
+def _mover(path: str, destino_raiz: str, entrada: str) -> str:
+    """Move o arquivo (e o marcador) para destino/AAAAMMDD/<caminho relativo à entrada>."""
+    rel = os.path.relpath(path, entrada)
+    destino = os.path.join(destino_raiz, time.strftime("%Y%m%d"), rel)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    if os.path.exists(destino):
+        base, ext = os.path.splitext(destino)
+        destino = f"{base}_{int(time.time() * 1000)}{ext}"
+    shutil.move(path, destino)
+    marcador = _marcador(path)
+    if marcador:
+        shutil.move(marcador, destino + os.path.splitext(marcador)[1])
+    return destino
+
+
+# =========================
+# Serviço
+# =========================
+class VigiaEntrada:
+    def __init__(self, entrada: str = ENTRADA_DIR, workers: int = VIGIA_WORKERS,
+                 estado: Optional[EstadoVigia] = None, uma_vez: bool = False):
+        """uma_vez: o que já está na pasta conta como completo e sem par a esperar (execução avulsa)."""
+        self.entrada = entrada
+        self.workers = max(1, workers)
+        self.estado = estado or EstadoVigia()
+        self.uma_vez = uma_vez
+        self.parar = threading.Event()
+        self._estabilidade = _Estabilidade(0.0 if uma_vez else VIGIA_ESTAVEL_S)
+        # path → (tamanho, mtime, hash); a entrada sai quando o arquivo é arquivado
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        self._em_voo: Dict[Future, Unidade] = {}
+        # (arquivos completos, prazo): mesma pasta antes do prazo → não reexamina os CSVs
+        self._sem_mudanca: Optional[Tuple[frozenset, float]] = None
+        os.makedirs(entrada, exist_ok=True)
+
+    def _hash(self, path: str) -> str:
+        st = os.stat(path)
+        guardado = self._hashes.get(path)
+        if guardado is None or guardado[:2] != (st.st_size, st.st_mtime_ns):
+            guardado = self._hashes[path] = (st.st_size, st.st_mtime_ns, _hash_arquivo(path))
+        return guardado[2]
+
+    def _arquivar(self, path: str, destino_raiz: str) -> str:
+        """Move para processados/erros e esquece o hash guardado (o serviço roda por dias)."""
+        self._hashes.pop(path, None)
+        return _mover(path, destino_raiz, self.entrada)
+
+    def _finalizar(self, unidade: Unidade, rel: Optional[str], erro: Optional[str]) -> None:
+        nomes = [os.path.basename(a) for a in unidade.arquivos]
+        # estado gravado ANTES de mover: reinício no meio só termina a movimentação
+        self.estado.marcar(unidade.hashes, nomes, "erro" if erro else "ok", relatorio=rel, erro=erro)
+        destino = ERROS_DIR if erro else PROCESSADOS_DIR
+        for a in unidade.arquivos:
+            if os.path.exists(a):
+                self._arquivar(a, destino)
+        if erro:
+            print(f"❌ {unidade.nome}: {erro}")
+        else:
+            print(f"✅ {unidade.nome} → {rel}")
+
+    def _ja_tratados(self, unidades: List[Unidade]) -> List[Unidade]:
+        """
+        Separa unidades já concluídas com sucesso (reinício/arquivo repetido): só move, sem recalcular.
+        "processando" = interrompido no meio → roda de novo; "erro" = entrega corrigida → roda de novo.
+        """
+        novas = []
+        for u in unidades:
+            u.hashes = [self._hash(a) for a in u.arquivos]
+            if all(self.estado.status(h) == "ok" for h in u.hashes):
+                print(f"⏭️  {u.nome}: já processado; arquivando")
+                for a in u.arquivos:
+                    self._arquivar(a, PROCESSADOS_DIR)
+            else:
+                novas.append(u)
+        return novas
+
+    def varrer(self, pool: ProcessPoolExecutor) -> int:
+        """Uma varredura: submete unidades até o limite de workers. Retorna quantas submeteu."""
+        ocupados = {a for u in self._em_voo.values() for a in u.arquivos}
+        completos = self._estabilidade.completos(self.entrada, ocupados)
+        if not completos:
+            return 0
+        chave = frozenset(completos)
+        if self._sem_mudanca and self._sem_mudanca[0] == chave and time.time() < self._sem_mudanca[1]:
+            return 0
+        espera = 0.0 if self.uma_vez else VIGIA_ESPERA_PAR_S
+        unidades, erros, esperando = montar_unidades(completos, self._estabilidade.desde, espera)
+        for path, motivo in erros:
+            h = self._hash(path)
+            self.estado.marcar([h], [os.path.basename(path)], "erro", erro=motivo)
+            self._arquivar(path, ERROS_DIR)
+            print(f"❌ {os.path.basename(path)}: {motivo}")
+
+        novas = self._ja_tratados(unidades)
+        submetidas = 0
+        for u in novas:
+            if len(self._em_voo) >= self.workers:
+                break  # restante fica para a próxima varredura
+            self.estado.marcar(u.hashes, [os.path.basename(a) for a in u.arquivos], "processando")
+            print(f"🚀 Processando: {u.nome}")
+            self._em_voo[pool.submit(_processar, u)] = u
+            submetidas += 1
+
+        if esperando and submetidas == len(novas) and not erros:
+            desde = self._estabilidade.desde
+            prazo = min(desde.get(p, time.time()) for p in esperando) + espera
+            self._sem_mudanca = (chave - {a for u in unidades for a in u.arquivos}, prazo)
+        else:
+            self._sem_mudanca = None
+        return submetidas
+
+    def _colher(self, timeout: float) -> None:
+        if not self._em_voo:
+            self.parar.wait(timeout)
+            return
+        prontos, _ = wait(self._em_voo, timeout=timeout, return_when=FIRST_COMPLETED)
+        for fut in prontos:
+            u = self._em_voo.pop(fut)
+            erro = fut.exception()
+            if erro is not None:
+                self._finalizar(u, None, f"{type(erro).__name__}: {erro}")
+            else:
+                self._finalizar(u, *fut.result())
+
+    def executar(self) -> None:
+        """Laço do serviço (uma_vez: processa o que está na pasta e termina)."""
+        print(f"👀 Vigiando {os.path.abspath(self.entrada)} ({self.workers} workers)")
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while not self.parar.is_set():
+                submetidas = self.varrer(pool)
+                if self.uma_vez and not submetidas and not self._em_voo:
+                    break
+                self._colher(0.5 if self.uma_vez else VIGIA_INTERVALO_S)
+            # parada: termina o que já está rodando (estado fica consistente)
+            while self._em_voo:
+                self._colher(VIGIA_INTERVALO_S)
+        self.estado.fechar()
+        print("🛑 Vigia encerrado")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--entrada", default=ENTRADA_DIR)
+    ap.add_argument("--workers", type=int, default=VIGIA_WORKERS)
+    ap.add_argument("--uma-vez", action="store_true", help="processa os arquivos completos e sai")
+    args = ap.parse_args()
+
+    vigia = VigiaEntrada(args.entrada, args.workers, uma_vez=args.uma_vez)
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sinal, lambda *_: vigia.parar.set())
+    vigia.executar()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,22 +6,53 @@ VALIDACAO FISCAL - Correta e Rapida
 - 30-60 segundos para 549k itens
 """
 from __future__ import annotations
-from typing import Dict, Tuple, List
+import os
+from typing import Dict, Optional, Tuple, List
 import pandas as pd
 import numpy as np
 fromcore.models import NotaFiscal, Calculados
+from ..core.item_table import ItemTable, codificada
+from ..core.utils import para_float, numeros_br
 
 MODO_DETALHADO = False
+# Sobe a cada mudança no cálculo: resultados guardados de outra versão não são reaproveitados
+VERSAO_MOTOR = "legados-1"
+# Itens com imposto divergente do declarado no próprio item (NF-e XML) guardados em "linhas"
+LIMITE_DIVERGENCIAS_ITEM = int(os.getenv("LIMITE_DIVERGENCIAS_ITEM", "1000"))
 
 def _to_float(x):
-    try:
-        s = str(x).strip().replace(",", ".").replace("%", "")
-        v = float(s)
-        if v > 1.0:
-            v = v / 100.0
-        return v
-    except Exception:
-        return None
+    """Alíquota da matriz como fração (18 / "18%" / "18,0" → 0.18)."""
+    v = para_float(x)
+    if v is not None and v > 1.0:
+        v = v / 100.0
+    return v
+
+def _aliquota_col(s: pd.Series) -> pd.Series:
+    """Versão vetorizada de _to_float (sem valor → 0.0)."""
+    v = numeros_br(s)
+    return v.where(v <= 1.0, v / 100.0).fillna(0.0)
+
+def _texto_codificado(s: pd.Series, vazio: str = "") -> pd.Series:
+    """astype(str).str.strip() de uma coluna categoria: só no dicionário, códigos mantidos.
+    Vazio (NaN / código -1) vira `vazio` nos dois caminhos (nota única e lote)."""
+    if not codificada(s):
+        return s.fillna(vazio).astype(str).str.strip()
+    cats = s.cat.categories.astype(str).str.strip().to_numpy(dtype=object)
+    codes = s.cat.codes.to_numpy()
+    if (codes < 0).any():
+        cats = np.append(cats, vazio)
+        codes = np.where(codes < 0, len(cats) - 1, codes)
+    # strip pode juntar categorias ("0101 " e "0101"): dicionário refeito sem repetições
+    unicos, novo = np.unique(cats, return_inverse=True)
+    return pd.Series(pd.Categorical.from_codes(novo[codes], unicos), index=s.index)
+
+def _mapear(s: pd.Series, mapa: Dict) -> pd.Series:
+    """_aliquota_col(s.map(mapa)) com a conversão feita 1x por código distinto (NCM, subitem)."""
+    if not codificada(s):
+        return _aliquota_col(s.map(mapa))
+    por_codigo = _aliquota_col(pd.Series(s.cat.categories, dtype=object).map(mapa)).to_numpy()
+    codes = s.cat.codes.to_numpy()
+    return pd.Series(np.where(codes >= 0, por_codigo[codes], 0.0), index=s.index)
 
 def _aliq_federais(df: pd.DataFrame, tributo: str) -> float:
     if not isinstance(df, pd.DataFrame) or df.empty:
@@ -40,13 +71,15 @@ def _icms_aliq(icms_uf: pd.DataFrame, uf: str) -> float:
     v = _to_float(row.iloc[0].get("aliquota"))
     return v if v is not None else 0.18
 
-def calcular_legados_item_a_item(nota: NotaFiscal, matriz: Dict) -> Tuple[List[Dict], Dict[str, float]]:
-    
-    itens = getattr(nota, "itens", []) or []
-    if not itens:
-        return [], {}
-    
-    df_itens = pd.DataFrame([
+def _frame_itens(itens) -> pd.DataFrame:
+    """DataFrame do motor: direto das colunas (ItemTable) ou via getattr (lista de Item)."""
+    if isinstance(itens, ItemTable):
+        df = itens.frame(["valor_total", "ncm", "cfop", "subitem_lc116"]).copy()
+        for c in ("ncm", "cfop", "subitem_lc116"):
+            df[c] = _texto_codificado(df[c])
+        df.insert(0, "item_idx", np.arange(1, len(df) + 1))
+        return df
+    return pd.DataFrame([
         {
             "item_idx": idx,
             "valor_total": float(getattr(it, "valor_total", 0.0) or 0.0),
@@ -56,6 +89,100 @@ def calcular_legados_item_a_item(nota: NotaFiscal, matriz: Dict) -> Tuple[List[D
         }
         for idx, it in enumerate(itens, start=1)
     ])
+
+def _tem_nao_contribuinte(itens) -> bool:
+    if isinstance(itens, ItemTable):
+        return itens.contem_texto(("NAO CON", "NAOCON"))
+    for item in itens:
+        if hasattr(item, '__dict__'):
+            attrs = str(item.__dict__).upper()
+            if "NAO CON" in attrs or "NAOCON" in attrs:
+                return True
+    return False
+
+# imposto calculado → coluna declarada por item na ItemTable (NF-e XML)
+_DECLARADOS_ITEM = {"icms": "decl_icms", "ipi": "decl_ipi", "pis": "decl_pis", "cofins": "decl_cofins", "iss": "decl_iss"}
+
+def _diferencas(itens: ItemTable, pos: np.ndarray, calc: pd.DataFrame) -> pd.DataFrame:
+    """
+    (linha, imposto, declarado, calculado, diferenca) de cada linha de `calc` em que o calculado
+    difere do declarado no item; pos: posição de cada linha de `calc` na ItemTable.
+    Itens sem o grupo do imposto no XML (NaN) e colunas declaradas ausentes não entram.
+    """
+    cols = {imp: col for imp, col in _DECLARADOS_ITEM.items() if itens.tem_coluna(col)}
+    decl = itens.frame(list(cols.values()), descricao=False)
+    partes = []
+    for imp, col in cols.items():
+        dec = decl[col].to_numpy()[pos]
+        dif = np.round(calc[imp].to_numpy(dtype="float64") - dec, 2)
+        m = ~np.isnan(dec) & (np.abs(dif) >= 0.01)
+        if m.any():
+            partes.append(pd.DataFrame({"linha": np.flatnonzero(m), "imposto": imp.upper(),
+                                        "declarado": np.round(dec[m], 2),
+                                        "calculado": np.round(calc[imp].to_numpy(dtype="float64")[m], 2),
+                                        "diferenca": dif[m]}))
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+def _registros(itens: ItemTable, d: pd.DataFrame, pos: np.ndarray) -> pd.DataFrame:
+    """Diferenças → colunas do relatório (item, código, CST, imposto, valores); pos: linha na ItemTable."""
+    ref = itens.frame(["codigo", "cst"] if itens.tem_coluna("cst") else ["codigo"], descricao=False)
+    out = d[["item", "imposto", "declarado", "calculado", "diferenca"]].copy()
+    for c in ref.columns:
+        out.insert(out.columns.get_loc("imposto"), c, ref[c].to_numpy()[pos])
+    return out
+
+def divergencias_por_item(itens, df_itens: pd.DataFrame) -> List[Dict]:
+    """
+    Calculado × declarado ITEM A ITEM (só ItemTable com o imposto de cada det).
+    df_itens: frame do motor com item_idx e as colunas calculadas.
+    Itens sem o grupo do imposto no XML (NaN) não entram; maiores diferenças primeiro.
+    """
+    if not isinstance(itens, ItemTable) or not itens.tem_coluna("decl_icms") or df_itens.empty:
+        return []
+    pos = df_itens["item_idx"].to_numpy() - 1
+    d = _diferencas(itens, pos, df_itens)
+    if d.empty:
+        return []
+    total = len(d)
+    d = d.loc[d["diferenca"].abs().sort_values(ascending=False, kind="stable").index[:LIMITE_DIVERGENCIAS_ITEM]]
+    d["item"] = pos[d["linha"].to_numpy()] + 1
+    print(f"   ⚠️ {total:,} divergências item a item (calculado × declarado no item)")
+    return _registros(itens, d, d["item"].to_numpy() - 1).to_dict("records")
+
+def divergencias_por_item_lote(tabela: ItemTable, df: pd.DataFrame, n_notas: int) -> List[List[Dict]]:
+    """
+    divergencias_por_item de TODAS as notas do lote num único cálculo.
+    df: frame do lote (index = linha da tabela, colunas "nota", "item" e as calculadas).
+    Devolve as linhas de cada nota na ordem das notas, até LIMITE_DIVERGENCIAS_ITEM por nota.
+    """
+    por_nota: List[List[Dict]] = [[] for _ in range(n_notas)]
+    if not tabela.tem_coluna("decl_icms") or df.empty:
+        return por_nota
+    pos = df.index.to_numpy()
+    d = _diferencas(tabela, pos, df)
+    if d.empty:
+        return por_nota
+    total = len(d)
+    linha = d["linha"].to_numpy()
+    d["nota"] = df["nota"].to_numpy()[linha]
+    d["item"] = df["item"].to_numpy()[linha]
+    d["pos"] = pos[linha]
+    # maiores diferenças primeiro dentro de cada nota (mesma ordem de divergencias_por_item)
+    d = d.assign(_abs=d["diferenca"].abs()).sort_values(["nota", "_abs"], ascending=[True, False], kind="stable")
+    d = d[d.groupby("nota").cumcount().to_numpy() < LIMITE_DIVERGENCIAS_ITEM]
+    registros = _registros(tabela, d, d["pos"].to_numpy())
+    for n, idx in registros.groupby(d["nota"].to_numpy(), sort=False).indices.items():
+        por_nota[n] = registros.iloc[idx].to_dict("records")
+    print(f"   ⚠️ {total:,} divergências item a item em {d['nota'].nunique():,} notas (calculado × declarado no item)")
+    return por_nota
+
+def calcular_legados_item_a_item(nota: NotaFiscal, matriz: Dict) -> Tuple[List[Dict], Dict[str, float]]:
+    
+    itens = getattr(nota, "itens", []) or []
+    if not itens:
+        return [], {}
+    
+    df_itens = _frame_itens(itens)
     
     df_itens = df_itens[df_itens["valor_total"] > 0].copy()
     
@@ -76,14 +203,7 @@ def calcular_legados_item_a_item(nota: NotaFiscal, matriz: Dict) -> Tuple[List[D
     
     tem_servico = df_itens["subitem_lc116"].ne("").any()
     
-    tem_nao_contrib = False
-    if hasattr(nota, 'itens') and nota.itens:
-        for item in nota.itens:
-            if hasattr(item, '__dict__'):
-                attrs = str(item.__dict__).upper()
-                if "NAO CON" in attrs or "NAOCON" in attrs:
-                    tem_nao_contrib = True
-                    break
+    tem_nao_contrib = _tem_nao_contribuinte(itens)
     
     valor = df_itens["valor_total"]
     
@@ -105,7 +225,7 @@ def calcular_legados_item_a_item(nota: NotaFiscal, matriz: Dict) -> Tuple[List[D
     df_iss = matriz.get("iss", pd.DataFrame())
     if not df_iss.empty and "aliquota_iss" in df_iss.columns:
         iss_map = dict(zip(df_iss["subitem_lc116"], df_iss["aliquota_iss"]))
-        df_itens["iss_aliq"] = df_itens["subitem_lc116"].map(iss_map).fillna(0).apply(_to_float)
+        df_itens["iss_aliq"] = _mapear(df_itens["subitem_lc116"], iss_map)
         df_itens["iss"] = (valor * df_itens["iss_aliq"]).round(2)
     else:
         df_itens["iss"] = 0.0
@@ -117,7 +237,7 @@ def calcular_legados_item_a_item(nota: NotaFiscal, matriz: Dict) -> Tuple[List[D
         
         if not df_st_clean.empty:
             st_map = dict(zip(df_st_clean["ncm"], df_st_clean["mva"]))
-            df_itens["mva"] = df_itens["ncm"].map(st_map).fillna(0).apply(_to_float)
+            df_itens["mva"] = _mapear(df_itens["ncm"], st_map)
             st_base = valor * (1 + df_itens["mva"])
             st_icms = st_base * aliq_icms
             df_itens["st"] = (st_icms - df_itens["icms"]).round(2)
@@ -164,10 +284,266 @@ def calcular_legados_item_a_item(nota: NotaFiscal, matriz: Dict) -> Tuple[List[D
     print(f"   Total PIS: R$ {tot['pis']:,.2f}")
     print(f"   Total COFINS: R$ {tot['cofins']:,.2f}")
     
-    linhas = []
+    # XML: imposto declarado em cada det → divergências por item
+    linhas = divergencias_por_item(itens, df_itens)
     
     return linhas, tot
 
+# ---------- out-of-core: somas parciais por chunk ----------
+# Regras que dependem da nota INTEIRA (não contribuinte zera ICMS e muda a ST;
+# serviço zera IPI) não podem ser decididas num chunk: cada parcial guarda as duas
+# variantes + as flags, e finalizar_parciais aplica a regra no fim.
+_PARCIAIS = ("icms", "ipi", "pis", "cofins", "irpj", "csll", "iss", "st", "st_sem_icms", "difal")
+
+def calcular_parciais(nota: NotaFiscal, itens, matriz: Dict) -> Dict[str, float]:
+    """Somas de UM pedaço dos itens da nota (mesmas fórmulas de calcular_legados_item_a_item)."""
+    parcial = {k: 0.0 for k in _PARCIAIS}
+    parcial.update({"itens": 0, "nao_contrib": False, "servico": False})
+    if not itens or not len(itens):
+        return parcial
+    parcial["nao_contrib"] = _tem_nao_contribuinte(itens)
+
+    df_itens = _frame_itens(itens)
+    df_itens = df_itens[df_itens["valor_total"] > 0]
+    if df_itens.empty:
+        return parcial
+
+    fed = matriz.get("federais", pd.DataFrame())
+    icms_uf = matriz.get("icms_uf", pd.DataFrame())
+    aliq_icms = _icms_aliq(icms_uf, getattr(nota, "emissor_uf", "") or "")
+    valor = df_itens["valor_total"]
+
+    icms = (valor * aliq_icms).round(2)
+    parcial["itens"] = len(df_itens)
+    parcial["servico"] = bool(df_itens["subitem_lc116"].ne("").any())
+    parcial["icms"] = float(icms.sum())
+    parcial["ipi"] = float((valor * _aliq_federais(fed, "IPI")).round(2).sum())
+    for imp, trib in (("pis", "PIS"), ("cofins", "COFINS"), ("irpj", "IRPJ"), ("csll", "CSLL")):
+        parcial[imp] = float((valor * _aliq_federais(fed, trib)).round(2).sum())
+
+    df_iss = matriz.get("iss", pd.DataFrame())
+    if not df_iss.empty and "aliquota_iss" in df_iss.columns:
+        iss_map = dict(zip(df_iss["subitem_lc116"], df_iss["aliquota_iss"]))
+        parcial["iss"] = float((valor * _mapear(df_itens["subitem_lc116"], iss_map)).round(2).sum())
+
+    df_st = matriz.get("st_mva", pd.DataFrame())
+    if not df_st.empty:
+        uf = str(getattr(nota, "emissor_uf", "") or "").strip().upper()
+        df_st_clean = df_st[df_st["uf"].astype(str).str.strip().str.upper() == uf]
+        if not df_st_clean.empty:
+            st_map = dict(zip(df_st_clean["ncm"], df_st_clean["mva"]))
+            mva = _mapear(df_itens["ncm"], st_map)
+            st_icms = valor * (1 + mva) * aliq_icms
+            st = (st_icms - icms).round(2)
+            parcial["st"] = float(st.where(st >= 0, 0.0).sum())
+            st_sem = st_icms.round(2)
+            parcial["st_sem_icms"] = float(st_sem.where(st_sem >= 0, 0.0).sum())
+
+    df_difal = matriz.get("difal", pd.DataFrame())
+    if not df_difal.empty:
+        uf_orig = str(getattr(nota, "emissor_uf", "") or "").strip().upper()
+        uf_dest = str(getattr(nota, "destinatario_uf", "") or "").strip().upper()
+        if uf_orig and uf_dest and uf_orig != uf_dest:
+            filtro_difal = df_difal[
+                (df_difal["uf_origem"].astype(str).str.strip().str.upper() == uf_orig) &
+                (df_difal["uf_destino"].astype(str).str.strip().str.upper() == uf_dest)
+            ]
+            if not filtro_difal.empty:
+                difal_pct = _to_float(filtro_difal.iloc[0].get("difal")) or 0.0
+                parcial["difal"] = float((valor * difal_pct).round(2).sum())
+    return parcial
+
+def somar_parciais(acum: Dict[str, float], parcial: Dict[str, float]) -> Dict[str, float]:
+    """Reduz um parcial no acumulado (somas + OU das flags)."""
+    if not acum:
+        return dict(parcial)
+    for k in _PARCIAIS + ("itens",):
+        acum[k] += parcial[k]
+    acum["nao_contrib"] = acum["nao_contrib"] or parcial["nao_contrib"]
+    acum["servico"] = acum["servico"] or parcial["servico"]
+    return acum
+
+def finalizar_parciais(acum: Dict[str, float]) -> Dict[str, float]:
+    """Totais da nota (mesmo formato de calcular_legados_item_a_item; {} se sem itens)."""
+    if not acum or not acum.get("itens"):
+        return {}
+    nao_contrib = acum["nao_contrib"]
+    return {
+        "icms": 0.0 if nao_contrib else acum["icms"],
+        "ipi": 0.0 if acum["servico"] else acum["ipi"],
+        "pis": acum["pis"],
+        "cofins": acum["cofins"],
+        "irpj": acum["irpj"],
+        "csll": acum["csll"],
+        "iss": acum["iss"],
+        "st": acum["st_sem_icms"] if nao_contrib else acum["st"],
+        "difal": acum["difal"],
+    }
+
+_PADROES_NAO_CONTRIB = ("NAO CON", "NAOCON")  # mesma regra de _tem_nao_contribuinte
+_COLUNAS_TEXTO = ("codigo", "descricao", "ncm", "cfop", "subitem_lc116")
+
+def indice_por_chave(notas: List[NotaFiscal], tabela: ItemTable) -> np.ndarray:
+    """Posição em `notas` de cada linha da tabela, pela coluna "chave" (-1 = chave sem nota)."""
+    if not len(tabela):
+        return np.zeros(0, dtype=np.intp)
+    chaves = pd.Index([getattr(n, "chave", None) for n in notas])
+    return chaves.get_indexer(tabela.coluna("chave"))
+
+def _frame_lote(notas: List[NotaFiscal],
+                tabela: Optional[ItemTable] = None) -> Tuple[pd.DataFrame, np.ndarray, ItemTable]:
+    """Itens de todas as notas num único DataFrame (coluna "nota" = índice em `notas`,
+    "item" = nº do item na nota, index = linha da tabela)
+    + flag de não contribuinte por nota (mesma regra de _tem_nao_contribuinte) + a tabela usada.
+    tabela: itens de todas as notas já numa ItemTable com coluna "chave" (no lugar de nota.itens)."""
+    nao_contrib = np.zeros(len(notas), dtype=bool)
+    if tabela is None:
+        tabelas, tamanhos = [], []
+        for i, nota in enumerate(notas):
+            itens = getattr(nota, "itens", []) or []
+            if not isinstance(itens, ItemTable):
+                df = _frame_itens(itens).drop(columns="item_idx", errors="ignore")
+                nao_contrib[i] = len(df) > 0 and _tem_nao_contribuinte(itens)
+                itens = ItemTable(df)
+            tabelas.append(itens)
+            tamanhos.append(len(itens))
+        # dicionários de NCM/CFOP unidos 1x; descrições continuam em Arrow
+        tabela = ItemTable.concat(tabelas)
+        nota = np.repeat(np.arange(len(notas)), tamanhos)
+    else:
+        nota = indice_por_chave(notas, tabela)
+        if (nota < 0).any():
+            tabela = tabela.filtrar(nota >= 0)
+            nota = nota[nota >= 0]
+    if not len(tabela):
+        return pd.DataFrame(), nao_contrib, tabela
+
+    # texto em maiúsculas de qualquer coluna contém o padrão
+    flag = tabela.linhas_com_texto(_PADROES_NAO_CONTRIB, _COLUNAS_TEXTO)
+    nao_contrib[np.unique(nota[flag])] = True
+
+    df = tabela.frame(["valor_total", "ncm", "cfop", "subitem_lc116"], descricao=False).copy()
+    for c in ("ncm", "cfop", "subitem_lc116"):
+        df[c] = _texto_codificado(df[c])
+    df["nota"] = nota
+    df["item"] = pd.Series(nota).groupby(nota).cumcount().to_numpy() + 1
+    return df, nao_contrib, tabela
+
+def calcular_legados_lote(notas: List[NotaFiscal], matriz: Dict,
+                          tabela: Optional[ItemTable] = None) -> List[Dict[str, float]]:
+    """Totais de calcular_legados_lote_item_a_item (sem as divergências por item)."""
+    return calcular_legados_lote_item_a_item(notas, matriz, tabela=tabela)[1]
+
+def calcular_legados_lote_item_a_item(
+    notas: List[NotaFiscal], matriz: Dict, tabela: Optional[ItemTable] = None,
+) -> Tuple[List[List[Dict]], List[Dict[str, float]]]:
+    """
+    Mesmo cálculo de calcular_legados_item_a_item para VÁRIAS notas de uma vez
+    - Um único DataFrame com os itens de todas as notas
+    - Alíquotas por nota (UF emitente, DIFAL, ST, não contribuinte, serviço) viram colunas
+    - Totais por nota num groupby
+    - Itens com imposto declarado (NF-e XML): divergências por item de todas as notas num cálculo
+    tabela: itens de todas as notas numa só ItemTable, ligados às notas pela coluna "chave"
+            (ingestão em massa: evita separar e juntar de novo milhares de tabelas)
+    Retorna (divergências por item, totais), ambos na ordem de `notas`
+    ({} / [] para nota sem itens com valor).
+    """
+    if not notas:
+        return [], []
+    vazio = ([[] for _ in notas], [{} for _ in notas])
+    df, nao_contrib, tabela = _frame_lote(notas, tabela)
+    if df.empty:
+        return vazio
+    df = df[df["valor_total"] > 0].copy()
+    if df.empty:
+        return vazio
+
+    print(f"   Validando {len(df):,} itens de {len(notas):,} notas...")
+
+    fed = matriz.get("federais", pd.DataFrame())
+    icms_uf = matriz.get("icms_uf", pd.DataFrame())
+    aliq_pis = _aliq_federais(fed, "PIS")
+    aliq_cofins = _aliq_federais(fed, "COFINS")
+    aliq_ipi = _aliq_federais(fed, "IPI")
+    aliq_irpj = _aliq_federais(fed, "IRPJ")
+    aliq_csll = _aliq_federais(fed, "CSLL")
+
+    # ---------- parâmetros por nota ----------
+    uf_emit = [getattr(n, "emissor_uf", "") or "" for n in notas]
+    uf_orig = [str(u).strip().upper() for u in uf_emit]
+    uf_dest = [str(getattr(n, "destinatario_uf", "") or "").strip().upper() for n in notas]
+
+    cache_icms: Dict[str, float] = {}
+    aliq_icms_nota = np.array([
+        cache_icms[u] if u in cache_icms else cache_icms.setdefault(u, _icms_aliq(icms_uf, u))
+        for u in uf_emit
+    ])
+
+    df_difal = matriz.get("difal", pd.DataFrame())
+    cache_difal: Dict[Tuple[str, str], float] = {}
+    difal_nota = np.zeros(len(notas))
+    if not df_difal.empty:
+        orig_col = df_difal["uf_origem"].astype(str).str.strip().str.upper()
+        dest_col = df_difal["uf_destino"].astype(str).str.strip().str.upper()
+        for i, par in enumerate(zip(uf_orig, uf_dest)):
+            if not (par[0] and par[1] and par[0] != par[1]):
+                continue
+            if par not in cache_difal:
+                filtro = df_difal[(orig_col == par[0]) & (dest_col == par[1])]
+                cache_difal[par] = (_to_float(filtro.iloc[0].get("difal")) or 0.0) if not filtro.empty else 0.0
+            difal_nota[i] = cache_difal[par]
+
+    nota = df["nota"].to_numpy()
+    valor = df["valor_total"]
+    aliq_icms = pd.Series(aliq_icms_nota[nota], index=df.index)
+    servico_nota = df["subitem_lc116"].ne("").groupby(df["nota"]).any()
+    tem_servico = pd.Series(servico_nota.reindex(range(len(notas)), fill_value=False).to_numpy()[nota], index=df.index)
+
+    # ---------- mesmas fórmulas do cálculo por nota ----------
+    df["icms"] = (valor * aliq_icms).round(2).where(~nao_contrib[nota], 0.0)
+    df["ipi"] = (valor * aliq_ipi).round(2).where(~tem_servico, 0.0)
+    df["pis"] = (valor * aliq_pis).round(2)
+    df["cofins"] = (valor * aliq_cofins).round(2)
+    df["irpj"] = (valor * aliq_irpj).round(2)
+    df["csll"] = (valor * aliq_csll).round(2)
+
+    df_iss = matriz.get("iss", pd.DataFrame())
+    if not df_iss.empty and "aliquota_iss" in df_iss.columns:
+        iss_map = dict(zip(df_iss["subitem_lc116"], df_iss["aliquota_iss"]))
+        df["iss"] = (valor * _mapear(df["subitem_lc116"], iss_map)).round(2)
+    else:
+        df["iss"] = 0.0
+
+    df["st"] = 0.0
+    df_st = matriz.get("st_mva", pd.DataFrame())
+    if not df_st.empty:
+        uf_st = df_st["uf"].astype(str).str.strip().str.upper()
+        uf_item = np.asarray(uf_orig, dtype=object)[nota]
+        com_st = np.isin(uf_item, uf_st.unique())
+        if com_st.any():
+            # ncm → mva por UF (última ocorrência vence, como no dict por nota),
+            # convertido 1x por código de NCM
+            mva = pd.Series(0.0, index=df.index)
+            for uf in pd.unique(uf_item[com_st]):
+                da_uf = df_st[uf_st == uf]
+                sel = uf_item == uf
+                mva[sel] = _mapear(df["ncm"][sel], dict(zip(da_uf["ncm"].astype(str), da_uf["mva"]))).to_numpy()
+            st_icms = valor[com_st] * (1 + mva[com_st]) * aliq_icms[com_st]
+            st = (st_icms - df.loc[com_st, "icms"]).round(2)
+            df.loc[com_st, "st"] = st.where(st >= 0, 0.0)
+
+    df["difal"] = (valor * difal_nota[nota]).round(2)
+
+    impostos = ["icms", "ipi", "pis", "cofins", "irpj", "csll", "iss", "st", "difal"]
+    somas = df.groupby("nota")[impostos].sum()
+    resultado: List[Dict[str, float]] = [{} for _ in notas]
+    for i, linha in zip(somas.index, somas.itertuples(index=False, name=None)):
+        resultado[i] = {imp: float(v) for imp, v in zip(impostos, linha)}
+
+    total_icms = float(somas["icms"].sum())
+    print(f"   Total ICMS (lote): R$ {total_icms:,.2f}")
+    return divergencias_por_item_lote(tabela, df, len(notas)), resultado
+
 def calcular_legados(nota: NotaFiscal, matriz: Dict) -> Tuple[Calculados, Dict]:
     linhas, tot = calcular_legados_item_a_item(nota, matriz)
     c = Calculados()
@@ -0,0 +1,312 @@
+# validador_fiscal/tools/csv_stream.py
+"""
+Leitura de CSV em STREAMING (passada única)
+- Lê o arquivo uma vez só (sem contar linhas antes)
+- Progresso pelo offset em bytes do arquivo
+- Entrega chunks limitados para a próxima etapa (sem pd.concat do arquivo todo)
+- Tamanho do chunk derivado de um orçamento de memória + leitura antecipada (prefetch)
+- Backend plugável: Arrow (multithread, pyarrow.csv) ou pandas engine="python"
+- Aceita membros de zip/gz/zst (core.compactados), descompactados em stream
+- Leitura de um TRECHO de bytes (linha de cabeçalho + [inicio, fim)) para
+  ingestão incremental de arquivos que só crescem
+"""
+from __future__ import annotations
+import contextlib
+import io
+import os
+import queue
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+import numpy as np
+import pandas as pd
+
+from ..core.compactados import abrir, separar, tamanho, tipo
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    _HAS_ARROW = True
+except Exception:
+    pa = pacsv = None
+    _HAS_ARROW = False
+
+CHUNK_LINHAS = int(os.getenv("CSV_CHUNK_LINHAS", "50000"))
+
+# auto = Arrow se pyarrow estiver instalado | arrow | pandas
+CSV_BACKEND = os.getenv("CSV_BACKEND", "auto").strip().lower()
+
+# Orçamento de memória do pipeline out-of-core (MB) e quantos bytes em memória
+# (DataFrame com colunas object) cada byte do CSV costuma ocupar.
+MEMORIA_MAX_MB = float(os.getenv("PIPELINE_MEMORIA_MB", "1024"))
+FATOR_MEMORIA = float(os.getenv("PIPELINE_FATOR_MEMORIA", "10"))
+
+# progresso(bytes_lidos, bytes_total, linhas_lidas)
+Progresso = Callable[[int, int, int], None]
+
+
+def backend_csv(backend: Optional[str] = None) -> str:
+    """Backend efetivo ("arrow" ou "pandas") para o pedido/config (auto → arrow se disponível)."""
+    b = (backend or CSV_BACKEND or "auto").strip().lower()
+    if b == "auto":
+        return "arrow" if _HAS_ARROW else "pandas"
+    if b == "arrow" and not _HAS_ARROW:
+        print("⚠️ CSV_BACKEND=arrow sem pyarrow instalado: usando pandas")
+        return "pandas"
+    if b not in ("arrow", "pandas"):
+        raise ValueError(f"Backend CSV desconhecido: {b!r} (use auto, arrow ou pandas)")
+    return b
+
+
+def ler_csv_em_chunks(
+    path: str,
+    encoding: str,
+    sep: str,
+    chunk_size: int = CHUNK_LINHAS,
+    progresso: Optional[Progresso] = None,
+    usecols: Optional[List[str]] = None,
+    texto: Optional[Iterable[str]] = None,
+    backend: Optional[str] = None,
+    inicio: int = 0,
+    fim: Optional[int] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Gera DataFrames de até `chunk_size` linhas lendo o arquivo uma única vez.
+
+    Args:
+        path: arquivo CSV
+        encoding / sep: detectados por _sniff_csv
+        chunk_size: linhas por chunk
+        progresso: callback chamado após cada chunk
+        usecols: colunas a ler (None = todas)
+        texto: colunas lidas como texto (NCM/CFOP/chave mantêm zeros à esquerda)
+        backend: "arrow" | "pandas" | "auto" (padrão: CSV_BACKEND)
+        inicio / fim: só as linhas nos bytes [inicio, fim) de um CSV comum
+            (inicio no começo de uma linha, após o cabeçalho); o cabeçalho é relido
+    """
+    trecho = (inicio, fim) if inicio or fim is not None else None
+    if trecho and tipo(path):
+        raise ValueError(f"Leitura por trecho só em arquivo comum (não {tipo(path)}): {path}")
+    if backend_csv(backend) == "arrow":
+        leitor = _chunks_arrow(path, encoding, sep, chunk_size, usecols, trecho)
+    else:
+        leitor = _chunks_pandas(path, encoding, sep, chunk_size, usecols, texto, trecho)
+
+    total = fim if fim is not None else tamanho(path)
+    linhas = 0
+    for chunk, offset in leitor:
+        linhas += len(chunk)
+        if progresso:
+            # o leitor trabalha com buffer: o offset pode estar um pouco à frente
+            progresso(min(offset(), total), total, linhas)
+        yield chunk
+    if progresso:
+        progresso(total, total, linhas)
+
+
+def _chunks_pandas(path, encoding, sep, chunk_size, usecols, texto, trecho=None):
+    dtype: Optional[Dict[str, type]] = {c: str for c in texto} if texto else None
+    with (abrir_trecho(path, *trecho) if trecho else abrir(path)) as raw:
+        reader = pd.read_csv(
+            raw,
+            encoding=encoding,
+            sep=sep,
+            engine="python",
+            chunksize=chunk_size,
+            usecols=usecols,
+            dtype=dtype,
+        )
+        for chunk in reader:
+            yield chunk, raw.tell
+
+
+def _chunks_arrow(path, encoding, sep, chunk_size, usecols, trecho=None):
+    """
+    pyarrow.csv em streaming: blocos decodificados em C++ (threads do Arrow, fora do GIL).
+    Todas as colunas como texto: o schema do Arrow é fixado pelo 1º bloco e uma
+    inferência numérica quebraria em blocos seguintes (formato BR, células vazias);
+    a conversão numérica fica com converter_numeros, como no caminho pandas.
+    """
+    if not usecols:
+        with abrir(path) as f:
+            usecols = list(pd.read_csv(f, encoding=encoding, sep=sep, engine="python", nrows=0).columns)
+    colunas = usecols
+    bloco = int(min(max(bytes_por_linha(path) * chunk_size, 1 << 20), 512 << 20))
+    opcoes_leitura = pacsv.ReadOptions(
+        encoding=_codec_arrow(encoding),
+        block_size=bloco,
+        use_threads=True,
+    )
+    opcoes_conversao = pacsv.ConvertOptions(
+        include_columns=colunas,
+        column_types={c: pa.string() for c in colunas},
+        strings_can_be_null=True,  # vazio → NaN, como no pandas
+    )
+    with _entrada_arrow(path, trecho) as (raw, offset):
+        reader = pacsv.open_csv(
+            raw,
+            read_options=opcoes_leitura,
+            # descrição entre aspas com quebra de linha (o backend pandas aceita)
+            parse_options=pacsv.ParseOptions(delimiter=sep, newlines_in_values=True),
+            convert_options=opcoes_conversao,
+        )
+        for lote in reader:
+            if lote.num_rows == 0:
+                continue
+            df = lote.to_pandas()
+            # nulos do Arrow chegam como None; o parser espera NaN (igual ao pandas).
+            # where + infer_objects: coluna toda vazia vira float64, sem o downcast do fillna
+            df = df.where(df.notna(), np.nan).infer_objects(copy=False)
+            yield df, offset
+
+
+class _Trecho(io.RawIOBase):
+    """Linha de cabeçalho seguida dos bytes [inicio, fim) do arquivo; tell() = posição no arquivo."""
+
+    def __init__(self, f, cabecalho: bytes, inicio: int, fim: int):
+        self._f = f
+        self._cab = cabecalho
+        self._pos = inicio
+        self._fim = fim
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._cab:
+            n = min(len(b), len(self._cab))
+            b[:n] = self._cab[:n]
+            self._cab = self._cab[n:]
+            return n
+        dados = self._f.read(min(len(b), self._fim - self._pos))
+        n = len(dados)
+        b[:n] = dados
+        self._pos += n
+        return n
+
+    def tell(self) -> int:
+        return self._pos
+
+
+@contextlib.contextmanager
+def abrir_trecho(path: str, inicio: int, fim: Optional[int] = None):
+    """Stream binário com o cabeçalho + linhas em [inicio, fim) de um CSV comum."""
+    with open(path, "rb") as f:
+        cabecalho = f.readline()
+        inicio = max(inicio, f.tell())
+        fim = os.path.getsize(path) if fim is None else fim
+        f.seek(inicio)
+        raw = _Trecho(f, cabecalho, inicio, max(fim, inicio))
+        yield io.BufferedReader(raw, 1 << 20)
+
+
+@contextlib.contextmanager
+def _entrada_arrow(path: str, trecho=None):
+    """
+    (stream, offset) para o Arrow: arquivo comum direto; .gz/.zst descompactados em C++
+    (offset = posição no compactado, escalada para o tamanho descompactado);
+    membro de zip e trecho de arquivo via stream Python.
+    """
+    t = tipo(path)
+    if trecho:
+        with abrir_trecho(path, *trecho) as f:
+            yield pa.PythonFile(f, mode="r"), f.tell
+    elif t in ("gz", "zst"):
+        fisico = separar(path)[0]
+        escala = tamanho(path) / max(os.path.getsize(fisico), 1)
+        with pa.OSFile(fisico, "rb") as bruto:
+            with pa.CompressedInputStream(bruto, {"gz": "gzip", "zst": "zstd"}[t]) as f:
+                yield f, lambda: int(bruto.tell() * escala)
+    elif t == "zip":
+        with abrir(path) as f:
+            yield pa.PythonFile(f, mode="r"), f.tell
+    else:
+        with pa.OSFile(path, "rb") as f:
+            yield f, f.tell
+
+
+def _codec_arrow(encoding: str) -> str:
+    """Nome de encoding aceito pelo Arrow (utf8 é nativo; os demais via codec do Python)."""
+    e = (encoding or "utf-8").lower().replace("_", "-")
+    return "utf8" if e in ("utf-8", "utf8", "utf-8-sig", "ascii") else encoding
+
+
+def progresso_console(bytes_lidos: int, bytes_total: int, linhas: int) -> None:
+    """Progresso padrão no console (mesmo formato dos demais prints do parser)."""
+    pct = (bytes_lidos / bytes_total * 100) if bytes_total else 100.0
+    print(f"   {linhas:,} linhas | {bytes_lidos / 1e6:,.1f}/{bytes_total / 1e6:,.1f} MB ({pct:.0f}%)")
+
+
+def bytes_por_linha(path: str, amostra: int = 256 * 1024) -> float:
+    """Tamanho médio de linha (bytes) pelas primeiras linhas do arquivo."""
+    with abrir(path) as f:
+        bloco = f.read(amostra)
+    linhas = bloco.count(b"\n")
+    if not linhas:
+        return float(max(len(bloco), 1))
+    return len(bloco) / linhas
+
+
+def linhas_por_orcamento(path: str, memoria_mb: Optional[float] = None, chunks_em_voo: int = 4) -> int:
+    """
+    Linhas por chunk para caber no orçamento de memória.
+    chunks_em_voo: chunk em cálculo + chunk na fila do prefetch + chunk sendo lido + frame do motor.
+    """
+    orcamento = (memoria_mb or MEMORIA_MAX_MB) * 1024 * 1024
+    por_linha = bytes_por_linha(path) * FATOR_MEMORIA
+    linhas = int(orcamento / (chunks_em_voo * por_linha))
+    return max(1000, min(linhas, 2_000_000))
+
+
+def cabe_na_memoria(path: str, memoria_mb: Optional[float] = None) -> bool:
+    """True se o arquivo inteiro em DataFrame cabe no orçamento (sem out-of-core)."""
+    orcamento = (memoria_mb or MEMORIA_MAX_MB) * 1024 * 1024
+    return tamanho(path) * FATOR_MEMORIA <= orcamento
+
+
+T = TypeVar("T")
+
+
+def prefetch(iteravel: Iterable[T], buffer: int = 1) -> Iterator[T]:
+    """
+    Consome `iteravel` numa thread, até `buffer` itens à frente do consumidor
+    (lê o próximo chunk enquanto o atual é calculado). Erros da leitura sobem no consumidor.
+    """
+    fila: "queue.Queue" = queue.Queue(maxsize=max(1, buffer))
+    parar = threading.Event()
+
+    def _put(item) -> bool:
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produtor():
+        try:
+            for x in iteravel:
+                if not _put(("ok", x)):
+                    return
+            _put(("fim", None))
+        except BaseException as e:  # repassado ao consumidor
+            _put(("erro", e))
+
+    t = threading.Thread(target=_produtor, name="csv-prefetch", daemon=True)
+    t.start()
+    try:
+        while True:
+            tipo, x = fila.get()
+            if tipo == "fim":
+                return
+            if tipo == "erro":
+                raise x
+            yield x
+    finally:
+        parar.set()
+        # saída antecipada: espera o chunk em leitura e fecha a fonte (arquivo aberto) já, sem esperar o GC
+        t.join()
+        fechar = getattr(iteravel, "close", None)
+        if fechar is not None:
+            fechar()
@@ -0,0 +1,210 @@
+# validador_fiscal/tools/indice_validados.py
+"""
+ÍNDICE de documentos já validados (reenvios e XMLs repetidos no lote)
+- (hash do conteúdo do documento, versão da matriz, chave) → resultado da nota já calculado
+- Consultado ANTES do parse: documento igual + mesma matriz = resultado guardado
+- Filtro de Bloom na frente do SQLite: num lote grande a maioria dos documentos é nova
+  e o "não está" sai da memória, sem consulta ao banco
+- Matriz, parser ou motor diferente = outra versão: nada é reaproveitado entre versões
+- XML avulso (pipeline de uma nota): relatório completo, numa versão própria (versao_relatorio)
+"""
+from __future__ import annotations
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import struct
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..core import compactados
+from ..taxes.legacy_engine import VERSAO_MOTOR
+from ..taxes.matriz_loader import load_matriz
+from .ingestao_incremental import _hash_matriz
+from .nf_parse_tool import PARSER_VERSION
+
+INDICE_VALIDADOS_DB = os.getenv("INDICE_VALIDADOS_DB", "data/cache/validados.sqlite")
+# 0 desliga o índice (carteira de XMLs e XML avulso)
+INDICE_VALIDADOS = os.getenv("INDICE_VALIDADOS", "1").strip().lower() not in ("0", "false", "nao", "não")
+# dimensionamento do filtro (cresce sozinho quando enche)
+INDICE_BLOOM_CAPACIDADE = int(os.getenv("INDICE_BLOOM_CAPACIDADE", "1000000"))
+INDICE_BLOOM_ERRO = float(os.getenv("INDICE_BLOOM_ERRO", "0.01"))
+
+_BLOCO = 4 * 1024 * 1024
+_CABECALHO_BLOOM = struct.Struct("<QQQQ")  # bits, funções de hash, itens, capacidade
+
+
+def hash_documento(ref: str) -> str:
+    """Hash do conteúdo (descompactado, para membros de zip/gz/zst) do documento."""
+    h = hashlib.blake2b(digest_size=20)
+    with compactados.abrir(ref) as f:
+        for bloco in iter(lambda: f.read(_BLOCO), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def versao_matriz(matriz: Optional[Dict[str, Any]] = None) -> str:
+    """Versão do cálculo: matriz fiscal (hash do conteúdo das tabelas) + versões do parser e do motor."""
+    return f"{_hash_matriz(matriz if matriz is not None else load_matriz())}|{PARSER_VERSION}|{VERSAO_MOTOR}"
+
+
+def versao_relatorio(versao: str, usar_cbs_oficial: bool = True) -> str:
+    """Versão sob a qual fica o relatório completo de um XML avulso (separado dos resultados por nota do lote)."""
+    return f"{versao}:relatorio:cbs={int(bool(usar_cbs_oficial))}"
+
+
+def documento_avulso(xml_file: str, usar_cbs_oficial: bool = True) -> Optional[Tuple[str, str]]:
+    """(hash, versão) do relatório de um XML avulso; compactado vale pelo primeiro .xml, como no parse."""
+    if compactados.tipo(xml_file):
+        xmls = compactados.expandir([xml_file], (".xml",))
+        xml_file = xmls[0] if xmls else None
+    if not xml_file or not compactados.existe(xml_file):
+        return None
+    return hash_documento(xml_file), versao_relatorio(versao_matriz(), usar_cbs_oficial)
+
+
+class FiltroBloom:
+    """Pertinência aproximada: "não" é certo, "sim" erra com probabilidade ~erro."""
+
+    def __init__(self, capacidade: int, erro: float = INDICE_BLOOM_ERRO):
+        self.capacidade = max(1, capacidade)
+        self.m = max(64, int(-self.capacidade * math.log(erro) / math.log(2) ** 2))
+        self.k = max(1, round(self.m / self.capacidade * math.log(2)))
+        self.n = 0
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _posicoes(self, chave: str) -> List[int]:
+        # duas hashes de 64 bits → k posições (hashing duplo)
+        d = hashlib.blake2b(chave.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def adicionar(self, chave: str) -> None:
+        for p in self._posicoes(chave):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.n += 1
+
+    def __contains__(self, chave: str) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] >> (p & 7) & 1 for p in self._posicoes(chave))
+
+    @property
+    def cheio(self) -> bool:
+        return self.n > self.capacidade
+
+    def salvar(self, path: str) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_CABECALHO_BLOOM.pack(self.m, self.k, self.n, self.capacidade))
+            f.write(self.bits)
+        os.replace(tmp, path)
+
+    @classmethod
+    def carregar(cls, path: str) -> Optional["FiltroBloom"]:
+        try:
+            with open(path, "rb") as f:
+                m, k, n, capacidade = _CABECALHO_BLOOM.unpack(f.read(_CABECALHO_BLOOM.size))
+                bits = bytearray(f.read())
+        except (OSError, struct.error):
+            return None
+        if len(bits) != (m + 7) // 8:
+            return None
+        filtro = cls.__new__(cls)
+        filtro.m, filtro.k, filtro.n, filtro.capacidade, filtro.bits = m, k, n, capacidade, bits
+        return filtro
+
+
+def _chave_bloom(hash_doc: str, versao: str) -> str:
+    return f"{hash_doc}:{versao}"
+
+
+class IndiceValidados:
+    """
+    Resultados por documento já validado (SQLite) + filtro de Bloom persistido ao lado.
+    Um documento pode ter várias notas (lotes enviNFe): uma linha por chave.
+    """
+
+    def __init__(self, path: str = INDICE_VALIDADOS_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS validados ("
+            " hash TEXT, matriz TEXT, chave TEXT, resultado TEXT, criado REAL,"
+            " PRIMARY KEY (hash, matriz, chave))"
+        )
+        self._con.execute("CREATE INDEX IF NOT EXISTS validados_chave ON validados (chave)")
+        self._con.commit()
+        self._bloom = self._abrir_bloom()
+
+    def _contagem(self) -> int:
+        return self._con.execute("SELECT COUNT(*) FROM validados").fetchone()[0]
+
+    def _abrir_bloom(self) -> FiltroBloom:
+        n = self._contagem()
+        filtro = FiltroBloom.carregar(self.path + ".bloom")
+        if filtro is not None and filtro.n == n and not filtro.cheio:
+            return filtro
+        return self._reconstruir_bloom(n)
+
+    def _reconstruir_bloom(self, n: int) -> FiltroBloom:
+        """Filtro refeito a partir do banco (arquivo ausente/defasado ou capacidade estourada)."""
+        filtro = FiltroBloom(max(INDICE_BLOOM_CAPACIDADE, 2 * n))
+        for hash_doc, versao in self._con.execute("SELECT hash, matriz FROM validados"):
+            filtro.adicionar(_chave_bloom(hash_doc, versao))
+        filtro.n = n
+        return filtro
+
+    def talvez_validado(self, hash_doc: str, versao: str) -> bool:
+        """Pré-checagem em memória: False = certamente novo."""
+        return _chave_bloom(hash_doc, versao) in self._bloom
+
+    def procurar(self, hash_doc: str, versao: str) -> Optional[List[Dict[str, Any]]]:
+        """Resultados guardados das notas do documento, ou None se nunca validado com esta matriz."""
+        if not self.talvez_validado(hash_doc, versao):
+            return None
+        linhas = self._con.execute(
+            "SELECT resultado FROM validados WHERE hash = ? AND matriz = ? ORDER BY rowid",
+            (hash_doc, versao),
+        ).fetchall()
+        return [json.loads(r[0]) for r in linhas] if linhas else None
+
+    def registrar(self, registros: Iterable[Tuple[str, str, str, Dict[str, Any]]]) -> int:
+        """Grava (hash_doc, versão da matriz, chave, resultado da nota). Retorna quantos."""
+        agora = time.time()
+        linhas = [(h, v, c, json.dumps(r, ensure_ascii=False, default=str), agora) for h, v, c, r in registros]
+        if not linhas:
+            return 0
+        with self._con:
+            self._con.executemany(
+                "INSERT OR REPLACE INTO validados (hash, matriz, chave, resultado, criado) VALUES (?, ?, ?, ?, ?)",
+                linhas,
+            )
+        for h, v, _, _, _ in linhas:
+            self._bloom.adicionar(_chave_bloom(h, v))
+        self._bloom.n = self._contagem()
+        if self._bloom.cheio:
+            self._bloom = self._reconstruir_bloom(self._bloom.n)
+        return len(linhas)
+
+    def esquecer_matriz(self, versao: str) -> int:
+        """Remove os resultados de uma versão do cálculo (o filtro é refeito na próxima abertura)."""
+        with self._con:
+            cur = self._con.execute("DELETE FROM validados WHERE matriz IN (?, ?, ?)",
+                                    (versao, versao_relatorio(versao, False), versao_relatorio(versao, True)))
+        return cur.rowcount
+
+    def fechar(self) -> None:
+        try:
+            self._bloom.salvar(self.path + ".bloom")
+        except OSError as e:
+            print(f"⚠️ Falha ao gravar filtro do índice: {e}")
+        self._con.close()
+
+    def __enter__(self) -> "IndiceValidados":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.fechar()
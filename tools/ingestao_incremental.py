@@ -0,0 +1,201 @@
+# validador_fiscal/tools/ingestao_incremental.py
+"""
+Ingestão INCREMENTAL de CSVs de itens que crescem durante o mês (append do ERP)
+- Marca d'água por arquivo: offset em bytes + hash da última linha lida
+- Na execução seguinte, só as linhas acrescentadas depois do offset são lidas
+  e calculadas; os parciais do motor são somados aos da execução anterior
+- Arquivo reescrito/truncado, cabeçalho da nota, matriz ou versão do parser
+  diferentes → recomeça do zero
+- Linha final ainda sem quebra de linha (ERP escrevendo) fica para a próxima
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import pandas as pd
+
+from ..core import compactados
+from ..taxes.matriz_loader import load_matriz
+from .nf_parse_tool import PARSER_VERSION, NotaFiscal, _par_csv, _parse_csv_streaming
+from .csv_stream import Progresso
+
+INCREMENTAL_DIR = os.getenv("INCREMENTAL_DIR", "data/cache/incremental")
+
+_BLOCO = 64 * 1024
+
+
+@dataclass
+class MarcaDagua:
+    offset: int = 0  # fim da última linha completa já calculada
+    hash_linha: str = ""  # hash dessa última linha (detecta reescrita do arquivo)
+    hash_cabecalho: str = ""  # hash da linha de cabeçalho do CSV de itens
+
+
+@dataclass
+class Incremental:
+    """Execução incremental em andamento: salva com concluir() depois do cálculo."""
+    itens_file: str
+    cabecalho_file: str
+    assinatura: Dict[str, str]
+    marca: MarcaDagua
+    base: Optional[Dict[str, Any]] = None  # "streaming" acumulado da execução anterior
+    bytes_novos: int = 0
+    motivo: str = ""  # por que recalculou do zero ("" = incremental)
+
+
+def _hash(dados: bytes) -> str:
+    return hashlib.blake2b(dados, digest_size=16).hexdigest()
+
+
+def _hash_arquivo(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with compactados.abrir(path) as f:
+        for bloco in iter(lambda: f.read(4 * 1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _hash_matriz(matriz: Dict[str, Any]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for nome in sorted(matriz):
+        df = matriz[nome]
+        h.update(nome.encode("utf-8"))
+        if isinstance(df, pd.DataFrame) and not df.empty:
+            h.update(",".join(map(str, df.columns)).encode("utf-8"))
+            h.update(pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _fim_ultima_linha(f, tamanho: int) -> int:
+    """Posição logo após a última quebra de linha (0 se não houver)."""
+    pos = tamanho
+    while pos > 0:
+        ini = max(0, pos - _BLOCO)
+        f.seek(ini)
+        i = f.read(pos - ini).rfind(b"\n")
+        if i >= 0:
+            return ini + i + 1
+        pos = ini
+    return 0
+
+
+def _linha_antes(f, offset: int) -> bytes:
+    """Última linha completa que termina em `offset` (com a quebra de linha)."""
+    ini = max(0, offset - _BLOCO)
+    f.seek(ini)
+    bloco = f.read(offset - ini)
+    return bloco[bloco.rfind(b"\n", 0, len(bloco) - 1) + 1:]
+
+
+def _arquivo_estado(itens_file: str) -> str:
+    chave = _hash(os.path.abspath(itens_file).encode("utf-8"))
+    return os.path.join(INCREMENTAL_DIR, f"{chave}.json")
+
+
+def carregar_estado(itens_file: str) -> Optional[Dict[str, Any]]:
+    p = _arquivo_estado(itens_file)
+    if not os.path.exists(p):
+        return None
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Estado incremental corrompido ({os.path.basename(p)}): {e}")
+        return None
+
+
+def _salvar_estado(itens_file: str, estado: Dict[str, Any]) -> None:
+    os.makedirs(INCREMENTAL_DIR, exist_ok=True)
+    p = _arquivo_estado(itens_file)
+    tmp = p + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(tmp, p)
+
+
+def esquecer(itens_file: str) -> None:
+    """Apaga a marca d'água (próxima execução recalcula o arquivo inteiro)."""
+    p = _arquivo_estado(itens_file)
+    if os.path.exists(p):
+        os.remove(p)
+
+
+def parse_csv_incremental(
+    nf_csv_file,
+    progresso: Optional[Progresso] = None,
+) -> Tuple[NotaFiscal, Iterator, Incremental]:
+    """
+    Cabeçalho + chunks SÓ das linhas novas do CSV de itens + estado da execução.
+    Passe inc.base ao Motor Fiscal (run_streaming) e chame concluir(inc, streaming) no fim.
+    nf_csv_file: CSV de cabeçalho ou lista [cabeçalho, itens] (arquivos comuns, não compactados).
+    """
+    cab, itm = _par_csv(nf_csv_file)
+    if not (cab and itm):
+        raise FileNotFoundError("Ingestão incremental precisa do CSV de cabeçalho e do CSV de itens.")
+    if compactados.tipo(itm):
+        raise ValueError(f"Ingestão incremental só em CSV comum (arquivo que cresce), não {compactados.tipo(itm)}")
+
+    assinatura = {
+        "parser": PARSER_VERSION,
+        "cabecalho": _hash_arquivo(cab),
+        "matriz": _hash_matriz(load_matriz()),
+    }
+    with open(itm, "rb") as f:
+        tamanho = os.path.getsize(itm)
+        linha_cab = f.readline()
+        if not linha_cab.endswith(b"\n"):
+            linha_cab = b""  # nem o cabeçalho está completo: nada a ler ainda
+        fim = max(_fim_ultima_linha(f, tamanho), len(linha_cab))
+        estado = carregar_estado(itm)
+        marca_ant = MarcaDagua(**estado["marca"]) if estado else None
+
+        motivo = ""
+        if estado is None:
+            motivo = "primeira execução"
+        elif estado.get("assinatura") != assinatura:
+            difs = [k for k in assinatura if (estado.get("assinatura") or {}).get(k) != assinatura[k]]
+            motivo = f"mudou: {', '.join(difs)}"
+        elif marca_ant.hash_cabecalho != _hash(linha_cab):
+            motivo = "cabeçalho do CSV de itens mudou"
+        elif marca_ant.offset > fim:
+            motivo = "arquivo menor que a marca d'água (truncado/reescrito)"
+        elif marca_ant.offset > len(linha_cab) and _hash(_linha_antes(f, marca_ant.offset)) != marca_ant.hash_linha:
+            motivo = "linhas já lidas foram alteradas"
+        marca = MarcaDagua(
+            offset=fim,
+            hash_linha=_hash(_linha_antes(f, fim)) if fim > len(linha_cab) else "",
+            hash_cabecalho=_hash(linha_cab),
+        )
+
+    if motivo:
+        print(f"🔄 Incremental: recalculando do zero ({motivo})")
+        inicio, base = 0, None
+    else:
+        inicio, base = marca_ant.offset, estado["streaming"]
+        print(f"➕ Incremental: {(fim - inicio) / 1e6:,.2f} MB novos desde a última execução "
+              f"({base.get('total_itens', 0):,} itens já calculados)")
+
+    # mesmo critério do parse_csv_streaming: lista [cab, itens] = itens sem filtro extra
+    nf, partes = _parse_csv_streaming(
+        cab, itens_file=itm, filtrar_zerados=not isinstance(nf_csv_file, list),
+        progresso=progresso, inicio=inicio, fim=fim,
+    )
+    inc = Incremental(itens_file=itm, cabecalho_file=cab, assinatura=assinatura, marca=marca,
+                      base=base, bytes_novos=fim - max(inicio, len(linha_cab)), motivo=motivo)
+    return nf, partes, inc
+
+
+def concluir(inc: Incremental, streaming: Dict[str, Any]) -> None:
+    """Grava a nova marca d'água + totais acumulados (só depois do cálculo terminar)."""
+    acumulado = {k: streaming.get(k) for k in ("parciais", "total_itens", "total_produtos", "contadores")}
+    _salvar_estado(inc.itens_file, {
+        "itens_file": os.path.abspath(inc.itens_file),
+        "cabecalho_file": os.path.abspath(inc.cabecalho_file),
+        "assinatura": inc.assinatura,
+        "marca": asdict(inc.marca),
+        "streaming": acumulado,
+    })
+    print(f"💾 Marca d'água: {inc.marca.offset:,} bytes | {acumulado['total_itens'] or 0:,} itens acumulados")
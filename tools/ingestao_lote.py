@@ -0,0 +1,220 @@
+# validador_fiscal/tools/ingestao_lote.py
+"""
+INGESTÃO EM LOTE de vários pares cabeçalho + itens (fechamento do mês)
+- Entrada: pastas e/ou arquivos (CSV, zip, gz, zst), em qualquer mistura
+- Papel de cada CSV pelas colunas (itens têm NCM/CFOP/descrição), não pelo nome
+- Pares formados pela CHAVE DE ACESSO; sem coluna de chave, pela pasta
+- Cada par é lido num processo do pool; os resultados saem na ordem em que terminam
+"""
+from __future__ import annotations
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from ..core import compactados
+from ..core.column_aliases import compilar_plano
+from .nf_parse_tool import NotaFiscal, _ler_csv, _parse_csv_any, _parse_csv_lote, _sniff_csv
+
+# 0 = um processo por núcleo
+INGESTAO_WORKERS = int(os.getenv("INGESTAO_WORKERS", "0"))
+# Chaves lidas do início de cada CSV de itens para achar o cabeçalho
+AMOSTRA_CHAVES = int(os.getenv("INGESTAO_AMOSTRA_CHAVES", "1000"))
+
+EXTENSOES = (".csv", ".zip") + compactados.EXT_GZ + compactados.EXT_ZST
+# Campos que só existem no CSV de itens
+_CAMPOS_SO_ITEM = ("ncm", "cfop", "descricao", "quantidade", "valor_unitario")
+
+
+@dataclass
+class ParCSV:
+    cabecalho: str
+    itens: Optional[str] = None
+    chaves: int = 0  # notas no cabeçalho (>1 → leitura em lote, separando por chave)
+
+
+@dataclass
+class ResultadoPar:
+    par: ParCSV
+    notas: List[NotaFiscal] = field(default_factory=list)
+    erro: Optional[str] = None
+    segundos: float = 0.0
+
+
+@dataclass
+class _Arquivo:
+    ref: str
+    itens: bool
+    chaves: List[str]
+    pasta: str
+
+
+def listar_csvs(fontes: Union[str, Iterable[str]]) -> List[str]:
+    """Referências de todos os CSVs (pastas percorridas, compactados abertos em membros)."""
+    if isinstance(fontes, str):
+        fontes = [fontes]
+    arquivos: List[str] = []
+    for f in fontes:
+        if f and os.path.isdir(f):
+            for raiz, subpastas, nomes in os.walk(f):
+                subpastas.sort()
+                arquivos.extend(os.path.join(raiz, n) for n in sorted(nomes) if n.lower().endswith(EXTENSOES))
+        elif f:
+            arquivos.append(f)
+    return compactados.expandir(arquivos)
+
+
+def _examinar(ref: str) -> _Arquivo:
+    """Papel (cabeçalho/itens) e chaves do CSV, lendo só a coluna de chave."""
+    cfg = _sniff_csv(ref)
+    plano = compilar_plano(_ler_csv(ref, cfg, nrows=0).columns)
+    itens = any(plano.tem(c) for c in _CAMPOS_SO_ITEM)
+    col_chave = plano.coluna("chave")
+    chaves: List[str] = []
+    if col_chave:
+        df = _ler_csv(ref, cfg, usecols=[col_chave], dtype=str, nrows=AMOSTRA_CHAVES if itens else None)
+        chaves = [c for c in df[col_chave].dropna().str.strip().unique() if c]
+    fisico, membro = compactados.separar(ref)
+    pasta = os.path.dirname(os.path.join(fisico, membro) if membro else fisico)
+    return _Arquivo(ref, itens, chaves, pasta)
+
+
+def descobrir_pares(fontes: Union[str, Iterable[str]]) -> List[ParCSV]:
+    """
+    Pares cabeçalho + itens de pastas/arquivos, casados pela CHAVE DE ACESSO.
+    Itens sem coluna de chave vão para o único cabeçalho sem itens da mesma pasta.
+    """
+    arquivos = []
+    for ref in listar_csvs(fontes):
+        try:
+            arquivos.append(_examinar(ref))
+        except Exception as e:
+            print(f"⚠️ Ignorando {compactados.nome(ref)}: {e}")
+
+    cabecalhos = [a for a in arquivos if not a.itens]
+    pares = [ParCSV(a.ref, None, len(a.chaves)) for a in cabecalhos]
+    dono: Dict[str, int] = {}
+    for i, a in enumerate(cabecalhos):
+        for c in a.chaves:
+            dono.setdefault(c, i)
+
+    for a in (a for a in arquivos if a.itens):
+        votos: Dict[int, int] = {}
+        for c in a.chaves:
+            if c in dono:
+                votos[dono[c]] = votos.get(dono[c], 0) + 1
+        if votos:
+            i = max(votos, key=votos.get)
+        else:
+            livres = [i for i, cab in enumerate(cabecalhos)
+                      if cab.pasta == a.pasta and pares[i].itens is None]
+            i = livres[0] if len(livres) == 1 and not a.chaves else None
+        if i is None:
+            print(f"⚠️ Itens sem cabeçalho correspondente: {compactados.nome(a.ref)}")
+        elif pares[i].itens is not None:
+            print(f"⚠️ {compactados.nome(a.ref)}: cabeçalho {compactados.nome(pares[i].cabecalho)} "
+                  f"já tem itens ({compactados.nome(pares[i].itens)}); ignorado")
+        else:
+            pares[i].itens = a.ref
+
+    sem_itens = sum(p.itens is None for p in pares)
+    print(f"🗂️  {len(pares):,} pares encontrados em {len(arquivos):,} CSVs"
+          + (f" ({sem_itens:,} sem itens)" if sem_itens else ""))
+    return pares
+
+
+def _sem_progresso(bytes_lidos: int, bytes_total: int, linhas: int) -> None:
+    pass
+
+
+def _ler_par(par: ParCSV) -> List[NotaFiscal]:
+    """Executado no processo do pool. Itens sem filtro extra, como no par do parse_any."""
+    itens = par.itens or ""  # "" = sem itens (não procura "*item*.csv" na pasta)
+    if par.chaves > 1:
+        return _parse_csv_lote(par.cabecalho, itens_file=itens, filtrar_zerados=False, progresso=_sem_progresso)
+    return [_parse_csv_any(par.cabecalho, itens_file=itens, filtrar_zerados=False, progresso=_sem_progresso)]
+
+
+def _custo(par: ParCSV) -> int:
+    return compactados.tamanho(par.itens) if par.itens else 0
+
+
+def _pares(fontes) -> List[ParCSV]:
+    if isinstance(fontes, (list, tuple)) and fontes and all(isinstance(p, ParCSV) for p in fontes):
+        return list(fontes)
+    return descobrir_pares(fontes)
+
+
+def ingerir_pares(
+    fontes: Union[str, Iterable[str], Sequence[ParCSV]],
+    workers: Optional[int] = None,
+    em_voo: Optional[int] = None,
+) -> Iterator[ResultadoPar]:
+    """
+    Lê os pares em paralelo (um processo por par) e entrega cada ResultadoPar ao terminar.
+
+    Args:
+        fontes: pastas/arquivos (pareados por descobrir_pares) ou lista de ParCSV
+        workers: processos (padrão: INGESTAO_WORKERS, 0 = núcleos da máquina)
+        em_voo: pares submetidos ao mesmo tempo (limita notas prontas não consumidas)
+    """
+    pares = _pares(fontes)
+    # maiores primeiro: o último par a terminar não fica sozinho num núcleo
+    pares.sort(key=_custo, reverse=True)
+
+    n = workers if workers is not None else INGESTAO_WORKERS
+    n = max(1, min(n or os.cpu_count() or 1, len(pares) or 1))
+    if n == 1:
+        for par in pares:
+            inicio = time.time()
+            try:
+                yield ResultadoPar(par, _ler_par(par), segundos=time.time() - inicio)
+            except Exception as e:
+                yield ResultadoPar(par, erro=f"{type(e).__name__}: {e}", segundos=time.time() - inicio)
+        return
+
+    print(f"⚙️  Ingestão em {n} processos: {len(pares):,} pares")
+    limite = em_voo or 2 * n
+    pendentes = iter(pares)
+    with ProcessPoolExecutor(max_workers=n) as pool:
+        futuros = {}
+
+        def _submeter() -> None:
+            for par in pendentes:
+                futuros[pool.submit(_ler_par, par)] = (par, time.time())
+                if len(futuros) >= limite:
+                    return
+
+        _submeter()
+        while futuros:
+            prontos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+            for fut in prontos:
+                par, inicio = futuros.pop(fut)
+                erro = fut.exception()
+                if erro is not None:
+                    yield ResultadoPar(par, erro=f"{type(erro).__name__}: {erro}", segundos=time.time() - inicio)
+                else:
+                    yield ResultadoPar(par, fut.result(), segundos=time.time() - inicio)
+            _submeter()
+
+
+def ingerir_notas(
+    fontes: Union[str, Iterable[str], Sequence[ParCSV]],
+    workers: Optional[int] = None,
+    ao_concluir: Optional[Callable[[ResultadoPar, int, int], None]] = None,
+) -> List[NotaFiscal]:
+    """Todas as notas dos pares (ordem de término); ao_concluir(resultado, feitos, total) a cada par."""
+    pares = _pares(fontes)
+    notas: List[NotaFiscal] = []
+    erros = 0
+    for feitos, r in enumerate(ingerir_pares(pares, workers=workers), start=1):
+        if r.erro:
+            erros += 1
+            print(f"❌ {compactados.nome(r.par.cabecalho)}: {r.erro}")
+        notas.extend(r.notas)
+        if ao_concluir:
+            ao_concluir(r, feitos, len(pares))
+    print(f"✅ Ingestão em lote: {len(notas):,} notas de {len(pares):,} pares"
+          + (f" | {erros} com erro" if erros else ""))
+    return notas
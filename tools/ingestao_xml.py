@@ -0,0 +1,243 @@
+# validador_fiscal/tools/ingestao_xml.py
+"""
+INGESTÃO EM MASSA de NF-e XML (dezenas de milhares de XMLs avulsos por mês)
+- Entrada: pastas, zips de XMLs e/ou arquivos (XML com várias NFe também vale)
+- XMLs lidos em blocos num pool de processos (iterparse, memória constante por arquivo)
+- Cada bloco devolve os cabeçalhos das notas + UMA ItemTable com a chave por item
+  (produto + imposto declarado de cada det, extraídos direto em colunas);
+  os blocos viram uma única tabela colunar de itens para o cálculo vetorizado (uma vez só)
+- Notas repetidas (mesma chave em dois arquivos) entram uma vez só
+- Com o índice de validados: documentos iguais (mesmo conteúdo) no lote são lidos uma
+  vez, e os já validados com a mesma matriz nem são abertos pelo parser
+"""
+from __future__ import annotations
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from ..core import compactados
+from ..core.item_table import ItemTable
+from ..core.xml_stream import ColunasDet
+from .indice_validados import IndiceValidados, hash_documento
+from .nf_parse_tool import Item, NotaFiscal, iter_xml
+
+# 0 = um processo por núcleo
+INGESTAO_XML_WORKERS = int(os.getenv("INGESTAO_XML_WORKERS", "0"))
+# XMLs por tarefa do pool (amortiza o envio dos resultados entre processos)
+XMLS_POR_BLOCO = int(os.getenv("INGESTAO_XMLS_POR_BLOCO", "256"))
+
+@dataclass
+class BlocoXML:
+    """Resultado de um bloco de XMLs: notas (sem itens) + itens de todas numa tabela."""
+    notas: List[NotaFiscal] = field(default_factory=list)
+    itens: Optional[ItemTable] = None
+    origens: List[str] = field(default_factory=list)  # XML de cada nota
+    erros: List[Tuple[str, str]] = field(default_factory=list)  # (arquivo, erro)
+    arquivos: int = 0
+    segundos: float = 0.0
+    ordem: int = 0  # posição do bloco na listagem (repetidas: vale a primeira)
+
+
+@dataclass
+class LoteXML:
+    notas: List[NotaFiscal]
+    itens: ItemTable  # coluna "chave" liga cada item à sua nota
+    erros: List[Tuple[str, str]] = field(default_factory=list)
+    arquivos: int = 0
+    segundos: float = 0.0
+    # índice de validados: resultados guardados (documentos já vistos) + hash do XML de cada nota lida
+    reaproveitados: List[Dict[str, Any]] = field(default_factory=list)
+    hash_por_chave: Dict[str, str] = field(default_factory=dict)
+
+
+def listar_xmls(fontes: Union[str, Iterable[str]]) -> List[str]:
+    """Referências de todos os XMLs (pastas percorridas, zips abertos em membros)."""
+    if isinstance(fontes, str):
+        fontes = [fontes]
+    arquivos: List[str] = []
+    for f in fontes:
+        if f and os.path.isdir(f):
+            for raiz, subpastas, nomes in os.walk(f):
+                subpastas.sort()
+                arquivos.extend(os.path.join(raiz, n) for n in sorted(nomes)
+                                if n.lower().endswith((".xml", ".zip") + compactados.EXT_GZ + compactados.EXT_ZST))
+        elif f:
+            arquivos.append(f)
+    return compactados.expandir(arquivos, (".xml",))
+
+
+def _ler_bloco(refs: List[str], ordem: int = 0) -> BlocoXML:
+    """Executado no processo do pool: XMLs → cabeçalhos + colunas dos itens."""
+    inicio = time.time()
+    bloco = BlocoXML(arquivos=len(refs), ordem=ordem)
+    colunas = ColunasDet()
+    chaves: List[Optional[str]] = []  # por nota fechada no acumulador (None = repetida)
+    vistas: Set[str] = set()
+    for ref in refs:
+        try:
+            for k, nf in enumerate(iter_xml(ref, colunas=colunas)):
+                # sem protNFe nem Id no infNFe: chave sintética pelo arquivo
+                nf.chave = nf.chave or f"{compactados.nome(ref)}#{k}"
+                if nf.chave in vistas:
+                    chaves.append(None)
+                    continue
+                vistas.add(nf.chave)
+                chaves.append(nf.chave)
+                bloco.notas.append(nf)
+                bloco.origens.append(ref)
+        except Exception as e:
+            colunas.descartar_aberta()
+            bloco.erros.append((ref, f"{type(e).__name__}: {e}"))
+    df = colunas.frame()
+    df["chave"] = np.asarray(chaves, dtype=object)[colunas.nota_por_linha()]
+    bloco.itens = ItemTable(df[df["chave"].notna()].reset_index(drop=True), item_factory=Item)
+    bloco.segundos = time.time() - inicio
+    return bloco
+
+
+def _blocos(refs: List[str], tamanho: int) -> List[List[str]]:
+    return [refs[i:i + tamanho] for i in range(0, len(refs), tamanho)]
+
+
+def ler_blocos(
+    refs: List[str],
+    workers: Optional[int] = None,
+    por_bloco: Optional[int] = None,
+) -> Iterable[BlocoXML]:
+    """BlocoXML de cada bloco de XMLs, na ordem em que os processos terminam."""
+    n = workers if workers is not None else INGESTAO_XML_WORKERS
+    n = max(1, n or os.cpu_count() or 1)
+    # blocos menores quando há poucos XMLs, para todos os processos trabalharem
+    tamanho = max(1, min(por_bloco or XMLS_POR_BLOCO, -(-len(refs) // n)))
+    blocos = _blocos(refs, tamanho)
+    if n == 1 or len(blocos) == 1:
+        for i, b in enumerate(blocos):
+            yield _ler_bloco(b, i)
+        return
+
+    print(f"⚙️  Ingestão XML em {n} processos: {len(refs):,} XMLs em {len(blocos):,} blocos")
+    pendentes = enumerate(blocos)
+    with ProcessPoolExecutor(max_workers=n) as pool:
+        futuros = set()
+
+        def _submeter() -> None:
+            for i, b in pendentes:
+                futuros.add(pool.submit(_ler_bloco, b, i))
+                if len(futuros) >= 2 * n:
+                    return
+
+        _submeter()
+        while futuros:
+            prontos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+            for fut in prontos:
+                futuros.discard(fut)
+                yield fut.result()
+            _submeter()
+
+
+def _separar_validados(
+    refs: List[str], indice: IndiceValidados, versao: str,
+) -> Tuple[List[str], Dict[str, str], List[Dict[str, Any]], int]:
+    """(XMLs a ler, hash de cada um, resultados guardados, documentos repetidos no lote)."""
+    a_ler: List[str] = []
+    hashes: Dict[str, str] = {}
+    guardados: List[Dict[str, Any]] = []
+    vistos: Set[str] = set()
+    repetidos = 0
+    for ref in refs:
+        try:
+            h = hash_documento(ref)
+        except Exception:
+            a_ler.append(ref)  # o erro de leitura aparece no parse
+            continue
+        if h in vistos:
+            repetidos += 1
+            continue
+        vistos.add(h)
+        resultados = indice.procurar(h, versao)
+        if resultados is not None:
+            guardados.extend(resultados)
+            continue
+        hashes[ref] = h
+        a_ler.append(ref)
+    return a_ler, hashes, guardados, repetidos
+
+
+def ingerir_xmls(
+    fontes: Union[str, Iterable[str]],
+    workers: Optional[int] = None,
+    ao_concluir: Optional[Callable[[int, int], None]] = None,
+    indice: Optional[IndiceValidados] = None,
+    versao_matriz: str = "",
+) -> LoteXML:
+    """
+    Todas as NF-e das fontes: notas (sem itens) + uma ItemTable única com a chave por item.
+
+    Args:
+        fontes: pastas, zips de XMLs e/ou arquivos XML
+        workers: processos (padrão: INGESTAO_XML_WORKERS, 0 = núcleos da máquina)
+        ao_concluir: callback(xmls_lidos, total_xmls) a cada bloco
+        indice: índice de validados consultado antes do parse (resultados em lote.reaproveitados)
+        versao_matriz: versão da matriz fiscal do cálculo (indice_validados.versao_matriz)
+    """
+    inicio = time.time()
+    refs = listar_xmls(fontes)
+    print(f"🗂️  {len(refs):,} XMLs encontrados")
+    total_refs = len(refs)
+
+    hashes: Dict[str, str] = {}
+    reaproveitados: List[Dict[str, Any]] = []
+    if indice is not None:
+        t0 = time.time()
+        refs, hashes, reaproveitados, repetidos = _separar_validados(refs, indice, versao_matriz)
+        print(f"🔎 Índice de validados: {total_refs - len(refs) - repetidos:,} XMLs já validados "
+              f"({len(reaproveitados):,} notas) | {repetidos:,} repetidos no lote | "
+              f"{len(refs):,} a ler ({time.time() - t0:.2f}s)")
+
+    blocos: List[BlocoXML] = []
+    lidos = 0
+    for bloco in ler_blocos(refs, workers=workers):
+        blocos.append(bloco)
+        lidos += bloco.arquivos
+        if ao_concluir:
+            ao_concluir(lidos, len(refs))
+
+    # na ordem da listagem (não de término): a mesma nota repetida sempre vem do mesmo arquivo
+    notas: List[NotaFiscal] = []
+    partes: List[ItemTable] = []
+    erros: List[Tuple[str, str]] = []
+    # nota já servida pelo índice (mesma chave em outro XML) não entra de novo
+    vistas: Set[str] = {r.get("chave") for r in reaproveitados}
+    hash_por_chave: Dict[str, str] = {}
+    repetidas = 0
+    for bloco in sorted(blocos, key=lambda b: b.ordem):
+        novas = [nf for nf in bloco.notas if nf.chave not in vistas]
+        if len(novas) < len(bloco.notas):
+            # mesma chave já veio de outro bloco: descarta nota e itens
+            repetidas += len(bloco.notas) - len(novas)
+            manter = np.isin(bloco.itens.coluna("chave").astype(str).to_numpy(),
+                             [nf.chave for nf in novas])
+            bloco.itens = bloco.itens.filtrar(manter)
+        for nf, ref in zip(bloco.notas, bloco.origens):
+            if ref in hashes and nf.chave not in vistas:
+                hash_por_chave[nf.chave] = hashes[ref]
+        vistas.update(nf.chave for nf in novas)
+        notas.extend(novas)
+        partes.append(bloco.itens)
+        erros.extend(bloco.erros)
+
+    itens = ItemTable.concat(partes, item_factory=Item)
+    seg = time.time() - inicio
+    for ref, erro in erros[:20]:
+        print(f"❌ {compactados.nome(ref)}: {erro}")
+    print(f"✅ Ingestão XML: {len(notas):,} notas | {len(itens):,} itens | {seg:.1f}s "
+          f"({len(notas) / max(seg, 1e-9):,.0f} notas/s)"
+          + (f" | {len(reaproveitados):,} do índice" if reaproveitados else "")
+          + (f" | {repetidas:,} repetidas" if repetidas else "")
+          + (f" | {len(erros):,} com erro" if erros else ""))
+    return LoteXML(notas=notas, itens=itens, erros=erros, arquivos=total_refs, segundos=seg,
+                   reaproveitados=reaproveitados, hash_por_chave=hash_por_chave)
@@ -1,12 +1,29 @@
 from __future__ import annotations
-import os, csv
-from typing import Optional, List, Dict, Any
-from dataclasses import dataclass, field
+import os
+import re
+from typing import Optional, List, Dict, Any, Callable, Iterator, Tuple
+from dataclasses import dataclass, field, asdict
 
 import pandas as pd
 from lxml import etree
 import pdfplumber
-from PIL import Image
+
+from ..core.item_table import ItemTable
+from ..core.column_aliases import compilar_plano, CAMPOS_ITEM, CAMPOS_TEXTO
+from ..core.csv_sniff import detectar_csv
+from ..core.qualidade_itens import contar_qualidade, ie_notacao_cientifica, nao_contribuinte, perfil_qualidade
+from ..core import compactados
+from ..core.campos_texto import Campo, ScannerCampos, primeiros_digitos
+from ..core.danfe_itens import itens_danfe
+from ..core.ocr import ocr_adaptativo
+from ..core.pdf_paginas import iter_paginas
+from ..core.xml_stream import NS as NS_NFE, ColunasDet, chave_da_nfe, eventos_nfe, extrair_det, texto as xml_texto
+from ..core.utils import to_float, numeros_br, converter_numeros, chave_acesso_valida
+from . import parse_cache
+from .csv_stream import (
+    ler_csv_em_chunks, progresso_console, CHUNK_LINHAS, Progresso,
+    prefetch, linhas_por_orcamento, cabe_na_memoria,
+)
 
 try:
     import pytesseract
@@ -14,6 +31,15 @@ try:
 except Exception:
     _HAS_TESS = False
 
+# Ingestão colunar: itens ficam em ItemTable (arrays) até o motor fiscal.
+# INGESTAO_COLUNAR=0 volta para a lista de objetos Item.
+INGESTAO_COLUNAR = os.getenv("INGESTAO_COLUNAR", "1") != "0"
+
+# Versão das regras de parse: MUDE ao alterar aliases/filtros/conversões,
+# pois ela entra na chave do cache de parse (tools/parse_cache.py).
+PARSER_VERSION = "csv-colunar-5"
+USAR_CACHE_PARSE = os.getenv("PARSE_CACHE", "1") != "0"
+
 @dataclass
 class Declarados:
     icms: float = 0.0
@@ -54,65 +80,142 @@ class NotaFiscal:
     destinatario_uf: Optional[str] = None
     itens: List[Item] = field(default_factory=list)
     declarados: Declarados = field(default_factory=Declarados)
+    qualidade: Optional[Dict[str, Any]] = None  # perfil_qualidade dos itens lidos
 
 def _try_float(x) -> float:
-    try:
-        if x is None or (isinstance(x, float) and pd.isna(x)):
-            return 0.0
-        return float(str(x).replace(",", "."))
-    except Exception:
-        return 0.0
+    # mesmas regras de número BR do core.utils (DB, motor e relatório batem)
+    return to_float(x)
+
+def _try_float_col(s: pd.Series) -> pd.Series:
+    """Versão vetorizada de _try_float para uma coluna inteira."""
+    return numeros_br(s).fillna(0.0)
+
+def _tabela_itens_chunk(d: pd.DataFrame, filtrar_zerados: bool = True,
+                        max_descricao: Optional[int] = 200, com_chave: bool = False):
+    """ItemTable + contadores de validação/qualidade de UM chunk (sem prints).
+    com_chave: mantém a CHAVE DE ACESSO por item (arquivos com várias notas)."""
+    plano = compilar_plano(d.columns)
+    C = plano.coluna
+
+    def txt(col):
+        if not col:
+            return pd.Series("", index=d.index, dtype=object)
+        # célula vazia = "" (astype(str) sozinho daria "nan" e o motor veria subitem preenchido)
+        s = d[col]
+        return s.astype(str).where(s.notna(), "")
+
+    # colunas numéricas convertidas de uma vez (formato BR) + contagem de inválidos
+    cols_num = {campo: C(campo) for campo in ("quantidade", "valor_unitario", "valor_total")}
+    conv = converter_numeros(d, [c for c in cols_num.values() if c])
+
+    def num(col):
+        if not col:
+            return pd.Series(0.0, index=d.index)
+        return conv.valores[col].fillna(0.0)
+
+    valor_total = num(cols_num["valor_total"])
+    mask = (valor_total != 0) if filtrar_zerados else pd.Series(True, index=d.index)
+    itens_valor_zero = int((~mask).sum())
+
+    nao_contrib = nao_contribuinte(d, plano) & mask
+    ist_sci = ie_notacao_cientifica(d, plano) & mask
+
+    descricao = txt(C("descricao"))
+    if max_descricao:
+        descricao = descricao.str.slice(0, max_descricao)
+
+    colunas = {
+        "codigo": txt(C("codigo")),
+        "descricao": descricao,
+        "ncm": txt(C("ncm")),
+        "cfop": txt(C("cfop")),
+        "subitem_lc116": txt(C("subitem_lc116")),
+        "quantidade": num(cols_num["quantidade"]),
+        "valor_unitario": num(cols_num["valor_unitario"]),
+        "valor_total": valor_total,
+        "nao_contrib": nao_contrib,
+    }
+    if com_chave:
+        colunas["chave"] = txt(C("chave")).str.strip()
+    df = pd.DataFrame(colunas)[mask.to_numpy()]
+
+    contadores = {
+        "validos": len(df),
+        "valor_zero": itens_valor_zero,
+        "nao_contrib": int(nao_contrib.sum()),
+        "ist_sci": int(ist_sci.sum()),
+    }
+    for campo, col in cols_num.items():
+        contadores[f"invalidos_{campo}"] = conv.invalidos.get(col, 0) if col else 0
+    contadores.update(contar_qualidade(d, plano, conv.valores, conv.invalidos))
+    return ItemTable(df, item_factory=Item), contadores
+
+def _resumo_validacao_itens(contadores: Dict[str, int], filtrar_zerados: bool = True) -> None:
+    # 📊 SUMÁRIO DE VALIDAÇÕES
+    print(f"\n📊 VALIDAÇÃO FISCAL DOS ITENS:")
+    print(f"   ✅ Itens com valor > 0: {contadores['validos']:,}")
+    if filtrar_zerados:
+        print(f"   ⏭️  Itens com valor = 0 (ignorados): {contadores['valor_zero']:,}")
+    if contadores["nao_contrib"] > 0:
+        print(f"   ⚠️  Itens NÃO CONTRIBUINTE: {contadores['nao_contrib']:,} (ICMS = 0)")
+    if contadores["ist_sci"] > 0:
+        print(f"   ⚠️  Itens com IST em notação científica: {contadores['ist_sci']:,}")
+    for k, v in contadores.items():
+        if k.startswith("invalidos_") and v > 0:
+            print(f"   ⚠️  Valores não numéricos em {k[len('invalidos_'):]}: {v:,} (tratados como 0)")
+        elif k.startswith("negativos_") and v > 0:
+            print(f"   ⚠️  Valores negativos em {k[len('negativos_'):]}: {v:,}")
+    for k, rotulo in (("ncm_invalido", "NCM fora do formato"), ("cfop_invalido", "CFOP fora do formato"),
+                      ("total_divergente", "Quantidade × unitário ≠ total")):
+        if contadores.get(k, 0) > 0:
+            print(f"   ⚠️  {rotulo}: {contadores[k]:,}")
+    print(f"✅ {contadores['validos']:,} itens na tabela colunar")
 
 def _sniff_csv(path: str) -> Dict[str, Any]:
-    import chardet
-    with open(path, "rb") as f:
-        raw = f.read(65536)
-    enc = chardet.detect(raw).get("encoding") or "ISO-8859-1"
-    sample = raw.decode(enc, errors="ignore")
-    dialect = csv.Sniffer().sniff(sample.splitlines()[0][:1024] + ",", delimiters=";,|\t,")
-    return {"encoding": enc, "sep": dialect.delimiter}
-
-def _parse_csv_any(nf_csv_file: str) -> NotaFiscal:
-    """
-    OTIMIZADO para arquivos grandes (549 mil linhas)
-    - Leitura em chunks
-    - Memória controlada
-    - Progresso detalhado
-    """
-    
-    print(f"📂 Lendo CSV: {os.path.basename(nf_csv_file)}...")
-    
-    cfg = _sniff_csv(nf_csv_file)
-    
-    # Ler apenas cabeçalho primeiro (1 linha)
-    df_head = pd.read_csv(
-        nf_csv_file, 
-        encoding=cfg["encoding"], 
-        sep=cfg["sep"], 
-        engine="python",
-        nrows=1  # Só primeira linha
-    )
+    """Encoding + separador (BOM/UTF-8/cp1252, amostras em vários offsets, cache por arquivo)."""
+    return detectar_csv(path)
+
+def _ler_csv(path: str, cfg: Dict[str, Any], **kwargs) -> pd.DataFrame:
+    """pd.read_csv de arquivo comum ou membro compactado (stream, sem extrair)."""
+    with compactados.abrir(path) as f:
+        return pd.read_csv(f, encoding=cfg["encoding"], sep=cfg["sep"], engine="python", **kwargs)
+
+def _localizar_itens(nf_csv_file: str) -> Optional[str]:
+    """Procura "*item*.csv" na mesma pasta (ou no mesmo zip) do cabeçalho."""
+    fisico, membro = compactados.separar(nf_csv_file)
+    if membro is not None:
+        cand = [m for m in compactados.listar(fisico) if "item" in compactados.nome(m).lower()]
+        return cand[0] if cand else None
+    base = os.path.dirname(nf_csv_file) or "."
+    cand = [os.path.join(base, p) for p in os.listdir(base) if p.lower().endswith(".csv") and "item" in p.lower()]
+    return cand[0] if cand else None
+
+_CAMPOS_DECLARADOS = ("icms", "st", "difal", "ipi", "pis", "cofins", "iss",
+                      "irpj", "csll", "cbs", "ibs", "is_")
+
+def _nf_da_linha(plano, linha) -> NotaFiscal:
+    """NotaFiscal (cabeçalho + impostos declarados) de UMA linha do CSV de cabeçalho
+    (valores na ordem das colunas do plano)."""
+    def campo(nome):
+        return str(plano.valor(linha, nome)).strip() if plano.tem(nome) else None
 
-    cols = {c.strip().upper(): c for c in df_head.columns}
-    def col(*names):
-        for n in names:
-            if n in cols: return cols[n]
-        return None
+    nf = NotaFiscal(
+        chave=campo("chave"),
+        numero=campo("numero"),
+        serie=campo("serie"),
+        data_emissao=campo("data_emissao"),
+        emitente_cnpj=campo("emitente_cnpj"),
+        destinatario_cnpj=campo("destinatario_cnpj"),
+        emissor_uf=campo("emissor_uf"),
+        destinatario_uf=campo("destinatario_uf"),
+    )
+    for attr in _CAMPOS_DECLARADOS:
+        if plano.tem(attr):
+            setattr(nf.declarados, attr, _try_float(plano.valor(linha, attr)))
+    return nf
 
-    nf = NotaFiscal()
-    
-    # Extrair dados do cabeçalho
-    ch_col = col("CHAVE DE ACESSO", "CHAVE")
-    nf.chave = str(df_head[ch_col].iloc[0]).strip() if ch_col else None
-    nf.numero = str(df_head.get(col("NÚMERO","NUMERO","NR"), [None])[0]).strip() if col("NÚMERO","NUMERO","NR") else None
-    nf.serie  = str(df_head.get(col("SÉRIE","SERIE"), [None])[0]).strip() if col("SÉRIE","SERIE") else None
-    nf.data_emissao = str(df_head.get(col("DATA EMISSÃO","DATA EMISSAO"), [None])[0]).strip() if col("DATA EMISSÃO","DATA EMISSAO") else None
-    nf.emitente_cnpj = str(df_head.get(col("CPF/CNPJ EMITENTE","CNPJ EMITENTE"), [None])[0]).strip() if col("CPF/CNPJ EMITENTE","CNPJ EMITENTE") else None
-    nf.destinatario_cnpj = str(df_head.get(col("CNPJ DESTINATÁRIO","CNPJ DESTINATARIO"), [None])[0]).strip() if col("CNPJ DESTINATÁRIO","CNPJ DESTINATARIO") else None
-    nf.emissor_uf = str(df_head.get(col("UF EMITENTE"), [None])[0]).strip() if col("UF EMITENTE") else None
-    nf.destinatario_uf = str(df_head.get(col("UF DESTINATÁRIO","UF DESTINATARIO"), [None])[0]).strip() if col("UF DESTINATÁRIO","UF DESTINATARIO") else None
-    
-    # 🔍 VALIDAÇÃO FISCAL - CABEÇALHO
+def _validar_cabecalho(nf: NotaFiscal) -> None:
+    """🔍 VALIDAÇÃO FISCAL - CABEÇALHO (só prints)"""
     print(f"🔍 Validando cabeçalho fiscal...")
     validacoes = []
     
@@ -130,9 +233,9 @@ def _parse_csv_any(nf_csv_file: str) -> NotaFiscal:
             validacoes.append(f"📍 Operação intraestadual ({nf.emissor_uf})")
     
     # 3. Impostos declarados > 0
-    decl_icms = _try_float(df_head.get(col("ICMS"), [0])[0]) if col("ICMS") else 0
-    decl_pis = _try_float(df_head.get(col("PIS"), [0])[0]) if col("PIS") else 0
-    decl_cofins = _try_float(df_head.get(col("COFINS"), [0])[0]) if col("COFINS") else 0
+    decl_icms = nf.declarados.icms
+    decl_pis = nf.declarados.pis
+    decl_cofins = nf.declarados.cofins
     
     total_impostos = decl_icms + decl_pis + decl_cofins
     if total_impostos > 0:
@@ -143,289 +246,433 @@ def _parse_csv_any(nf_csv_file: str) -> NotaFiscal:
     for v in validacoes:
         print(f"   {v}")
 
-    # Buscar arquivo de itens
-    base = os.path.dirname(nf_csv_file)
-    cand = [p for p in os.listdir(base) if p.lower().endswith(".csv") and "item" in p.lower()]
+def _nf_para_cache(nf: NotaFiscal) -> Dict[str, Any]:
+    cab = {k: v for k, v in nf.__dict__.items() if k not in ("itens", "declarados")}
+    cab["declarados"] = asdict(nf.declarados)
+    return cab
+
+def _nf_do_cache(cab: Dict[str, Any], itens: pd.DataFrame) -> NotaFiscal:
+    campos = dict(cab)
+    declarados = Declarados(**(campos.pop("declarados", None) or {}))
+    nf = NotaFiscal(declarados=declarados, itens=ItemTable(itens, item_factory=Item))
+    for k, v in campos.items():
+        setattr(nf, k, v)
+    return nf
+
+def _parse_csv_any(nf_csv_file: str, itens_file: Optional[str] = None,
+                   filtrar_zerados: bool = True, colunar: Optional[bool] = None,
+                   progresso: Optional[Progresso] = None) -> NotaFiscal:
+    """
+    OTIMIZADO para arquivos grandes (549 mil linhas)
+    - Leitura em chunks
+    - Memória controlada
+    - Progresso detalhado
+    - Modo colunar: itens em ItemTable (sem 1 objeto por linha)
+
+    Args:
+        nf_csv_file: CSV de cabeçalho
+        itens_file: CSV de itens (se None, procura "*item*.csv" na mesma pasta)
+        filtrar_zerados: ignora itens com valor total 0
+        colunar: força o modo de ingestão (padrão: INGESTAO_COLUNAR)
+        progresso: callback(bytes_lidos, bytes_total, linhas) da leitura dos itens
+    """
+    if colunar is None:
+        colunar = INGESTAO_COLUNAR
+    if itens_file is None:
+        itens_file = _localizar_itens(nf_csv_file)
+
+    # ⚡ Re-upload do mesmo par de arquivos: pula o parse inteiro
+    chave_cache = None
+    if colunar and USAR_CACHE_PARSE:
+        chave_cache = parse_cache.chave_para(
+            [nf_csv_file, itens_file], PARSER_VERSION, f"filtrar_zerados={filtrar_zerados}"
+        )
+        hit = parse_cache.carregar(chave_cache)
+        if hit is not None:
+            nf = _nf_do_cache(*hit)
+            print(f"⚡ Cache de parse: {len(nf.itens):,} itens (sem reler o CSV)")
+            return nf
+    
+    print(f"📂 Lendo CSV: {compactados.nome(nf_csv_file)}...")
+    
+    cfg = _sniff_csv(nf_csv_file)
+    
+    # Ler apenas cabeçalho primeiro (1 linha)
+    df_head = _ler_csv(nf_csv_file, cfg, nrows=1)  # Só primeira linha
+
+    # Extrair dados do cabeçalho + impostos declarados
+    plano = compilar_plano(df_head.columns)
+    nf = _nf_da_linha(plano, next(df_head.itertuples(index=False, name=None)))
     
+    _validar_cabecalho(nf)
+
+    # Arquivo de itens
     itens_df = None
-    if cand:
-        p2 = os.path.join(base, cand[0])
-        print(f"📦 Lendo itens: {os.path.basename(p2)}...")
+    itens_tab = None
+    contadores: Dict[str, int] = {}
+    if itens_file:
+        p2 = itens_file
+        print(f"📦 Lendo itens: {compactados.nome(p2)}...")
         
         cfg2 = _sniff_csv(p2)
+
+        # Só as colunas que os itens usam (plano de aliases compilado 1x)
+        cab_itens = _ler_csv(p2, cfg2, nrows=0).columns
+        plano_itens = compilar_plano(cab_itens)
+        usecols = plano_itens.usecols(CAMPOS_ITEM) or None
         
-        # OTIMIZAÇÃO: Ler em chunks de 50 mil linhas
-        chunk_size = 50000
-        chunks = []
-        
-        total_linhas = sum(1 for _ in open(p2, encoding=cfg2["encoding"])) - 1  # -1 para header
-        print(f"📊 Total de itens: {total_linhas:,}")
-        
-        if total_linhas > chunk_size:
-            # Arquivo GRANDE - ler em chunks
-            print(f"⚡ Processando em chunks de {chunk_size:,} linhas...")
-            
-            for idx, chunk in enumerate(pd.read_csv(
-                p2, 
-                encoding=cfg2["encoding"], 
-                sep=cfg2["sep"], 
-                engine="python",
-                chunksize=chunk_size
-            ), 1):
+        # STREAMING: uma única leitura, progresso por offset em bytes.
+        # Cada chunk vira colunas compactas e é descartado em seguida.
+        partes, chunks = [], []
+        contadores.update({"validos": 0, "valor_zero": 0, "nao_contrib": 0, "ist_sci": 0})
+        for chunk in ler_csv_em_chunks(
+            p2,
+            encoding=cfg2["encoding"],
+            sep=cfg2["sep"],
+            chunk_size=CHUNK_LINHAS,
+            progresso=progresso or progresso_console,
+            usecols=usecols,
+            texto=plano_itens.usecols(CAMPOS_TEXTO),
+        ):
+            if colunar:
+                parte, cont = _tabela_itens_chunk(chunk, filtrar_zerados)
+                partes.append(parte)
+                for k, v in cont.items():
+                    contadores[k] = contadores.get(k, 0) + v
+            else:
                 chunks.append(chunk)
-                processados = min(idx * chunk_size, total_linhas)
-                pct = (processados / total_linhas * 100)
-                print(f"   Chunk {idx}: {processados:,}/{total_linhas:,} ({pct:.0f}%)")
-            
-            # Concatenar todos os chunks
-            itens_df = pd.concat(chunks, ignore_index=True)
-            print(f"✅ {len(itens_df):,} itens carregados")
+            del chunk
+
+        if colunar:
+            itens_tab = ItemTable.concat(partes, item_factory=Item)
+            del partes
+            _resumo_validacao_itens(contadores, filtrar_zerados)
         else:
-            # Arquivo pequeno - ler direto
-            itens_df = pd.read_csv(p2, encoding=cfg2["encoding"], sep=cfg2["sep"], engine="python")
+            itens_df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+            del chunks
             print(f"✅ {len(itens_df):,} itens carregados")
 
     def build_items(d):
-        """Constrói lista de itens - OTIMIZADO (sem iterrows!) + VALIDAÇÃO FISCAL"""
-        c = {c.strip().upper(): c for c in d.columns}
-        def C(*names):
-            for n in names:
-                if n in c: return c[n]
-            return None
-        
-        total = len(d)
-        print(f"🔨 Construindo {total:,} objetos Item...")
-        
-        # 🔍 VALIDAÇÃO FISCAL - Detectar padrões
-        regime_col = C("REGIME", "DESCRIÇÃO REGIME", "CONS", "DESTINO")
-        ist_col = C("INSCRIÇÃO ESTADUAL", "IST", "IE")
-        
-        itens_nao_contrib = 0
-        itens_com_ist_sci = 0
-        itens_valor_zero = 0
-        itens_validos = 0
-        
-        # ⚡ VETORIZADO: Usar .values para evitar iterrows()
-        items = []
-        for idx, row_vals in enumerate(d.values, 1):
-            row = dict(zip(d.columns, row_vals))
-            
-            valor_total = _try_float(row.get(C("VALOR TOTAL","VPROD"), 0))
-            
-            # Validação 1: Valor > 0
-            if valor_total == 0:
-                itens_valor_zero += 1
-                continue
-            
-            # Validação 2: Detectar regime não contribuinte
-            regime = str(row.get(regime_col, "")).upper() if regime_col else ""
-            if "NÃO CON" in regime or "NÃOCON" in regime:
-                itens_nao_contrib += 1
-            
-            # Validação 3: IST em notação científica
-            ist = str(row.get(ist_col, "")) if ist_col else ""
-            if "E+" in ist or "E-" in ist:
-                itens_com_ist_sci += 1
-            
-            itens_validos += 1
-            
-            items.append(Item(
-                codigo=str(row.get(C("NÚMERO PRODUTO","CODIGO","CÓDIGO","COD"), "")),
-                descricao=str(row.get(C("DESCRIÇÃO DO PRODUTO/SERVIÇO","DESCRICAO"), ""))[:200],
-                ncm=str(row.get(C("CÓDIGO NCM/SH","NCM","NCM/SH (TIPO DE PRODUTO)"), "")),
-                cfop=str(row.get(C("CFOP"), "")),
-                quantidade=_try_float(row.get(C("QUANTIDADE","QTD","QCOM"), 0)),
-                valor_unitario=_try_float(row.get(C("VALOR UNITÁRIO","VUNCOM"), 0)),
-                valor_total=valor_total,
-            ))
-            
-            # Mostrar progresso a cada 10%
-            if idx % max(1, total // 10) == 0:
-                pct = (idx / total * 100)
-                print(f"   Progresso: {idx:,}/{total:,} ({pct:.0f}%)")
-        
-        # 📊 SUMÁRIO DE VALIDAÇÕES
-        print(f"\n📊 VALIDAÇÃO FISCAL DOS ITENS:")
-        print(f"   ✅ Itens com valor > 0: {itens_validos:,}")
-        print(f"   ⏭️  Itens com valor = 0 (ignorados): {itens_valor_zero:,}")
-        if itens_nao_contrib > 0:
-            print(f"   ⚠️  Itens NÃO CONTRIBUINTE: {itens_nao_contrib:,} (ICMS = 0)")
-        if itens_com_ist_sci > 0:
-            print(f"   ⚠️  Itens com IST em notação científica: {itens_com_ist_sci:,}")
-        print(f"✅ {len(items):,} itens construídos")
-        
-        return items
-
-    if itens_df is not None:
+        """Itens + VALIDAÇÃO FISCAL vetorizada (colunas inteiras, sem loop por linha)"""
+        if colunar:
+            print(f"🔨 Montando tabela colunar com {len(d):,} itens...")
+        else:
+            print(f"🔨 Construindo {len(d):,} objetos Item...")
+        tabela, cont = _tabela_itens_chunk(d, filtrar_zerados)
+        contadores.update(cont)
+        _resumo_validacao_itens(contadores, filtrar_zerados)
+        return tabela if colunar else list(tabela)
+
+    if itens_tab is not None:
+        nf.itens = itens_tab
+    elif itens_df is not None:
         nf.itens = build_items(itens_df)
     else:
         # Tentar ler itens do mesmo CSV (cabeçalho)
-        if {"NÚMERO PRODUTO","DESCRIÇÃO DO PRODUTO/SERVIÇO"}.issubset(set(cols)):
+        if plano.tem("codigo") and plano.tem("descricao"):
             nf.itens = build_items(df_head)
 
-    # Ler impostos declarados
-    d = Declarados()
-    for label, attr in [
-        ("ICMS","icms"), ("ST","st"), ("DIFAL","difal"), ("IPI","ipi"),
-        ("PIS","pis"), ("COFINS","cofins"), ("ISS","iss"),
-        ("IRPJ","irpj"), ("CSLL","csll"),
-        ("CBS","cbs"), ("IBS","ibs"), ("IS","is_")
-    ]:
-        c = col(label)
-        if c:
-            setattr(d, attr, _try_float(df_head[c].iloc[0]))
-    nf.declarados = d
-    
+    if contadores.get("linhas"):
+        nf.qualidade = perfil_qualidade(contadores)
+
     print(f"✅ NotaFiscal construída: {len(nf.itens):,} itens")
+
+    if chave_cache and isinstance(nf.itens, ItemTable):
+        parse_cache.salvar(chave_cache, _nf_para_cache(nf), nf.itens.frame())
     
     return nf
 
-def _parse_xml(xml_file: str) -> NotaFiscal:
-    """Lê XML COMPLETO com todos os itens"""
-    ns = {"nfe": "http://www.portalfiscal.inf.br/nfe"}
-    tree = etree.parse(xml_file)
-    root = tree.getroot()
-    
-    def gx(xpath, base=root):
-        try:
-            el = base.find(xpath, namespaces=ns)
-            return el.text if el is not None else None
-        except:
-            return None
-    
-    # Cabeçalho
-    nf = NotaFiscal(
-        chave=gx(".//nfe:chNFe"),
-        numero=gx(".//nfe:ide/nfe:nNF"),
-        serie=gx(".//nfe:ide/nfe:serie"),
-        data_emissao=gx(".//nfe:ide/nfe:dhEmi"),
-        emitente_cnpj=gx(".//nfe:emit/nfe:CNPJ"),
-        emitente_nome=gx(".//nfe:emit/nfe:xNome"),
-        destinatario_cnpj=gx(".//nfe:dest/nfe:CNPJ"),
-        destinatario_cpf=gx(".//nfe:dest/nfe:CPF"),
-        destinatario_nome=gx(".//nfe:dest/nfe:xNome"),
-        emissor_uf=gx(".//nfe:emit/nfe:enderEmit/nfe:UF"),
-        destinatario_uf=gx(".//nfe:dest/nfe:enderDest/nfe:UF"),
+def _parse_csv_streaming(nf_csv_file: str, itens_file: Optional[str] = None,
+                         filtrar_zerados: bool = True,
+                         memoria_mb: Optional[float] = None,
+                         progresso: Optional[Progresso] = None,
+                         inicio: int = 0,
+                         fim: Optional[int] = None,
+                         ) -> Tuple[NotaFiscal, Iterator[Tuple[ItemTable, Dict[str, int]]]]:
+    """
+    OUT-OF-CORE: cabeçalho + gerador de (ItemTable, contadores) por chunk de itens
+    - Chunk dimensionado pelo orçamento de memória (PIPELINE_MEMORIA_MB)
+    - O próximo chunk é lido numa thread enquanto o atual é calculado
+    - Nenhum chunk é guardado: quem consome reduz e descarta
+    - inicio/fim: só os itens nesses bytes do CSV (ingestão incremental)
+    nf.itens fica vazio; os itens só existem nos chunks.
+    """
+    if itens_file is None:
+        itens_file = _localizar_itens(nf_csv_file)
+
+    print(f"📄 Lendo cabeçalho: {compactados.nome(nf_csv_file)}...")
+    cfg = _sniff_csv(nf_csv_file)
+    df_head = _ler_csv(nf_csv_file, cfg, nrows=1)
+    plano = compilar_plano(df_head.columns)
+    nf = _nf_da_linha(plano, next(df_head.itertuples(index=False, name=None)))
+    nf.itens = ItemTable(item_factory=Item)
+    _validar_cabecalho(nf)
+
+    def _partes():
+        if not itens_file:
+            return
+        cfg2 = _sniff_csv(itens_file)
+        cab_itens = _ler_csv(itens_file, cfg2, nrows=0).columns
+        plano_itens = compilar_plano(cab_itens)
+        linhas = linhas_por_orcamento(itens_file, memoria_mb)
+        print(f"📦 Itens em streaming: {compactados.nome(itens_file)} ({linhas:,} linhas/chunk)")
+        leitor = ler_csv_em_chunks(
+            itens_file,
+            encoding=cfg2["encoding"],
+            sep=cfg2["sep"],
+            chunk_size=linhas,
+            progresso=progresso or progresso_console,
+            usecols=plano_itens.usecols(CAMPOS_ITEM) or None,
+            texto=plano_itens.usecols(CAMPOS_TEXTO),
+            inicio=inicio,
+            fim=fim,
+        )
+        for chunk in prefetch(leitor):
+            yield _tabela_itens_chunk(chunk, filtrar_zerados)
+
+    return nf, _partes()
+
+def _parse_csv_lote(nf_csv_file: str, itens_file: Optional[str] = None,
+                    filtrar_zerados: bool = True,
+                    progresso: Optional[Progresso] = None) -> List[NotaFiscal]:
+    """
+    Arquivos com VÁRIAS notas (exportação Receita "NFe_Itens" com milhares de chaves)
+    - Cabeçalho lido inteiro: 1 linha por nota, indexado pela CHAVE DE ACESSO
+    - Itens lidos UMA vez em streaming e separados por chave num único groupby
+    - Retorna uma NotaFiscal por chave (ordem do cabeçalho; chaves só nos itens no fim)
+
+    Args:
+        nf_csv_file: CSV de cabeçalho (uma linha por nota)
+        itens_file: CSV de itens (se None, procura "*item*.csv" na mesma pasta)
+        filtrar_zerados: ignora itens com valor total 0
+        progresso: callback(bytes_lidos, bytes_total, linhas) da leitura dos itens
+    """
+    if itens_file is None:
+        itens_file = _localizar_itens(nf_csv_file)
+
+    print(f"📄 Lendo cabeçalhos (lote): {compactados.nome(nf_csv_file)}...")
+    cfg = _sniff_csv(nf_csv_file)
+    df_cab = _ler_csv(nf_csv_file, cfg, dtype=str)
+    plano_cab = compilar_plano(df_cab.columns)
+
+    notas: Dict[str, NotaFiscal] = {}
+    for linha in df_cab.itertuples(index=False, name=None):
+        nf = _nf_da_linha(plano_cab, linha)
+        if nf.chave and nf.chave not in notas:
+            notas[nf.chave] = nf
+    print(f"   {len(notas):,} notas no cabeçalho")
+
+    grupos: Dict[str, ItemTable] = {}
+    perfil = None
+    if itens_file:
+        print(f"📦 Lendo itens (lote): {compactados.nome(itens_file)}...")
+        cfg2 = _sniff_csv(itens_file)
+        cab_itens = _ler_csv(itens_file, cfg2, nrows=0).columns
+        plano_itens = compilar_plano(cab_itens)
+        col_chave = plano_itens.coluna("chave")
+        if not col_chave:
+            raise ValueError("CSV de itens sem coluna CHAVE DE ACESSO: não é possível separar as notas")
+
+        partes = []
+        contadores: Dict[str, int] = {}
+        for chunk in ler_csv_em_chunks(
+            itens_file,
+            encoding=cfg2["encoding"],
+            sep=cfg2["sep"],
+            chunk_size=CHUNK_LINHAS,
+            progresso=progresso or progresso_console,
+            usecols=plano_itens.usecols(CAMPOS_ITEM),
+            texto=plano_itens.usecols(CAMPOS_TEXTO),
+        ):
+            parte, cont = _tabela_itens_chunk(chunk, filtrar_zerados, com_chave=True)
+            partes.append(parte)
+            for k, v in cont.items():
+                contadores[k] = contadores.get(k, 0) + v
+            del chunk
+        tabela = ItemTable.concat(partes, item_factory=Item)
+        del partes
+        _resumo_validacao_itens(contadores, filtrar_zerados)
+        grupos = tabela.agrupar("chave")
+        # perfil do arquivo inteiro, compartilhado pelas notas do lote
+        perfil = perfil_qualidade(contadores)
+
+    sem_cabecalho = [k for k in grupos if k not in notas]
+    if sem_cabecalho:
+        print(f"   ⚠️  {len(sem_cabecalho):,} chaves só no arquivo de itens (cabeçalho vazio)")
+        for k in sem_cabecalho:
+            notas[k] = NotaFiscal(chave=k)
+
+    vazia = ItemTable(item_factory=Item)
+    for chave, nf in notas.items():
+        nf.itens = grupos.get(chave, vazia)
+        nf.qualidade = perfil
+
+    print(f"✅ Lote: {len(notas):,} notas | {sum(len(n.itens) for n in notas.values()):,} itens")
+    return list(notas.values())
+
+def _item_xml(det) -> Optional[Item]:
+    v = extrair_det(det)
+    if v is None:
+        return None
+    codigo, descricao, ncm, cfop, quantidade, valor_unitario, valor_total = v[:7]
+    return Item(
+        codigo=codigo,
+        descricao=descricao,
+        ncm=ncm,
+        cfop=cfop,
+        quantidade=_try_float(quantidade),
+        valor_unitario=_try_float(valor_unitario),
+        valor_total=_try_float(valor_total),
     )
 
+def _fechar_nf_xml(nf: NotaFiscal, icms_tot, v_nf: Optional[str], soma_itens: Optional[float] = None) -> NotaFiscal:
     # Formatar CPF se vier sem pontuação
     if nf.destinatario_cpf and len(nf.destinatario_cpf) == 11:
         cpf = nf.destinatario_cpf
         nf.destinatario_cpf = f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
-    
-    # Extrair ITENS
-    itens = []
-    for det in root.findall(".//nfe:det", namespaces=ns):
-        prod = det.find("nfe:prod", namespaces=ns)
-        if prod is None:
-            continue
-        
-        itens.append(Item(
-            codigo=gx("nfe:cProd", prod) or "",
-            descricao=gx("nfe:xProd", prod) or "",
-            ncm=gx("nfe:NCM", prod) or "",
-            cfop=gx("nfe:CFOP", prod) or "",
-            quantidade=_try_float(gx("nfe:qCom", prod)),
-            valor_unitario=_try_float(gx("nfe:vUnCom", prod)),
-            valor_total=_try_float(gx("nfe:vProd", prod)),
-        ))
-    
-    nf.itens = itens
-
-    # Pegar valor total da nota COM desconto
-    total_nf_xml = gx(".//nfe:ICMSTot/nfe:vNF", root)
-    nf.total_produtos = float(total_nf_xml) if total_nf_xml else sum(item.valor_total for item in itens)
-    
-    print(f"   💰 Valor Total NF: R$ {nf.total_produtos:,.2f}")
-    
+    # Valor total da nota COM desconto
+    if v_nf:
+        nf.total_produtos = float(v_nf)
+    else:
+        nf.total_produtos = soma_itens if soma_itens is not None else sum(item.valor_total for item in nf.itens)
     # Impostos declarados (totais da nota)
-    icms_tot = root.find(".//nfe:ICMSTot", namespaces=ns)
     if icms_tot is not None:
-        icms_val = _try_float(gx("nfe:vICMS", icms_tot))
-        print(f"   📋 ICMS Declarado extraído do XML: R$ {icms_val:,.2f}")
-        
         nf.declarados = Declarados(
-            icms=icms_val,
-            st=_try_float(gx("nfe:vST", icms_tot)),
-            ipi=_try_float(gx("nfe:vIPI", icms_tot)),
-            pis=_try_float(gx("nfe:vPIS", icms_tot)),
-            cofins=_try_float(gx("nfe:vCOFINS", icms_tot)),
+            icms=_try_float(icms_tot.get("vICMS")),
+            st=_try_float(icms_tot.get("vST")),
+            ipi=_try_float(icms_tot.get("vIPI")),
+            pis=_try_float(icms_tot.get("vPIS")),
+            cofins=_try_float(icms_tot.get("vCOFINS")),
         )
-    
-    print(f"✅ XML: {len(itens)} itens extraídos")
-    print(f"   Declarados: ICMS={nf.declarados.icms}, PIS={nf.declarados.pis}")
     return nf
 
-def _parse_pdf(pdf_file: str) -> NotaFiscal:
-    """Extrai dados completos do PDF"""
-    import re
-    
-    try:
-        import pdfplumber
-    except:
-        print("⚠️ pdfplumber não instalado!")
-        return NotaFiscal()
-    
-    text = ""
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            text += (page.extract_text() or "") + "\n"
-    
-    print(f"📄 PDF extraído: {len(text)} caracteres")
-    print(f"🔍 PRIMEIROS 2000 CARACTERES DO PDF:")
-    print("=" * 80)
-    print(text[:2000])
-    print("=" * 80)
-    
-    nf = NotaFiscal()
-    
-    # === CHAVE (44 dígitos seguidos) ===
-    apenas_numeros = ''.join(c for c in text if c.isdigit())
-    chave_match = re.search(r'(\d{44})', apenas_numeros)
-    if chave_match:
-        nf.chave = chave_match.group(1)
-    
-    # === NÚMERO ===
-    num_patterns = [
-        r'N[°º]\.\s*(\d{3}\.\d{3}\.\d{3})',
-        r'NF-?e?\s*\s*N[°º]\.\s*(\d+)',
-        r'N[úuÚU]mero\s*[:\-]?\s*(\d+)',
-    ]
-    for pattern in num_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            nf.numero = match.group(1).replace('.', '')
-            break
-    
-    # === SÉRIE ===
-    serie_match = re.search(r'S[ÉéE]RIE\s+(\d+)', text, re.IGNORECASE)
-    if serie_match:
-        nf.serie = serie_match.group(1)
-    
-    # === DATA ===
-    data_match = re.search(r'(\d{2}[/-]\d{2}[/-]\d{4})', text)
-    if data_match:
-        nf.data_emissao = data_match.group(1)
-    
-    # === EMITENTE ===
-    emitente_patterns = [
-        r'Emitente[:\s]+.*?(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})',
-        r'CNPJ[:\s]*(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})',
-    ]
-    for pattern in emitente_patterns:
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-        if match:
-            nf.emitente_cnpj = match.group(1)
-            break
+def iter_xml(xml_file: str, colunas: Optional[ColunasDet] = None) -> Iterator[NotaFiscal]:
+    """
+    STREAMING: uma NotaFiscal por NFe do arquivo (NF-e avulsa, nfeProc, enviNFe/lotes).
+    Cada det vira Item assim que é lido e sai da árvore; só os itens da nota atual ficam em memória.
+    colunas: acumulador colunar (produto + imposto declarado por item): os itens vão para
+             ele, uma nota por fechar_nota() na ordem de entrega, e nf.itens fica vazio.
+    """
+    nf: Optional[NotaFiscal] = None
+    pendente: Optional[NotaFiscal] = None  # NFe completa esperando o protNFe (chave)
+    icms_tot = v_nf = None
+
+    def _entregar(nota: NotaFiscal) -> NotaFiscal:
+        if colunas is not None:
+            colunas.fechar_nota()
+        return nota
+
+    for evento, el in eventos_nfe(xml_file):
+        if nf is None and evento in ("ide", "emit", "dest", "det", "total"):
+            if pendente is not None:
+                yield _entregar(pendente)
+                pendente = None
+            nf = NotaFiscal()
+            icms_tot = v_nf = None
+
+        if evento == "det":
+            if colunas is not None:
+                colunas.adicionar(el)
+            else:
+                item = _item_xml(el)
+                if item is not None:
+                    nf.itens.append(item)
+        elif evento == "ide":
+            nf.numero = xml_texto(el, "nfe:nNF")
+            nf.serie = xml_texto(el, "nfe:serie")
+            nf.data_emissao = xml_texto(el, "nfe:dhEmi")
+        elif evento == "emit":
+            nf.emitente_cnpj = xml_texto(el, "nfe:CNPJ")
+            nf.emitente_nome = xml_texto(el, "nfe:xNome")
+            nf.emissor_uf = xml_texto(el, "nfe:enderEmit/nfe:UF")
+        elif evento == "dest":
+            nf.destinatario_cnpj = xml_texto(el, "nfe:CNPJ")
+            nf.destinatario_cpf = xml_texto(el, "nfe:CPF")
+            nf.destinatario_nome = xml_texto(el, "nfe:xNome")
+            nf.destinatario_uf = xml_texto(el, "nfe:enderDest/nfe:UF")
+        elif evento == "total":
+            tot = el.find("nfe:ICMSTot", namespaces=NS_NFE)
+            if tot is not None:
+                icms_tot = {etree.QName(c).localname: c.text for c in tot}
+                v_nf = icms_tot.get("vNF")
+        elif evento == "nfe" and nf is not None:
+            nf.chave = chave_da_nfe(el)
+            soma = colunas.soma_aberta("valor_total") if colunas is not None and not v_nf else None
+            pendente = _fechar_nf_xml(nf, icms_tot, v_nf, soma_itens=soma)
+            nf = None
+        elif evento == "prot" and pendente is not None:
+            pendente.chave = xml_texto(el, ".//nfe:chNFe") or pendente.chave
+            yield _entregar(pendente)
+            pendente = None
+
+    if pendente is not None:
+        yield _entregar(pendente)
+    if colunas is not None:
+        colunas.descartar_aberta()  # NFe sem fim no arquivo
 
+def _parse_xml(xml_file: str) -> NotaFiscal:
+    """Lê XML COMPLETO com todos os itens.
+    Só a PRIMEIRA NFe: o arquivo não é lido além dela (lotes enviNFe: iter_xml / ingestao_xml)."""
+    colunas = ColunasDet()
+    notas = iter_xml(xml_file, colunas=colunas)
+    nf = next(notas, None)
+    notas.close()
+    if nf is None:
+        raise ValueError(f"Nenhuma NFe encontrada em {compactados.nome(xml_file)}")
+    # itens em colunas, com o imposto declarado de cada det (divergência por item)
+    nf.itens = ItemTable(colunas.frame().iloc[:colunas.por_nota[0]].reset_index(drop=True), item_factory=Item)
+
+    print(f"   💰 Valor Total NF: R$ {nf.total_produtos:,.2f}")
+    if nf.declarados.icms or nf.declarados.pis:
+        print(f"   📋 ICMS Declarado extraído do XML: R$ {nf.declarados.icms:,.2f}")
+    print(f"✅ XML: {len(nf.itens)} itens extraídos")
+    print(f"   Declarados: ICMS={nf.declarados.icms}, PIS={nf.declarados.pis}")
+    return nf
+
+# Campos do DANFE em PDF: padrões compilados uma vez, em ordem de prioridade (core/campos_texto)
+_SCANNER_PDF = ScannerCampos([
+    Campo("numero", (
+        (r'N[°º]\.\s*(\d{3}\.\d{3}\.\d{3})', re.IGNORECASE),
+        (r'NF-?e?\s*\s*N[°º]\.\s*(\d+)', re.IGNORECASE),
+        (r'N[úuÚU]mero\s*[:\-]?\s*(\d+)', re.IGNORECASE),
+    )),
+    Campo("serie", ((r'S[ÉéE]RIE\s+(\d+)', re.IGNORECASE),)),
+    Campo("data_emissao", ((r'(\d{2}[/-]\d{2}[/-]\d{4})', 0),)),
+    Campo("emitente_cnpj", (
+        (r'Emitente[:\s]+.*?(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', re.IGNORECASE | re.DOTALL),
+        (r'CNPJ[:\s]*(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', re.IGNORECASE),
+    )),
     # Buscar "SJT COMERCIO DE VESTUARIO FEMININO LTDA"
-    nome_emit_match = re.search(
-        r'(?:RECEBEMOS DE|Emitente)\s+([A-ZÀ-Ú\s]+?)\s+(?:OS PRODUTOS|CNPJ)',
-        text,
-        re.IGNORECASE
-    )
-    if nome_emit_match:
-        nf.emitente_nome = nome_emit_match.group(1).strip()
+    Campo("emitente_nome", (
+        (r'(?:RECEBEMOS DE|Emitente)\s+([A-ZÀ-Ú\s]+?)\s+(?:OS PRODUTOS|CNPJ)', re.IGNORECASE),
+    )),
+    # primeiro CPF é do emitente, segundo do destinatário
+    Campo("cpfs", ((r'(\d{3}\.\d{3}\.\d{3}-\d{2})', 0),), ocorrencias=2),
+    Campo("destinatario_nome", ((r'NOME/RAZÃO SOCIAL.*?\n\s*([A-ZÀ-Ú\s]+?)\s+\d{3}\.\d{3}\.\d{3}', 0),)),
+    Campo("linha_valor_total", ((r'VALOR\s+TOTAL\s+DA\s+NOTA.*\n.*', re.IGNORECASE),)),
+    Campo("icms_declarado", (
+        (r'BASE DE CÁLCULO DO ICMS\s+VALOR DO ICMS.*?\n\s*[\d,\.]+\s+([\d,\.]+)', re.IGNORECASE),
+    )),
+])
+_VALOR_BR = re.compile(r'[\d\.]+,[\d]{2}')
+
+def _cabecalho_pdf(text: str, nf: NotaFiscal, parcial: bool = False) -> NotaFiscal:
+    """
+    Campos de cabeçalho do texto do PDF; só preenche os que ainda estão vazios.
+    parcial: texto só das primeiras páginas (o destinatário exige os dois CPFs nele).
+    """
+    # === CHAVE (44 primeiros dígitos do documento) ===
+    if not nf.chave:
+        nf.chave = primeiros_digitos(text, 44)
+
+    vazios = [c for c in ("numero", "serie", "data_emissao", "emitente_cnpj", "emitente_nome", "destinatario_nome")
+              if not getattr(nf, c)]
+    achados = _SCANNER_PDF.varrer(text, so=vazios + ([] if nf.destinatario_cnpj else ["cpfs"]))
+    for campo in vazios:
+        if campo in achados:
+            setattr(nf, campo, achados[campo].valor)
+    if nf.numero and "numero" in achados:
+        nf.numero = nf.numero.replace('.', '')
     
     # Fallback: pegar linha antes do CNPJ do emitente
     if not nf.emitente_nome and nf.emitente_cnpj:
@@ -438,30 +685,61 @@ def _parse_pdf(pdf_file: str) -> NotaFiscal:
                     break
     
     # === DESTINATÁRIO (CPF ou CNPJ) ===
-    # Buscar TODOS os CPFs do documento
-    cpfs_formatados = re.findall(r'(\d{3}\.\d{3}\.\d{3}-\d{2})', text)
-    
-    # Pegar o SEGUNDO CPF (primeiro é emitente, segundo é destinatário)
+    cpfs_formatados = achados["cpfs"].valores if "cpfs" in achados else []
     if len(cpfs_formatados) >= 2:
         nf.destinatario_cnpj = cpfs_formatados[1]
         print(f"   ✅ CPF Destinatário: {cpfs_formatados[1]}")
-    elif len(cpfs_formatados) == 1:
+    elif len(cpfs_formatados) == 1 and not parcial:
         nf.destinatario_cnpj = cpfs_formatados[0]
+    return nf
 
-    # === NOME DESTINATÁRIO ===
-    nome_match = re.search(r'NOME/RAZÃO SOCIAL.*?\n\s*([A-ZÀ-Ú\s]+?)\s+\d{3}\.\d{3}\.\d{3}', text)
-    if nome_match:
-        nf.destinatario_nome = nome_match.group(1).strip()
+def _parse_pdf(pdf_file: str, ao_cabecalho: Optional[Callable[[NotaFiscal], None]] = None) -> NotaFiscal:
+    """
+    Extrai dados completos do PDF (páginas em paralelo e em cache, ver pdf_paginas).
+    O cabeçalho sai da 1ª página assim que ela fica pronta (ao_cabecalho(nf) é chamado
+    na hora), enquanto as páginas de itens ainda estão sendo extraídas.
+    Itens: tabela do quadro de produtos (danfe_itens); sem quadro, um item com o valor total.
+    """
+    try:
+        import pdfplumber
+    except:
+        print("⚠️ pdfplumber não instalado!")
+        return NotaFiscal()
+    
+    nf = NotaFiscal()
+    paginas: List[str] = []
+    for n, texto_pagina in iter_paginas(pdf_file):
+        paginas.append(texto_pagina)
+        if n == 0:
+            _cabecalho_pdf(texto_pagina, nf, parcial=True)
+            print(f"   🧾 Cabeçalho (página 1): chave={nf.chave or 'N/A'} | número={nf.numero or 'N/A'}")
+            if ao_cabecalho:
+                ao_cabecalho(nf)
+    text = "".join(f"{t}\n" for t in paginas)
+    
+    # === ITENS: quadro "DADOS DOS PRODUTOS / SERVIÇOS" (só as páginas que têm o quadro) ===
+    itens = itens_danfe(pdf_file, paginas, item_factory=Item)
+    if itens:
+        nf.itens = itens
+    del paginas
+    
+    print(f"📄 PDF extraído: {len(text)} caracteres")
+    print(f"🔍 PRIMEIROS 2000 CARACTERES DO PDF:")
+    print("=" * 80)
+    print(text[:2000])
+    print("=" * 80)
+    
+    # o que não estava na 1ª página vem do documento inteiro
+    _cabecalho_pdf(text, nf)
     
     # === VALOR TOTAL - BUSCA DIRETA NA TABELA ===
     print("\n🔍 PROCURANDO VALOR TOTAL...")
+    achados = _SCANNER_PDF.varrer(text, so=("linha_valor_total", "icms_declarado"))
     
     valor_total = 0
-    linha_valor = re.search(r'VALOR\s+TOTAL\s+DA\s+NOTA.*\n.*', text, re.IGNORECASE)
-    
-    if linha_valor:
+    if "linha_valor_total" in achados:
         # Pegar TODOS os valores da próxima linha
-        valores_linha = re.findall(r'[\d\.]+,[\d]{2}', linha_valor.group(0))
+        valores_linha = _VALOR_BR.findall(achados["linha_valor_total"].valor)
         print(f"   📋 Valores encontrados: {valores_linha}")
         
         if valores_linha:
@@ -471,13 +749,8 @@ def _parse_pdf(pdf_file: str) -> NotaFiscal:
             print(f"✅ Valor total: R$ {valor_total:,.2f}")
 
     # === IMPOSTOS DECLARADOS ===
-    linha_impostos = re.search(
-        r'BASE DE CÁLCULO DO ICMS\s+VALOR DO ICMS.*?\n\s*([\d,\.]+)\s+([\d,\.]+)',
-        text,
-        re.IGNORECASE
-    )
-    if linha_impostos:
-        valor_icms = _try_float(linha_impostos.group(2).replace('.', '').replace(',', '.'))
+    if "icms_declarado" in achados:
+        valor_icms = _try_float(achados["icms_declarado"].valor.replace('.', '').replace(',', '.'))
         nf.declarados = Declarados(icms=valor_icms)
         print(f"   📋 ICMS Declarado: R$ {valor_icms:,.2f}")
 
@@ -499,62 +772,65 @@ def _parse_pdf(pdf_file: str) -> NotaFiscal:
     
     return nf
 
+# Campos da imagem: ausente ou com confiança baixa leva ao passe seguinte (core/ocr.ocr_adaptativo)
+_SCANNER_IMAGEM_OCR = ScannerCampos([
+    Campo(
+        "chave",
+        (
+            (r'(\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4})', 0),
+            (r'\b(\d{44})\b', 0),
+        ),
+        validar=chave_acesso_valida, digitos=44, rotulo=r'CHAVE\s+DE\s+ACESSO',
+    ),
+    Campo("numero", (
+        (r'N[úu]mero\s*[:\-]?\s*(\d+)', re.IGNORECASE),
+        (r'N[°º]\s*(\d+)', re.IGNORECASE),
+    )),
+    Campo("valor_total", (
+        (r'Valor\s+Total\s*[:\-]?\s*R?\$?\s*([\d\.,]+)', re.IGNORECASE),
+        (r'V\.\s*TOTAL\s*[:\-]?\s*R?\$?\s*([\d\.,]+)', re.IGNORECASE),
+    )),
+    Campo("serie", ((r'S[ée]rie\s*[:\-]?\s*(\d+)', re.IGNORECASE),)),
+    Campo("data_emissao", ((r'(\d{2}[/-]\d{2}[/-]\d{4})', 0),)),
+    # emitente e destinatário; sem CNPJ formatado, 14 dígitos soltos
+    Campo("cnpjs", ((r'(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', 0), (r'\b(\d{14})\b', 0)), ocorrencias=2),
+    # impostos declarados entram no relatório de divergências
+    Campo("icms", ((r'ICMS\s*[:\-]?\s*R?\$?\s*([\d\.,]+)', re.IGNORECASE),)),
+    Campo("pis", ((r'PIS\s*[:\-]?\s*R?\$?\s*([\d\.,]+)', re.IGNORECASE),)),
+    Campo("cofins", ((r'COFINS\s*[:\-]?\s*R?\$?\s*([\d\.,]+)', re.IGNORECASE),)),
+])
+
 def _parse_image(img_file: str) -> NotaFiscal:
     """OCR completo para extrair dados da imagem"""
-    import re
-    
     if not _HAS_TESS:
         print("⚠️ pytesseract não instalado!")
         return NotaFiscal()
     
     try:
-        img = Image.open(img_file).convert('L')  # Grayscale
-        text = pytesseract.image_to_string(img, lang='por')
+        # passe rápido primeiro; só campos sem leitura confiável vão para passes mais caros
+        leitura = ocr_adaptativo(img_file, _SCANNER_IMAGEM_OCR)
     except Exception as e:
         print(f"⚠️ Erro OCR: {e}")
         return NotaFiscal()
+    text = leitura.texto
     
-    print(f"🖼️ OCR extraído: {len(text)} caracteres")
+    print(f"🖼️ OCR extraído: {len(text)} caracteres | passes: {', '.join(leitura.passes)}")
+    print("   Confiança: " + ", ".join(f"{k}={v:.0f}" for k, v in leitura.confianca.items()))
     
     nf = NotaFiscal()
     
-    # === CHAVE ===
-    chave_patterns = [
-        r'(\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4}\s+\d{4})',
-        r'\b(\d{44})\b'
-    ]
-    for pattern in chave_patterns:
-        match = re.search(pattern, text)
-        if match:
-            nf.chave = match.group(1).replace(' ', '')
-            break
-    
-    # === NÚMERO ===
-    num_patterns = [
-        r'N[úu]mero\s*[:\-]?\s*(\d+)',
-        r'N[°º]\s*(\d+)',
-    ]
-    for pattern in num_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            nf.numero = match.group(1)
-            break
-    
-    # === SÉRIE ===
-    serie_match = re.search(r'S[ée]rie\s*[:\-]?\s*(\d+)', text, re.IGNORECASE)
-    if serie_match:
-        nf.serie = serie_match.group(1)
+    # === CHAVE / NÚMERO ===
+    nf.chave = leitura.campos.get("chave")
+    nf.numero = leitura.campos.get("numero")
     
-    # === DATA ===
-    data_match = re.search(r'(\d{2}[/-]\d{2}[/-]\d{4})', text)
-    if data_match:
-        nf.data_emissao = data_match.group(1)
+    # === SÉRIE / DATA ===
+    if "serie" in leitura.campos:
+        nf.serie = leitura.campos["serie"]
+    if "data_emissao" in leitura.campos:
+        nf.data_emissao = leitura.campos["data_emissao"]
     
     # === CNPJs ===
-    cnpjs = re.findall(r'(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', text)
-    if not cnpjs:
-        cnpjs = re.findall(r'\b(\d{14})\b', text)
-    
+    cnpjs = leitura.valores.get("cnpjs", [])
     if len(cnpjs) >= 2:
         nf.emitente_cnpj = cnpjs[0]
         nf.destinatario_cnpj = cnpjs[1]
@@ -562,44 +838,24 @@ def _parse_image(img_file: str) -> NotaFiscal:
         nf.emitente_cnpj = cnpjs[0]
     
     # === EXTRAIR ITEM COM VALOR ===
-    valor_patterns = [
-        r'Valor\s+Total\s*[:\-]?\s*R?\$?\s*([\d\.,]+)',
-        r'VALOR\s+TOTAL\s*[:\-]?\s*R?\$?\s*([\d\.,]+)',
-        r'V\.\s*TOTAL\s*[:\-]?\s*R?\$?\s*([\d\.,]+)',
-    ]
-    
-    for pattern in valor_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            valor_str = match.group(1).replace('.', '').replace(',', '.')
-            valor_total = _try_float(valor_str)
-            
-            if valor_total > 0:
-                nf.itens = [Item(
-                    codigo="1",
-                    descricao="Produto/Serviço extraído via OCR",
-                    ncm="",
-                    cfop="5102",
-                    quantidade=1.0,
-                    valor_unitario=valor_total,
-                    valor_total=valor_total
-                )]
-                break
+    valor_total = _try_float(leitura.campos.get("valor_total", "").replace('.', '').replace(',', '.'))
+    if valor_total > 0:
+        nf.itens = [Item(
+            codigo="1",
+            descricao="Produto/Serviço extraído via OCR",
+            ncm="",
+            cfop="5102",
+            quantidade=1.0,
+            valor_unitario=valor_total,
+            valor_total=valor_total
+        )]
     
     # === IMPOSTOS DECLARADOS (se houver) ===
-    impostos = {}
-    impostos_regex = {
-        'icms': r'ICMS\s*[:\-]?\s*R?\$?\s*([\d\.,]+)',
-        'pis': r'PIS\s*[:\-]?\s*R?\$?\s*([\d\.,]+)',
-        'cofins': r'COFINS\s*[:\-]?\s*R?\$?\s*([\d\.,]+)',
+    impostos = {
+        imp: _try_float(leitura.campos[imp].replace('.', '').replace(',', '.'))
+        for imp in ('icms', 'pis', 'cofins') if imp in leitura.campos
     }
     
-    for imp, regex in impostos_regex.items():
-        match = re.search(regex, text, re.IGNORECASE)
-        if match:
-            valor_str = match.group(1).replace('.', '').replace(',', '.')
-            impostos[imp] = _try_float(valor_str)
-    
     if impostos:
         nf.declarados = Declarados(**impostos)
     
@@ -607,68 +863,100 @@ def _parse_image(img_file: str) -> NotaFiscal:
     
     return nf
 
-def parse_any(nf_csv_file=None, xml_file=None, pdf_file=None, image_file=None):
+def _separar_cab_itens(arquivos):
+    """(cabeçalho, itens) de uma lista de CSVs, pelo nome do arquivo."""
+    cab = None
+    itm = None
+    # zip/gz/zst entram pelos seus membros .csv (lidos em stream, sem extrair)
+    for f in compactados.expandir(arquivos):
+        name = compactados.nome(f).lower()
+        if "item" in name or "itens" in name:
+            itm = f
+        else:
+            cab = f
+    return cab, itm
+
+def parse_csv_lote(nf_csv_file, progresso=None) -> List[NotaFiscal]:
+    """
+    Leitura de CSVs com VÁRIAS notas: uma NotaFiscal por CHAVE DE ACESSO.
+    nf_csv_file: CSV de cabeçalho ou lista [cabeçalho, itens].
+    """
+    cab, itm = _par_csv(nf_csv_file)
+    if not cab:
+        raise FileNotFoundError("Lote precisa do CSV de cabeçalho (uma linha por nota).")
+    return _parse_csv_lote(cab, itens_file=itm, filtrar_zerados=False, progresso=progresso)
+
+def _par_csv(nf_csv_file):
+    """(cabeçalho, itens) de um CSV ou lista de CSVs."""
+    if isinstance(nf_csv_file, list):
+        return _separar_cab_itens(nf_csv_file)
+    if isinstance(nf_csv_file, str) and compactados.tipo(nf_csv_file):
+        return _separar_cab_itens([nf_csv_file])
+    if isinstance(nf_csv_file, str) and os.path.exists(nf_csv_file):
+        return nf_csv_file, _localizar_itens(nf_csv_file)
+    return None, None
+
+def precisa_out_of_core(nf_csv_file, memoria_mb: Optional[float] = None) -> bool:
+    """True se o CSV de itens não cabe no orçamento de memória (→ pipeline chunk a chunk)."""
+    cab, itm = _par_csv(nf_csv_file)
+    return bool(cab and itm) and not cabe_na_memoria(itm, memoria_mb)
+
+def parse_csv_streaming(nf_csv_file, memoria_mb: Optional[float] = None, progresso=None):
+    """
+    Leitura OUT-OF-CORE de cabeçalho + itens: (NotaFiscal sem itens, gerador de chunks).
+    nf_csv_file: CSV de cabeçalho ou lista [cabeçalho, itens].
+    """
+    cab, itm = _par_csv(nf_csv_file)
+    if not cab:
+        raise FileNotFoundError("Streaming precisa do CSV de cabeçalho.")
+    # mesmo critério do parse_any para o par informado: itens sem filtro extra
+    filtrar = not isinstance(nf_csv_file, list)
+    return _parse_csv_streaming(cab, itens_file=itm, filtrar_zerados=filtrar,
+                                memoria_mb=memoria_mb, progresso=progresso)
+
+def parse_any(nf_csv_file=None, xml_file=None, pdf_file=None, image_file=None, progresso=None):
+    """
+    Leitura unificada de qualquer fonte.
+    progresso: callback(bytes_lidos, bytes_total, linhas) para CSVs grandes.
+    CSV/XML podem vir em zip/gz/zst: os membros são lidos em stream, sem extrair.
+    """
     import os
 
+    # Compactado no lugar do CSV: vira a lista dos seus membros .csv
+    if isinstance(nf_csv_file, str) and compactados.tipo(nf_csv_file):
+        nf_csv_file = [nf_csv_file]
+
     # =========================
     # 1) CSV ÚNICO
     # =========================
     if isinstance(nf_csv_file, str) and os.path.exists(nf_csv_file):
-        return _parse_csv_any(nf_csv_file)
+        return _parse_csv_any(nf_csv_file, progresso=progresso)
 
     # =========================
     # 2) LISTA DE CSV (CAB + ITENS)
     # =========================
     if isinstance(nf_csv_file, list):
-        cab = None
-        itm = None
-
-        for f in nf_csv_file:
-            if not f or not os.path.exists(f):
-                continue
-            name = os.path.basename(f).lower()
-            if "item" in name or "itens" in name:
-                itm = f
-            else:
-                cab = f
+        cab, itm = _separar_cab_itens(nf_csv_file)
 
         if cab and itm:
-            nf = _parse_csv_any(cab)
-
-            cfg = _sniff_csv(itm)
-            df_itm = pd.read_csv(itm, encoding=cfg["encoding"], sep=cfg["sep"], engine="python")
-
-            c = {c.strip().upper(): c for c in df_itm.columns}
-            def C(*names):
-                for n in names:
-                    if n in c: return c[n]
-                return None
-
-            itens = []
-            for _, r in df_itm.iterrows():  # ← USA df_itm DIRETO (sem filtro extra)
-                itens.append(Item(
-                    codigo=str(r.get(C("NÚMERO PRODUTO","CODIGO","CÓDIGO","COD"), "")),
-                    descricao=str(r.get(C("DESCRIÇÃO DO PRODUTO/SERVIÇO","DESCRICAO"), "")),
-                    ncm=str(r.get(C("CÓDIGO NCM/SH","NCM","NCM/SH (TIPO DE PRODUTO)"), "")),
-                    cfop=str(r.get(C("CFOP"), "")),
-                    quantidade=_try_float(r.get(C("QUANTIDADE","QTD","QCOM"), 0)),
-                    valor_unitario=_try_float(r.get(C("VALOR UNITÁRIO","VUNCOM"), 0)),
-                    valor_total=_try_float(r.get(C("VALOR TOTAL","VPROD"), 0)),
-                ))
-
-            nf.itens = itens
-            return nf
+            # Itens lidos UMA vez, direto do arquivo informado (sem filtro extra)
+            return _parse_csv_any(cab, itens_file=itm, filtrar_zerados=False, progresso=progresso)
 
         # Se só um existe
         if cab:
-            return _parse_csv_any(cab)
+            return _parse_csv_any(cab, progresso=progresso)
         if itm:
-            return _parse_csv_any(itm)
+            return _parse_csv_any(itm, progresso=progresso)
 
     # =========================
     # 3) XML
     # =========================
-    if xml_file and os.path.exists(xml_file):
+    if xml_file and compactados.tipo(xml_file):
+        xmls = compactados.expandir([xml_file], (".xml",))
+        if len(xmls) > 1:
+            print(f"⚠️ {len(xmls)} XMLs em {os.path.basename(xml_file)}: lendo só {compactados.nome(xmls[0])}")
+        xml_file = xmls[0] if xmls else None
+    if xml_file and compactados.existe(xml_file):
         return _parse_xml(xml_file)
 
     # =========================
@@ -702,28 +990,4 @@ def parse_csv_pares(cab: str, itm: str):
     Wrapper compatível para caso CSV Cabeçalho + CSV Itens.
     Reaproveita o parse do cabeçalho e substitui itens.
     """
-    nf = _parse_csv_any(cab)
-
-    cfg = _sniff_csv(itm)
-    df_itm = pd.read_csv(itm, encoding=cfg["encoding"], sep=cfg["sep"], engine="python")
-
-    c = {c.strip().upper(): c for c in df_itm.columns}
-    def C(*names):
-        for n in names:
-            if n in c: return c[n]
-        return None
-
-    itens = []
-    for _, r in df_itm.iterrows():
-        itens.append(Item(
-            codigo=str(r.get(C("NÚMERO PRODUTO","CODIGO","CÓDIGO","COD"), "")),
-            descricao=str(r.get(C("DESCRIÇÃO DO PRODUTO/SERVIÇO","DESCRICAO"), "")),
-            ncm=str(r.get(C("CÓDIGO NCM/SH","NCM","NCM/SH (TIPO DE PRODUTO)"), "")),
-            cfop=str(r.get(C("CFOP"), "")),
-            quantidade=_try_float(r.get(C("QUANTIDADE","QTD","QCOM"), 0)),
-            valor_unitario=_try_float(r.get(C("VALOR UNITÁRIO","VUNCOM"), 0)),
-            valor_total=_try_float(r.get(C("VALOR TOTAL","VPROD"), 0)),
-        ))
-
-    nf.itens = itens
-    return nf
\ No newline at end of file
+    return _parse_csv_any(cab, itens_file=itm, filtrar_zerados=False)
@@ -0,0 +1,139 @@
+# validador_fiscal/tools/parse_cache.py
+"""
+Cache de parse por CONTEÚDO (re-uploads do mesmo CSV)
+- Chave = hash do conteúdo dos arquivos + versão do parser + opções
+- Itens normalizados em formato binário colunar (Feather/Arrow; pickle se pyarrow faltar)
+- Campos do cabeçalho em JSON ao lado
+- Despejo LRU limitado por tamanho total em disco
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import pandas as pd
+
+from ..core.compactados import separar
+
+try:
+    import pyarrow.feather as _feather
+    _HAS_ARROW = True
+except Exception:
+    _feather = None
+    _HAS_ARROW = False
+
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "data/cache/parse")
+PARSE_CACHE_MAX_MB = float(os.getenv("PARSE_CACHE_MAX_MB", "2048"))
+
+_BLOCO = 4 * 1024 * 1024
+_EXT = ".feather" if _HAS_ARROW else ".pkl"
+
+
+def chave_para(paths: Iterable[Optional[str]], *partes: str) -> str:
+    """Hash do conteúdo dos arquivos (na ordem dada) + partes extras (versão/opções)."""
+    h = hashlib.blake2b(digest_size=20)
+    for p in paths:
+        h.update(b"\x00arquivo\x00")
+        if not p:
+            continue
+        # membro de zip/gz/zst: bytes COMPACTADOS do arquivo + nome do membro (sem descompactar)
+        fisico, membro = separar(p)
+        with open(fisico, "rb") as f:
+            while True:
+                bloco = f.read(_BLOCO)
+                if not bloco:
+                    break
+                h.update(bloco)
+        if membro:
+            h.update(b"\x00membro\x00" + membro.encode("utf-8"))
+    for parte in partes:
+        h.update(b"\x00" + str(parte).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _paths(chave: str) -> Tuple[str, str]:
+    base = os.path.join(PARSE_CACHE_DIR, chave)
+    return base + _EXT, base + ".json"
+
+
+def carregar(chave: str) -> Optional[Tuple[Dict[str, Any], pd.DataFrame]]:
+    """Retorna (cabeçalho, itens) ou None. Um acerto renova a posição no LRU."""
+    p_itens, p_cab = _paths(chave)
+    if not (os.path.exists(p_itens) and os.path.exists(p_cab)):
+        return None
+    try:
+        with open(p_cab, "r", encoding="utf-8") as f:
+            cab = json.load(f)
+        df = _feather.read_feather(p_itens) if _HAS_ARROW else pd.read_pickle(p_itens)
+    except Exception as e:
+        print(f"⚠️ Cache de parse corrompido ({chave[:12]}): {e}")
+        _remover(chave)
+        return None
+    agora = time.time()
+    for p in (p_itens, p_cab):
+        try:
+            os.utime(p, (agora, agora))
+        except OSError:
+            pass
+    return cab, df
+
+
+def salvar(chave: str, cabecalho: Dict[str, Any], itens: pd.DataFrame) -> None:
+    """Grava a entrada (escrita atômica) e aplica o limite de tamanho."""
+    os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+    p_itens, p_cab = _paths(chave)
+    tmp_itens, tmp_cab = p_itens + ".tmp", p_cab + ".tmp"
+    try:
+        df = itens.reset_index(drop=True)
+        if _HAS_ARROW:
+            _feather.write_feather(df, tmp_itens, compression="lz4")
+        else:
+            df.to_pickle(tmp_itens)
+        with open(tmp_cab, "w", encoding="utf-8") as f:
+            json.dump(cabecalho, f, ensure_ascii=False)
+        os.replace(tmp_itens, p_itens)
+        os.replace(tmp_cab, p_cab)
+    except Exception as e:
+        print(f"⚠️ Falha ao gravar cache de parse: {e}")
+        for p in (tmp_itens, tmp_cab):
+            if os.path.exists(p):
+                os.remove(p)
+        return
+    _despejar()
+
+
+def _remover(chave: str) -> None:
+    for p in _paths(chave):
+        if os.path.exists(p):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+def _despejar(max_bytes: Optional[float] = None) -> None:
+    """Remove as entradas menos usadas (mtime mais antigo) até caber no limite."""
+    limite = PARSE_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    if not os.path.isdir(PARSE_CACHE_DIR):
+        return
+    entradas: Dict[str, list] = {}
+    for nome in os.listdir(PARSE_CACHE_DIR):
+        if nome.endswith(".tmp"):
+            continue
+        chave, _ = os.path.splitext(nome)
+        p = os.path.join(PARSE_CACHE_DIR, nome)
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        e = entradas.setdefault(chave, [0, 0.0])
+        e[0] += st.st_size
+        e[1] = max(e[1], st.st_mtime)
+    total = sum(e[0] for e in entradas.values())
+    for chave, (tamanho, _) in sorted(entradas.items(), key=lambda kv: kv[1][1]):
+        if total <= limite:
+            break
+        _remover(chave)
+        total -= tamanho
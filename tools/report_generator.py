@@ -28,6 +28,12 @@ def gerar_relatorio_excel(relatorio, output_path=None):
         _criar_divergencias(writer, relatorio)
         # ABA 3: Totais
         _criar_totais(writer, relatorio)
+        # ABA 4: Notas (relatório de carteira)
+        if relatorio.get("notas"):
+            _criar_notas(writer, relatorio)
+        # ABA 5: Qualidade dos dados de itens
+        if relatorio.get("qualidade_itens"):
+            _criar_qualidade(writer, relatorio)
     
     _formatar_excel(output_path)
     
@@ -88,6 +94,36 @@ def _criar_totais(writer, relatorio):
     pd.DataFrame(dados).to_excel(writer, sheet_name='Totais', index=False)
 
 
+def _criar_notas(writer, relatorio):
+    dados = [
+        {
+            "Chave": n.get("chave"),
+            "Número": n.get("numero"),
+            "UF Emit": n.get("emissor_uf"),
+            "UF Dest": n.get("destinatario_uf"),
+            "Itens": n.get("total_itens", 0),
+            "Total Produtos": n.get("total_produtos", 0),
+            "Calculado": n.get("total_calculado", 0),
+            "Declarado": n.get("total_declarado", 0),
+            "Divergência": n.get("divergencia_absoluta", 0),
+            "Risco": n.get("nivel_risco", ""),
+        }
+        for n in relatorio.get("notas", [])
+    ]
+    pd.DataFrame(dados).to_excel(writer, sheet_name='Notas', index=False)
+
+
+def _criar_qualidade(writer, relatorio):
+    perfil = relatorio.get("qualidade_itens", {})
+    dados = []
+    for grupo, rotulo in (("checagens", "Checagem"), ("nulos", "Vazio"),
+                          ("nao_numericos", "Não numérico"), ("negativos", "Negativo")):
+        for nome, v in (perfil.get(grupo) or {}).items():
+            dados.append({"Tipo": rotulo, "Campo": nome, "Qtd": v.get("qtd", 0),
+                          "% Linhas": round(v.get("taxa", 0) * 100, 2)})
+    pd.DataFrame(dados).to_excel(writer, sheet_name='Qualidade', index=False)
+
+
 def _formatar_excel(path):
     wb = load_workbook(path)
     